@@ -1,40 +1,110 @@
-from PyQt5.QtCore import QThread
-from PyQt5.Qsci import QsciAPIs
-from jedi import Script
-from jedi.api import Completion
+from typing import TYPE_CHECKING
+
+from PyQt5.QtCore import QPoint, QThread, Qt, pyqtSignal
+from PyQt5.QtGui import QGuiApplication
+from PyQt5.Qsci import QsciAbstractAPIs, QsciScintilla
+
+from instrumentation import instrumentation
+
+import threading
+
+if TYPE_CHECKING:
+    from jedi import Script
+    from jedi.api import Completion
+
+# virtualenv path -> jedi Environment, shared by every editor
+_environments = {}
+# jedi's caches are not thread safe, every editor has its own completer thread
+_jedi_lock = threading.Lock()
+
+
+def get_environment(env_path):
+    """jedi Environment for a virtualenv path, None for jedi's default"""
+    if env_path is None:
+        return None
+    env = _environments.get(env_path)
+    if env is None:
+        from jedi import create_environment
+        env = create_environment(env_path, safe=False)
+        _environments[env_path] = env
+    return env
+
+
+class CompletionAPIs(QsciAbstractAPIs):
+    """
+    The names of the last jedi completion, for the autocompletion list.
+    jedi has matched the prefix already, so unlike QsciAPIs nothing needs
+    preparing on another thread and new names apply right away.
+    """
+
+    def __init__(self, lexer, editor: QsciScintilla):
+        super(CompletionAPIs, self).__init__(lexer)
+        self.editor = editor
+        self.names: list[str] = []
+
+    def set_names(self, names: list[str]):
+        self.names = sorted(set(names))
+
+    def caret_on_screen(self) -> bool:
+        # QScintilla places the list on the screen under the caret and
+        # crashes when there is none, e.g. a window hanging off the monitor
+        pos = self.editor.SendScintilla(QsciScintilla.SCI_GETCURRENTPOS)
+        x = self.editor.SendScintilla(QsciScintilla.SCI_POINTXFROMPOSITION, 0, pos)
+        y = self.editor.SendScintilla(QsciScintilla.SCI_POINTYFROMPOSITION, 0, pos)
+        return QGuiApplication.screenAt(self.editor.viewport().mapToGlobal(QPoint(x, y))) is not None
+
+    def updateAutoCompletionList(self, context, names):
+        if not self.caret_on_screen():
+            return names
+        prefix = context[-1] if context else ""
+        return names + [name for name in self.names if name.startswith(prefix)]
+
+    def callTips(self, context, commas, style, shifts):
+        return []
+
 
 class AutoCompleter(QThread):
-    def __init__(self, file_path, api):
+    """
+    Runs jedi in the background. The names go to the GUI thread through
+    completed, the api is shared with the editor and only touched there.
+    """
+    # completion names
+    completed = pyqtSignal(list)
+
+    def __init__(self, file_path, api, env_path=None):
         super(AutoCompleter, self).__init__(None)
         
         self.file_path = file_path
-        self.script: Script = None
-        self.api: QsciAPIs = api
-        self.completions: list[Completion] = None
-
-        self.line = 0
-        self.index = 0
-        self.text = ""
+        self.env_path = env_path
+        self.script: "Script" = None
+        self.api: CompletionAPIs = api
+        self.completions: "list[Completion]" = None
 
+        # (line, index, text), set in one go so a running completion never mixes two requests
+        self.request = (0, 0, "")
+        # queued, the thread object lives on the GUI thread so that is where the slot runs
+        self.completed.connect(self.load_autocomplete, Qt.QueuedConnection)
 
     def run(self):
         try:
-            self.script: Script =  Script(self.text, path=self.file_path)
-            self.completions: list[Completion] = self.script.complete(self.line, self.index)
-            self.load_autocomplete(self.completions)
+            with _jedi_lock, instrumentation.span("jedi.complete"):
+                # jedi is imported on the first completion, not at startup
+                from jedi import Script
+                line, index, text = self.request
+                self.script: Script =  Script(
+                    text, path=self.file_path, environment=get_environment(self.env_path)
+                )
+                self.completions: list[Completion] = self.script.complete(line, index)
+                self.completed.emit([completion.name for completion in self.completions])
         except Exception as err:
             print("Autocomplete Error:", err)
         
         self.finished.emit()
 
 
-    def load_autocomplete(self, completions: list[Completion]):
-        self.api.clear()
-        [self.api.add(i.name) for i in completions]
-        self.api.prepare()
+    def load_autocomplete(self, names: list[str]):
+        self.api.set_names(names)
 
     def get_completion(self, line: int, index: int, text: str):
-        self.line = line
-        self.index = index
-        self.text = text
+        self.request = (line, index, text)
         self.start()
\ No newline at end of file
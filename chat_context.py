@@ -0,0 +1,122 @@
+import threading
+
+CHARS_PER_TOKEN = 4
+# role markers and separators the chat template adds around every message
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for your own future reference. Keep file names, "
+    "code identifiers, decisions and open questions, drop pleasantries. Answer with the summary only."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English and code"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def fit_text(text: str, max_tokens: int) -> str:
+    """Cut the middle out of text that is larger than max_tokens, head and tail are kept"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max(max_tokens, 2) * CHARS_PER_TOKEN // 2
+    omitted = text[keep:-keep].count("\n") + 1
+    return f"{text[:keep]}\n[... {omitted} lines omitted ...]\n{text[-keep:]}"
+
+
+def summary_messages(summary: str) -> list[dict]:
+    if not summary:
+        return []
+    return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
+
+
+def fallback_summary(summary: str, messages: list[dict], max_tokens: int) -> str:
+    """Summary without asking the model: the start of every folded message"""
+    lines = [summary] if summary else []
+    for message in messages:
+        first = message["content"].strip().splitlines()[0] if message["content"].strip() else ""
+        lines.append(f"{message['role']}: {first[:200]}")
+    return fit_text("\n".join(lines), max_tokens)
+
+
+class ChatContext:
+    """
+    Chat history fitted to a token budget.
+
+    Messages are only ever removed from the front, in blocks: once the history
+    outgrows the budget the older half is folded into a summary. Between
+    compactions every request starts with the same messages, so a model kept
+    loaded with keep_alive reuses its cache for that prefix and only evaluates
+    the new turn.
+
+    The chat worker changes it while the GUI may read it, hence the lock.
+    """
+
+    def __init__(self, budget=4096, reserve=1024):
+        # budget is the model's context size, reserve is kept free for the reply
+        self.budget = budget
+        self.reserve = reserve
+        # tokens kept free for what one request adds, the workspace code
+        self.extra = 0
+        self.summary = ""
+        self.messages: list[dict] = []
+        self.lock = threading.RLock()
+
+    @property
+    def available(self) -> int:
+        return max(self.budget - self.reserve, 256)
+
+    @property
+    def history_available(self) -> int:
+        """What the history may use, the request additions come on top of it"""
+        return max(self.available - self.extra, 256)
+
+    def add(self, role: str, content: str):
+        # a single huge message (a pasted file) may use at most half the budget
+        with self.lock:
+            self.messages.append({"role": role, "content": fit_text(content, self.history_available // 2)})
+
+    def tokens(self) -> int:
+        return sum(message_tokens(m) for m in self.request_messages())
+
+    def needs_compaction(self) -> bool:
+        return self.tokens() > self.history_available
+
+    def split(self) -> tuple[list[dict], list[dict]]:
+        """(messages to fold into the summary, messages to keep)"""
+        # keep the newest messages that fit into half the budget, the rest of
+        # the budget is room to grow before the next compaction
+        keep_budget = self.history_available // 2
+        with self.lock:
+            messages = list(self.messages)
+        # the newest message is always kept
+        start = len(messages) - 1
+        used = message_tokens(messages[start]) if messages else 0
+        while start > 0:
+            cost = message_tokens(messages[start - 1])
+            if used + cost > keep_budget:
+                break
+            used += cost
+            start -= 1
+        return messages[:start], messages[start:]
+
+    def compacted(self, fold: list[dict], summary: str):
+        """Replace the folded messages with summary, unless the history was cleared meanwhile"""
+        with self.lock:
+            if self.messages[:len(fold)] != fold:
+                return
+            self.messages = self.messages[len(fold):]
+            self.summary = fit_text(summary, self.history_available // 4)
+
+    def request_messages(self) -> list[dict]:
+        with self.lock:
+            return summary_messages(self.summary) + list(self.messages)
+
+    def clear(self):
+        with self.lock:
+            self.summary = ""
+            self.messages = []
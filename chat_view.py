@@ -0,0 +1,415 @@
+from PyQt5.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QSize, QTimer, QVariant,
+)
+from PyQt5.QtGui import (
+    QAbstractTextDocumentLayout, QColor, QFont, QFontMetrics, QKeySequence,
+    QPalette, QPainter, QTextDocument,
+)
+from PyQt5.QtWidgets import QApplication, QListView, QStyle, QStyledItemDelegate, QStyleOptionViewItem
+from PyQt5.Qsci import QsciScintilla
+
+from collections import OrderedDict
+import html
+import itertools
+import math
+import re
+
+from lexer import PyCustomLexer, JsonLexer
+from theme_registry import get_theme_registry
+
+TEXT_COLOR = "#abb2bf"
+# the list itself is #21252b in style.qss
+CODE_BACKGROUND = "#282c34"
+PADDING = 6
+# rendered documents kept, the visible ones plus some scrolling room
+DOCUMENT_CACHE = 200
+
+FENCE = re.compile(r"```([\w+#.-]*)[^\n]*\n(.*?)(?:```|\Z)", re.DOTALL)
+LANGUAGES = {"python": "python", "py": "python", "python3": "python", "json": "json"}
+
+
+class ChatMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, role: str, text: str):
+        self.id = next(ChatMessage._ids)
+        # "user", "assistant" or "error"
+        self.role = role
+        self.text = text
+        # "cached" or "stopped", shown after the role
+        self.marker = ""
+        # bumped on every change, rendered documents of older versions are stale
+        self.version = 0
+        # the answer is still coming in
+        self.streaming = False
+
+
+class CodeHighlighter:
+    """
+    Highlights code with the editor lexers: the code goes into a hidden editor
+    and the style runs the lexer sets are recorded, colors come from the theme.
+    Results are cached by language and code. A block still being streamed is
+    not highlighted, see ChatRenderer.html.
+    """
+
+    def __init__(self):
+        self.editors: dict[str, QsciScintilla] = {}
+        self.cache: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def editor(self, language: str) -> QsciScintilla:
+        if language not in self.editors:
+            editor = QsciScintilla()
+            editor.setUtf8(True)
+            lexer = PyCustomLexer(editor) if language == "python" else JsonLexer(editor)
+            editor.setLexer(lexer)
+            self.editors[language] = editor
+        return self.editors[language]
+
+    def highlight(self, code: str, language: str) -> str:
+        language = LANGUAGES.get(language.lower())
+        if language is None:
+            return html.escape(code)
+        key = (language, code)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        editor = self.editor(language)
+        lexer = editor.lexer()
+        editor.setText(code)
+        lexer.runs = []
+        try:
+            editor.SendScintilla(QsciScintilla.SCI_COLOURISE, 0, -1)
+            runs = lexer.runs
+        finally:
+            lexer.runs = None
+        data = code.encode("utf-8")
+        styled = sum(length for length, _ in runs)
+        if styled < len(data):
+            runs.append((len(data) - styled, lexer.DEFAULT))
+
+        merged = []
+        for length, style in runs:
+            if merged and merged[-1][1] == style:
+                merged[-1][0] += length
+            else:
+                merged.append([length, style])
+
+        parts = []
+        start = 0
+        for length, style in merged:
+            end = start + length
+            text = html.escape(data[start:end].decode("utf-8", "replace"))
+            font = lexer.font(style)
+            css = f"color:{lexer.color(style).name()};"
+            if font.bold():
+                css += "font-weight:bold;"
+            if font.italic():
+                css += "font-style:italic;"
+            parts.append(f'<span style="{css}">{text}</span>')
+            start = end
+
+        result = "".join(parts)
+        self.cache[key] = result
+        while len(self.cache) > 100:
+            self.cache.popitem(last=False)
+        return result
+
+
+def inline_markdown(text: str) -> str:
+    text = html.escape(text, quote=False)
+    text = re.sub(r"`([^`]+)`", rf'<code style="background-color:{CODE_BACKGROUND};">\1</code>', text)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", text)
+    text = re.sub(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])", r"<i>\1</i>", text)
+    return text
+
+
+def prose_html(text: str) -> str:
+    """The markdown chat models use: headings, lists, bold, italic and inline code"""
+    lines = []
+    for line in text.split("\n"):
+        if m := re.match(r"(#{1,6})\s+(.*)", line):
+            size = max(100, 160 - 15 * len(m.group(1)))
+            lines.append(f'<span style="font-size:{size}%; font-weight:bold;">{inline_markdown(m.group(2))}</span>')
+        elif m := re.match(r"(\s*)[-*+]\s+(.*)", line):
+            lines.append("&nbsp;" * (2 + len(m.group(1))) + "• " + inline_markdown(m.group(2)))
+        elif m := re.match(r"(\s*)(\d+[.)])\s+(.*)", line):
+            lines.append("&nbsp;" * (2 + len(m.group(1))) + m.group(2) + " " + inline_markdown(m.group(3)))
+        else:
+            lines.append(inline_markdown(line))
+    return "<br>".join(lines)
+
+
+class ChatRenderer:
+    """Message to QTextDocument, cached by message id and version"""
+
+    def __init__(self, font: QFont):
+        self.font = font
+        self.code_font = QFont("Consolas", font.pointSize() - 1)
+        self.highlighter = CodeHighlighter()
+        self.documents: OrderedDict[int, tuple[int, QTextDocument]] = OrderedDict()
+
+    def html(self, message: ChatMessage) -> str:
+        if message.role == "user":
+            head = '<b style="color:#61afef;">You</b>'
+        elif message.role == "error":
+            head = '<b style="color:#e06c75;">AI</b>'
+        else:
+            head = '<b style="color:#98c379;">AI</b>'
+        if message.marker:
+            head += f' <span style="color:#5c6370;">({message.marker})</span>'
+
+        parts = [head + "<br>"]
+        pos = 0
+        for m in FENCE.finditer(message.text):
+            parts.append(prose_html(message.text[pos:m.start()].strip("\n")))
+            code = m.group(2).rstrip("\n")
+            if message.streaming and not m.group(0).endswith("```"):
+                # still growing, highlighted once the fence closes or the answer ends
+                code = html.escape(code)
+            else:
+                code = self.highlighter.highlight(code, m.group(1))
+            parts.append(
+                f'<table width="100%" cellpadding="4" style="background-color:{CODE_BACKGROUND};">'
+                f'<tr><td><pre style="font-family:{self.code_font.family()};">'
+                f"{code}</pre></td></tr></table>"
+            )
+            pos = m.end()
+        parts.append(prose_html(message.text[pos:].strip("\n")))
+        return f'<div style="color:{TEXT_COLOR};">{"".join(parts)}</div>'
+
+    def document(self, message: ChatMessage, width: int) -> QTextDocument:
+        cached = self.documents.get(message.id)
+        if cached is not None and cached[0] == message.version:
+            self.documents.move_to_end(message.id)
+            doc = cached[1]
+        else:
+            doc = QTextDocument()
+            doc.setDefaultFont(self.font)
+            doc.setDocumentMargin(PADDING)
+            doc.setHtml(self.html(message))
+            self.documents[message.id] = (message.version, doc)
+            while len(self.documents) > DOCUMENT_CACHE:
+                self.documents.popitem(last=False)
+        if doc.textWidth() != width:
+            doc.setTextWidth(width)
+        return doc
+
+    def clear(self):
+        self.documents.clear()
+
+
+class ChatModel(QAbstractListModel):
+    """
+    Messages of the chat transcript. Streamed text is collected and announced
+    to the view at most every 30ms, not once per token.
+    """
+    MessageRole = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super(ChatModel, self).__init__(parent)
+        self.messages: list[ChatMessage] = []
+        self.rows: dict[int, int] = {}
+        self.dirty: set[int] = set()
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(30)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        message = self.messages[index.row()]
+        if role == Qt.DisplayRole:
+            return message.text
+        if role == self.MessageRole:
+            return message
+        return QVariant()
+
+    def message(self, message_id: int) -> ChatMessage:
+        row = self.rows.get(message_id)
+        return None if row is None else self.messages[row]
+
+    def add_message(self, role: str, text: str, streaming=False) -> int:
+        message = ChatMessage(role, text)
+        message.streaming = streaming
+        row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.messages.append(message)
+        self.rows[message.id] = row
+        self.endInsertRows()
+        return message.id
+
+    def changed(self, message: ChatMessage, now=False):
+        message.version += 1
+        self.dirty.add(message.id)
+        if now:
+            self.flush()
+        elif not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def append_text(self, message_id: int, text: str):
+        message = self.message(message_id)
+        if message is not None:
+            message.text += text
+            self.changed(message)
+
+    def set_text(self, message_id: int, text: str, role: str = None):
+        message = self.message(message_id)
+        if message is not None:
+            message.text = text
+            message.role = role or message.role
+            self.changed(message, now=True)
+
+    def finish(self, message_id: int):
+        """The streamed answer is complete, its last code block gets highlighted"""
+        message = self.message(message_id)
+        if message is not None and message.streaming:
+            message.streaming = False
+            self.changed(message, now=True)
+
+    def set_marker(self, message_id: int, marker: str):
+        message = self.message(message_id)
+        if message is not None:
+            message.marker = marker
+            self.changed(message, now=True)
+
+    def flush(self):
+        self.flush_timer.stop()
+        for message_id in self.dirty:
+            row = self.rows.get(message_id)
+            if row is not None:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [Qt.DisplayRole])
+        self.dirty.clear()
+
+    def clear(self):
+        self.beginResetModel()
+        self.messages = []
+        self.rows = {}
+        self.dirty.clear()
+        self.endResetModel()
+
+
+class ChatDelegate(QStyledItemDelegate):
+    """
+    Paints rendered messages. Rows that were never painted get a height
+    estimated from their text length, so laying out hundreds of long messages
+    renders none of them; the real height replaces the estimate once a row
+    is painted.
+    """
+
+    def __init__(self, renderer: ChatRenderer, parent=None):
+        super(ChatDelegate, self).__init__(parent)
+        self.renderer = renderer
+        self.width = 300
+        metrics = QFontMetrics(renderer.font)
+        self.line_height = metrics.lineSpacing()
+        self.char_width = max(1, metrics.averageCharWidth())
+        # message id -> (version, width, height) of painted rows
+        self.heights: dict[int, tuple[int, int, int]] = {}
+        # same for the estimates of rows not painted yet
+        self.estimates: dict[int, tuple[int, int, int]] = {}
+
+    def set_width(self, width: int):
+        self.width = max(width, 50)
+
+    def estimate(self, message: ChatMessage) -> int:
+        known = self.estimates.get(message.id)
+        if known is not None and known[0] == message.version and known[1] == self.width:
+            return known[2]
+        per_line = max(1, (self.width - 2 * PADDING) // self.char_width)
+        lines = 1 + sum(max(1, math.ceil(len(line) / per_line)) for line in message.text.split("\n"))
+        height = lines * self.line_height + 2 * PADDING
+        self.estimates[message.id] = (message.version, self.width, height)
+        return height
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        message: ChatMessage = index.data(ChatModel.MessageRole)
+        known = self.heights.get(message.id)
+        if known is not None and known[0] == message.version and known[1] == self.width:
+            return QSize(self.width, known[2])
+        return QSize(self.width, self.estimate(message))
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        message: ChatMessage = index.data(ChatModel.MessageRole)
+        doc = self.renderer.document(message, self.width)
+        height = math.ceil(doc.size().height())
+
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, QColor("#2c313c"))
+        painter.translate(option.rect.topLeft())
+        painter.setClipRect(0, 0, option.rect.width(), option.rect.height())
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.palette.setColor(QPalette.Text, QColor(TEXT_COLOR))
+        doc.documentLayout().draw(painter, context)
+        painter.restore()
+
+        known = self.heights.get(message.id)
+        self.heights[message.id] = (message.version, self.width, height)
+        if height != option.rect.height() and (known is None or known[2] != height):
+            # the estimate was off, lay the row out again with the real height
+            self.sizeHintChanged.emit(index)
+
+    def clear(self):
+        self.heights.clear()
+        self.estimates.clear()
+        self.renderer.clear()
+
+
+class ChatView(QListView):
+    """Chat transcript, follows new text while scrolled to the bottom"""
+
+    def __init__(self, font: QFont = None, parent=None):
+        super(ChatView, self).__init__(parent)
+        self.chat_model = ChatModel(self)
+        self.renderer = ChatRenderer(font or QFont("FiraCode", 13))
+        self.delegate = ChatDelegate(self.renderer, self)
+        self.setModel(self.chat_model)
+        self.setItemDelegate(self.delegate)
+        self.setVerticalScrollMode(QListView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setWordWrap(True)
+        # rows are laid out in batches, the first screen shows before the rest is measured
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(50)
+        self.setSelectionMode(QListView.SingleSelection)
+
+        self.follow = True
+        self.verticalScrollBar().valueChanged.connect(self.scrolled)
+        self.verticalScrollBar().rangeChanged.connect(self.range_changed)
+        get_theme_registry().theme_changed.connect(self.theme_changed)
+
+    def theme_changed(self):
+        # code colors come from the theme, render everything again
+        self.renderer.highlighter.cache.clear()
+        self.renderer.clear()
+        self.viewport().update()
+
+    def scrolled(self, value: int):
+        self.follow = value >= self.verticalScrollBar().maximum() - 4
+
+    def range_changed(self, minimum: int, maximum: int):
+        if self.follow:
+            self.verticalScrollBar().setValue(maximum)
+
+    def resizeEvent(self, e):
+        width = self.viewport().width()
+        if width != self.delegate.width:
+            self.delegate.set_width(width)
+            self.scheduleDelayedItemsLayout()
+        return super().resizeEvent(e)
+
+    def clear(self):
+        self.chat_model.clear()
+        self.delegate.clear()
+
+    def keyPressEvent(self, e):
+        if e.matches(QKeySequence.Copy) and self.currentIndex().isValid():
+            QApplication.clipboard().setText(self.currentIndex().data(Qt.DisplayRole))
+            return
+        return super().keyPressEvent(e)
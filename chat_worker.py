@@ -0,0 +1,217 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import itertools
+import queue
+import threading
+
+from response_cache import ResponseCache
+from chat_context import ChatContext, SUMMARY_PROMPT, CHARS_PER_TOKEN, fallback_summary, estimate_tokens
+
+
+class ChatRequest:
+    """One question for the chat worker, `text` None only loads the model"""
+    _ids = itertools.count(1)
+
+    def __init__(self, text: str, model: str):
+        self.id = next(ChatRequest._ids)
+        self.text = text
+        self.model = model
+        self.cancelled = threading.Event()
+
+
+class ChatWorker(QThread):
+    """
+    Answers chat requests one at a time in the order they were submitted, on a
+    thread that lives until stop(). The worker owns one ollama.Client, so the
+    HTTP connection to the server is kept open and reused between requests.
+
+    Requests go through `context`: the question is added when its turn comes,
+    so history always reads question, answer, question. Older messages are
+    summarized first when the history outgrows the budget. With an `index` the
+    workspace chunks closest to the question are put in front of it.
+
+    With a `cache` and temperature 0 answers are deterministic, so a request
+    identical to an earlier one is answered from the cache without the model.
+
+    Tokens are emitted as they arrive, the signals are queued to the GUI
+    thread so slots may touch widgets. `host` defaults to OLLAMA_HOST, point it
+    at a mock server in tests.
+    """
+    # request id, text
+    token = pyqtSignal(int, str)
+    # request id, full answer, False when it was stopped
+    response_finished = pyqtSignal(int, str, bool)
+    error = pyqtSignal(int, str)
+    # request id, emitted before response_finished when the answer came from the cache
+    response_cached = pyqtSignal(int)
+
+    def __init__(self, context: ChatContext, host=None, index=None, keep_alive=None,
+                 temperature=None, cache: ResponseCache = None):
+        super(ChatWorker, self).__init__(None)
+        self.context = context
+        self.host = host
+        self.index = index
+        self.keep_alive = keep_alive
+        # same num_ctx on every request, a different one makes Ollama reload the model
+        self.options = {"num_ctx": context.budget}
+        if temperature is not None:
+            self.options["temperature"] = temperature
+        self.cache = cache
+        self.requests = queue.Queue()
+        self.current: ChatRequest = None
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import ollama
+            self._client = ollama.Client(host=self.host)
+        return self._client
+
+    def submit(self, text: str, model: str) -> ChatRequest:
+        request = ChatRequest(text, model)
+        self.requests.put(request)
+        if not self.isRunning():
+            self.start()
+        return request
+
+    def warm_up(self, model: str):
+        """Load the model in the background, so the first answer starts sooner"""
+        self.submit(None, model)
+
+    def stop_generation(self):
+        """Stop the answer being generated, waiting questions still run"""
+        request = self.current
+        if request is not None:
+            request.cancelled.set()
+
+    def cancel_all(self):
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None and request.text is not None:
+                self.response_finished.emit(request.id, "", False)
+        self.stop_generation()
+
+    def is_busy(self) -> bool:
+        return self.current is not None or not self.requests.empty()
+
+    def stop(self):
+        """Cancel everything and end the worker thread, call before the app quits"""
+        self.cancel_all()
+        if self.isRunning():
+            self.requests.put(None)
+            self.wait()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            self.current = request
+            try:
+                if request.text is None:
+                    self.load_model(request)
+                else:
+                    self.answer(request)
+            except Exception as e:
+                if request.text is None:
+                    print("Chat model load error:", e)
+                else:
+                    self.error.emit(request.id, f"Error: {e}")
+            self.current = None
+
+    def load_model(self, request: ChatRequest):
+        # a chat without messages only loads the model
+        self.client.chat(model=request.model, messages=[], keep_alive=self.keep_alive, options=self.options)
+
+    def answer(self, request: ChatRequest):
+        # the workspace code is added on top of the history, both have to fit
+        # next to the reply reserve
+        self.context.extra = self.code_budget() if self.index is not None else 0
+        self.context.add("user", request.text)
+        if self.context.needs_compaction():
+            self.compact(request)
+
+        messages = self.context.request_messages()
+        if self.index is not None:
+            messages = self.with_code_context(messages)
+
+        key = None
+        if self.cache is not None and self.options.get("temperature") == 0:
+            key = self.cache.key(request.model, self.options, messages)
+            answer = self.cache.get(key)
+            if answer is not None:
+                self.token.emit(request.id, answer)
+                self.context.add("assistant", answer)
+                self.response_cached.emit(request.id)
+                self.response_finished.emit(request.id, answer, True)
+                return
+
+        parts = []
+        stream = self.client.chat(model=request.model, messages=messages, stream=True,
+                                  keep_alive=self.keep_alive, options=self.options)
+        for chunk in stream:
+            if request.cancelled.is_set():
+                # closing the stream drops the connection, Ollama stops generating
+                stream.close()
+                break
+            content = chunk["message"]["content"]
+            if content:
+                parts.append(content)
+                self.token.emit(request.id, content)
+
+        answer = "".join(parts)
+        # a stopped answer stays in the history as far as the user saw it
+        if answer:
+            self.context.add("assistant", answer)
+            if key is not None and not request.cancelled.is_set():
+                self.cache.put(key, answer)
+        self.response_finished.emit(request.id, answer, not request.cancelled.is_set())
+
+    def compact(self, request: ChatRequest):
+        fold, _ = self.context.split()
+        if not fold:
+            return
+        transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in fold)
+        if self.context.summary:
+            transcript = f"Earlier summary:\n{self.context.summary}\n\n{transcript}"
+        max_tokens = estimate_tokens(transcript) // 4 + 64
+        try:
+            response = self.client.chat(
+                model=request.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript},
+                ],
+                keep_alive=self.keep_alive,
+                options=self.options,
+            )
+            summary = response["message"]["content"].strip()
+        except Exception as e:
+            print("Chat summary error:", e)
+            summary = ""
+        self.context.compacted(fold, summary or fallback_summary(self.context.summary, fold, max_tokens))
+
+    def code_budget(self) -> int:
+        """Tokens of workspace code added to a question"""
+        return self.context.available // 4
+
+    def with_code_context(self, messages: list[dict]) -> list[dict]:
+        """
+        Prepend the relevant workspace code to the last question. Only this
+        request gets it, the history keeps the plain question so the prefix
+        the model has cached stays the same.
+        """
+        question = messages[-1]["content"]
+        try:
+            code = self.index.search(self.client, question, max_chars=self.code_budget() * CHARS_PER_TOKEN)
+        except Exception as e:
+            print("Code search error:", e)
+            return messages
+        if not code:
+            return messages
+        content = f"Relevant code from the workspace:\n\n{code}\n\nQuestion: {question}"
+        return messages[:-1] + [{"role": "user", "content": content}]
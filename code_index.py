@@ -0,0 +1,278 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from pathlib import Path
+import hashlib
+import os
+import threading
+
+from file_manager import IGNORED_DIRS
+from settings import data_dir, read_json, write_json
+
+CHUNK_LINES = 40
+CHUNK_OVERLAP = 8
+MAX_FILE_SIZE = 512 * 1024
+EMBED_BATCH = 32
+
+
+def file_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def chunk_lines(lines: list[str]):
+    """(first line, last line) windows over a file, overlapping a little so a
+    function cut at a window border is still whole in one of them"""
+    step = CHUNK_LINES - CHUNK_OVERLAP
+    for start in range(0, max(len(lines) - CHUNK_OVERLAP, 1), step):
+        end = min(start + CHUNK_LINES, len(lines))
+        if "".join(lines[start:end]).strip():
+            yield start, end
+
+
+def workspace_files(root: str):
+    for dirpath, dirs, files in os.walk(root):
+        # skip ignored folders and virtualenvs
+        dirs[:] = [
+            d for d in dirs
+            if d not in IGNORED_DIRS and not os.path.exists(os.path.join(dirpath, d, "pyvenv.cfg"))
+        ]
+        for name in files:
+            yield os.path.join(dirpath, name)
+
+
+class CodeIndex:
+    """
+    Embeddings of workspace chunks, stored per workspace in ~/.auditcode/index.
+
+    Vectors are normalized rows of a memory mapped float32 matrix, so cosine
+    similarity against every chunk is one matmul. meta.json maps files to their
+    content hash and rows; rows of changed files are freed and reused.
+    """
+
+    def __init__(self, root: str, model="nomic-embed-text"):
+        self.root = os.path.abspath(root)
+        self.model = model
+        self.dir = data_dir() / "index" / file_hash(self.root.encode())[:16]
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.dir / "meta.json"
+        self.vectors_path = self.dir / "vectors.f32"
+        self.lock = threading.Lock()
+        self.vectors = None
+
+        meta = read_json(self.meta_path, {})
+        if meta.get("model") != model or meta.get("root") != self.root:
+            meta = {}
+        self.dim: int = meta.get("dim", 0)
+        # relative path -> {"hash": ..., "rows": [...]}
+        self.files: dict = meta.get("files", {})
+        # row -> [relative path, first line, last line], None for free rows
+        self.chunks: list = meta.get("chunks", [])
+        if self.dim and self.vectors_path.exists():
+            self.open(len(self.chunks))
+        else:
+            self.dim, self.files, self.chunks = 0, {}, []
+
+    def __len__(self):
+        # called from the chat thread while the indexer changes files
+        with self.lock:
+            return sum(len(f["rows"]) for f in self.files.values())
+
+    def open(self, capacity: int):
+        import numpy as np
+
+        capacity = max(capacity, 1)
+        size = capacity * self.dim * 4
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def ensure_capacity(self, rows: int):
+        if self.vectors is None or rows > self.vectors.shape[0]:
+            if self.vectors is not None:
+                self.vectors.flush()
+            self.vectors = None
+            self.open(max(rows, 2 * len(self.chunks), 256))
+
+    def is_current(self, rel: str, digest: str) -> bool:
+        entry = self.files.get(rel)
+        return entry is not None and entry["hash"] == digest
+
+    def remove(self, rel: str):
+        entry = self.files.pop(rel, None)
+        if entry is None:
+            return
+        for row in entry["rows"]:
+            self.chunks[row] = None
+            self.vectors[row] = 0
+
+    def put(self, rel: str, digest: str, spans: list, embeddings: list):
+        """Store the chunks of one file, reusing free rows first"""
+        import numpy as np
+
+        if not spans:
+            # empty or blank file, remembered by its hash so it is not read again
+            with self.lock:
+                self.remove(rel)
+                self.files[rel] = {"hash": digest, "rows": []}
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if not self.dim:
+            self.dim = vectors.shape[1]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            self.remove(rel)
+            free = [i for i, c in enumerate(self.chunks) if c is None]
+            rows = free[:len(spans)]
+            rows += range(len(self.chunks), len(self.chunks) + len(spans) - len(rows))
+            self.chunks.extend([None] * (max(rows, default=-1) + 1 - len(self.chunks)))
+            self.ensure_capacity(len(self.chunks))
+            for row, (start, end), vector in zip(rows, spans, vectors):
+                self.chunks[row] = [rel, start, end]
+                self.vectors[row] = vector
+            self.files[rel] = {"hash": digest, "rows": list(rows)}
+
+    def save(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            # written after the vectors, so meta never points at rows not on disk
+            write_json(self.meta_path, {
+                "model": self.model,
+                "root": self.root,
+                "dim": self.dim,
+                "files": self.files,
+                "chunks": self.chunks,
+            })
+
+    def query(self, embedding: list, k=4) -> list[tuple[float, str, int, int]]:
+        """Top k (score, relative path, first line, last line) by cosine similarity"""
+        import numpy as np
+
+        with self.lock:
+            if self.vectors is None or not self.chunks:
+                return []
+            q = np.asarray(embedding, dtype=np.float32)
+            if q.shape[0] != self.dim:
+                return []
+            q /= np.linalg.norm(q) or 1
+            scores = self.vectors[:len(self.chunks)] @ q
+            live = np.fromiter((c is not None for c in self.chunks), dtype=bool, count=len(self.chunks))
+            scores[~live] = -np.inf
+            k = min(k, int(live.sum()))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), *self.chunks[i]) for i in top]
+
+    def search(self, client, text: str, k=4, max_chars=4000) -> str:
+        """Best chunks for text, formatted for a prompt. Runs on a worker thread."""
+        if not len(self):
+            return ""
+        embedding = client.embed(model=self.model, input=text)["embeddings"][0]
+        parts = []
+        for score, rel, start, end in self.query(embedding, k):
+            try:
+                with open(os.path.join(self.root, rel), "r", encoding="utf-8") as f:
+                    lines = f.readlines()[start:end]
+            except (OSError, UnicodeDecodeError):
+                continue
+            part = f"{rel}:{start + 1}-{end}\n```\n{''.join(lines)}\n```"
+            if sum(map(len, parts)) + len(part) > max_chars:
+                break
+            parts.append(part)
+        return "\n\n".join(parts)
+
+
+class CodeIndexer(QThread):
+    """
+    Brings the CodeIndex of a workspace up to date in the background. Only
+    files whose content hash changed are embedded again. `paths` limits the
+    run to those files, used for workspace watcher changes.
+    """
+    # files done, files total
+    progress = pyqtSignal(int, int)
+    # number of indexed chunks
+    indexed = pyqtSignal(int)
+
+    def __init__(self, index: CodeIndex, host=None, paths: list = None):
+        super(CodeIndexer, self).__init__(None)
+        self.index = index
+        self.host = host
+        self.paths = paths
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def read_text(self, path: str):
+        """(bytes, lines), None for binary, huge or undecodable files"""
+        try:
+            if os.path.getsize(path) > MAX_FILE_SIZE:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if b"\0" in data[:1024]:
+            return None
+        try:
+            return data, data.decode("utf-8").splitlines(keepends=True)
+        except UnicodeDecodeError:
+            return None
+
+    def index_file(self, client, path: str):
+        rel = os.path.relpath(path, self.index.root)
+        content = self.read_text(path) if os.path.isfile(path) else None
+        if content is None:
+            with self.index.lock:
+                if rel in self.index.files:
+                    self.index.remove(rel)
+            return
+        data, lines = content
+        digest = file_hash(data)
+        if self.index.is_current(rel, digest):
+            return
+        spans = list(chunk_lines(lines))
+        embeddings = []
+        for i in range(0, len(spans), EMBED_BATCH):
+            batch = [f"{rel}\n{''.join(lines[s:e])}" for s, e in spans[i:i + EMBED_BATCH]]
+            embeddings += client.embed(model=self.index.model, input=batch)["embeddings"]
+        self.index.put(rel, digest, spans, embeddings)
+
+    def run(self):
+        import ollama
+
+        client = ollama.Client(host=self.host)
+        if self.paths is None:
+            paths = list(workspace_files(self.index.root))
+            present = {os.path.relpath(p, self.index.root) for p in paths}
+            with self.index.lock:
+                for rel in [r for r in self.index.files if r not in present]:
+                    self.index.remove(rel)
+        else:
+            paths = [p for p in self.paths if Path(p).is_relative_to(self.index.root)]
+
+        try:
+            for done, path in enumerate(paths, 1):
+                if self._stop.is_set():
+                    break
+                try:
+                    self.index_file(client, path)
+                except ConnectionError as e:
+                    # no server, every other file would fail the same way
+                    print("Code index error:", e)
+                    break
+                except Exception as e:
+                    # skip the file, it is tried again on the next run
+                    print("Code index error:", path, e)
+                self.progress.emit(done, len(paths))
+                if done % 100 == 0:
+                    self.index.save()
+        except Exception as e:
+            print("Code index error:", e)
+        finally:
+            self.index.save()
+        self.indexed.emit(len(self.index))
@@ -0,0 +1,698 @@
+from PyQt5.QtCore import QObject, QThread, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QListWidget, QListWidgetItem
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+import ast
+import builtins
+import multiprocessing
+import os
+import threading
+
+from code_index import file_hash, workspace_files
+from instrumentation import instrumentation
+from settings import data_dir, read_json, write_json
+
+# bump when the checks change, results cached by older checks are dropped
+CHECK_VERSION = 1
+MAX_FILE_SIZE = 1024 * 1024
+MAX_CACHE_ENTRIES = 20000
+# files read from disk per round, edited files wait at most one round
+SCAN_BATCH = 64
+PYTHON_SUFFIXES = (".py", ".pyw")
+
+ERROR = "error"
+WARNING = "warning"
+# indicator 1 is the find highlight
+ERROR_INDICATOR = 0
+WARNING_INDICATOR = 2
+ERROR_COLOR = QColor("#e06c75")
+WARNING_COLOR = QColor("#d19a66")
+
+# names every module has without defining them
+IMPLICIT_NAMES = set(dir(builtins)) | {
+    "__file__", "__name__", "__doc__", "__builtins__", "__spec__", "__loader__",
+    "__package__", "__path__", "__cached__", "__annotations__",
+    # class bodies and methods
+    "__module__", "__qualname__", "__class__",
+    # only on Windows
+    "WindowsError",
+}
+
+
+class Problem:
+    """One diagnostic, line is 0 based and columns are byte offsets into the line"""
+
+    def __init__(self, line: int, column: int, end_column: int, severity: str, message: str):
+        self.line = line
+        self.column = column
+        self.end_column = end_column
+        self.severity = severity
+        self.message = message
+
+    def to_list(self) -> list:
+        return [self.line, self.column, self.end_column, self.severity, self.message]
+
+    def __eq__(self, other):
+        return isinstance(other, Problem) and self.to_list() == other.to_list()
+
+    def __repr__(self):
+        return f"Problem({self.line + 1}:{self.column}, {self.severity}, {self.message!r})"
+
+
+def is_python(path) -> bool:
+    return str(path).endswith(PYTHON_SUFFIXES)
+
+
+def byte_column(line: str, column: int) -> int:
+    """Character column to byte column, Scintilla positions are bytes"""
+    return len(line[:column].encode("utf-8"))
+
+
+class Scope:
+    def __init__(self, kind: str, parent: "Scope" = None):
+        # module, function, class or comprehension
+        self.kind = kind
+        self.parent = parent
+        self.bindings: set[str] = set()
+        # name -> node of the import that bound it
+        self.imports: dict[str, ast.AST] = {}
+        self.used: set[str] = set()
+
+
+class NameChecker(ast.NodeVisitor):
+    """
+    Undefined names and unused imports, like pyflakes but more forgiving.
+
+    A name counts as defined when it is bound anywhere in its scope or an
+    enclosing one, the order of statements is not looked at. That misses a
+    few real errors and never reports a name that could exist at runtime.
+    """
+
+    def __init__(self):
+        self.module = Scope("module")
+        self.scope = self.module
+        # (scope, name, node) of every name that is read
+        self.loads: list[tuple[Scope, str, ast.AST]] = []
+        self.star_import = False
+        # names in __all__ and in string annotations count as used
+        self.exported: set[str] = set()
+        # imports in classes are usually attributes, only these scopes report unused ones
+        self.scopes_with_imports = [self.module]
+
+    def problems(self, tree: ast.AST, check_imports=True) -> list[Problem]:
+        self.visit(tree)
+        problems = []
+        for scope, name, node in self.loads:
+            owner = self.resolve(scope, name)
+            if owner is not None:
+                owner.used.add(name)
+            elif name not in IMPLICIT_NAMES and name not in self.exported and not self.star_import:
+                problems.append(Problem(
+                    node.lineno - 1, node.col_offset, node.end_col_offset, ERROR, f"undefined name '{name}'"
+                ))
+        if check_imports:
+            for scope in self.scopes_with_imports:
+                for name, node in scope.imports.items():
+                    if name not in scope.used and name not in self.exported:
+                        problems.append(Problem(
+                            node.lineno - 1, node.col_offset, node.end_col_offset, WARNING,
+                            f"'{name}' imported but unused",
+                        ))
+        problems.sort(key=lambda p: (p.line, p.column))
+        return problems
+
+    def resolve(self, scope: Scope, name: str):
+        current = scope
+        while current is not None:
+            # class attributes are not visible in the functions of the class
+            if name in current.bindings and (current is scope or current.kind != "class"):
+                return current
+            current = current.parent
+        return None
+
+    def push(self, kind: str) -> Scope:
+        self.scope = Scope(kind, self.scope)
+        if kind == "function":
+            self.scopes_with_imports.append(self.scope)
+        return self.scope
+
+    def pop(self):
+        self.scope = self.scope.parent
+
+    def bind(self, name: str, scope: Scope = None):
+        (scope or self.scope).bindings.add(name)
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self.loads.append((self.scope, node.id, node))
+        else:
+            self.bind(node.id)
+
+    def visit_Global(self, node: ast.Global):
+        for name in node.names:
+            self.bind(name, self.module)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            name = alias.asname or alias.name.split(".")[0]
+            self.bind(name)
+            self.scope.imports[name] = alias if hasattr(alias, "lineno") else node
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        for alias in node.names:
+            if alias.name == "*":
+                self.star_import = True
+                continue
+            name = alias.asname or alias.name
+            self.bind(name)
+            if node.module != "__future__":
+                self.scope.imports[name] = alias if hasattr(alias, "lineno") else node
+
+    def visit_annotation(self, node):
+        if node is None:
+            return
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            # a forward reference, the names in it are used but may be defined later
+            try:
+                expr = ast.parse(node.value, mode="eval")
+            except SyntaxError:
+                return
+            self.exported.update(n.id for n in ast.walk(expr) if isinstance(n, ast.Name))
+            return
+        self.visit(node)
+
+    def visit_arguments(self, args: ast.arguments):
+        """Defaults and annotations, evaluated in the enclosing scope"""
+        for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+            self.visit(default)
+        for arg in self.all_args(args):
+            self.visit_annotation(arg.annotation)
+
+    @staticmethod
+    def all_args(args: ast.arguments) -> list[ast.arg]:
+        found = args.posonlyargs + args.args + args.kwonlyargs
+        return found + [a for a in (args.vararg, args.kwarg) if a is not None]
+
+    def visit_FunctionDef(self, node):
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit_arguments(node.args)
+        self.visit_annotation(node.returns)
+        self.bind(node.name)
+        self.push("function")
+        for param in getattr(node, "type_params", []):
+            self.visit(param)
+        for arg in self.all_args(node.args):
+            self.bind(arg.arg)
+        for stmt in node.body:
+            self.visit(stmt)
+        self.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node: ast.Lambda):
+        self.visit_arguments(node.args)
+        self.push("function")
+        for arg in self.all_args(node.args):
+            self.bind(arg.arg)
+        self.visit(node.body)
+        self.pop()
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        for expr in node.decorator_list + node.bases + [k.value for k in node.keywords]:
+            self.visit(expr)
+        self.bind(node.name)
+        self.push("class")
+        for param in getattr(node, "type_params", []):
+            self.visit(param)
+        for stmt in node.body:
+            self.visit(stmt)
+        self.pop()
+
+    def visit_comprehension_scope(self, node, parts: list):
+        # the first iterable is evaluated outside, everything else in its own scope
+        self.visit(node.generators[0].iter)
+        self.push("comprehension")
+        for i, generator in enumerate(node.generators):
+            self.visit(generator.target)
+            if i:
+                self.visit(generator.iter)
+            for condition in generator.ifs:
+                self.visit(condition)
+        for part in parts:
+            self.visit(part)
+        self.pop()
+
+    def visit_ListComp(self, node):
+        self.visit_comprehension_scope(node, [node.elt])
+
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node: ast.DictComp):
+        self.visit_comprehension_scope(node, [node.key, node.value])
+
+    def visit_NamedExpr(self, node: ast.NamedExpr):
+        # := in a comprehension binds in the scope around it
+        scope = self.scope
+        while scope.kind == "comprehension":
+            scope = scope.parent
+        self.bind(node.target.id, scope)
+        self.visit(node.value)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        self.visit_annotation(node.annotation)
+        self.visit(node.target)
+        if node.value is not None:
+            self.visit(node.value)
+
+    def visit_Assign(self, node: ast.Assign):
+        self.generic_visit(node)
+        if self.scope is self.module and any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets):
+            self.add_exports(node.value)
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        self.generic_visit(node)
+        if self.scope is self.module and isinstance(node.target, ast.Name) and node.target.id == "__all__":
+            self.add_exports(node.value)
+
+    def add_exports(self, value):
+        if isinstance(value, (ast.List, ast.Tuple)):
+            self.exported.update(e.value for e in value.elts if isinstance(e, ast.Constant) and isinstance(e.value, str))
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):
+        if node.name:
+            self.bind(node.name)
+        self.generic_visit(node)
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.bind(node.name)
+        self.generic_visit(node)
+
+    visit_MatchStar = visit_MatchAs
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.bind(node.rest)
+        self.generic_visit(node)
+
+    def visit_TypeVar(self, node):
+        self.bind(node.name)
+        self.generic_visit(node)
+
+    visit_ParamSpec = visit_TypeVarTuple = visit_TypeVar
+
+
+def syntax_problems(text: str, path: str, error: SyntaxError) -> list[Problem]:
+    """
+    The error from ast plus jedi's, which keeps parsing after the first one.
+    ast's message is the more precise one, jedi only adds other lines.
+    """
+    lines = text.splitlines()
+
+    def source_line(line: int) -> str:
+        return lines[line] if 0 <= line < len(lines) else ""
+
+    line = (error.lineno or 1) - 1
+    start = byte_column(source_line(line), max((error.offset or 1) - 1, 0))
+    end = start + 1
+    if getattr(error, "end_lineno", None) == error.lineno and error.end_offset:
+        end = max(byte_column(source_line(line), error.end_offset - 1), start + 1)
+    problems = [Problem(line, start, end, ERROR, error.msg)]
+    try:
+        import jedi
+        errors = jedi.Script(text, path=path).get_syntax_errors()
+    except Exception as e:
+        print("Jedi syntax check error:", e)
+        errors = []
+    for err in errors:
+        line = err.line - 1
+        if any(p.line == line for p in problems):
+            continue
+        src = source_line(line)
+        start = byte_column(src, err.column)
+        end = byte_column(src, err.until_column) if err.until_line == err.line else len(src.encode("utf-8"))
+        problems.append(Problem(line, start, max(end, start + 1), ERROR, err.get_message()))
+    problems.sort(key=lambda p: (p.line, p.column))
+    return problems
+
+
+def check_source(text: str, path: str) -> list[Problem]:
+    """Problems of one Python file, runs in a worker process"""
+    try:
+        tree = ast.parse(text, path)
+    except SyntaxError as e:
+        return syntax_problems(text, path, e)
+    except ValueError as e:
+        # null bytes in the source
+        return [Problem(0, 0, 1, ERROR, str(e))]
+    # names imported by a package's __init__ are usually there to be re-exported
+    return NameChecker().problems(tree, check_imports=os.path.basename(path) != "__init__.py")
+
+
+class DiagnosticsCache:
+    """
+    Results by content hash in ~/.auditcode/diagnostics.json, shared by every
+    workspace. A file that did not change since it was last checked, in any
+    workspace, costs a hash. Only the diagnostics worker thread uses it.
+    """
+
+    def __init__(self, path: Path = None):
+        self.path = path or data_dir() / "diagnostics.json"
+        self.results: dict[str, list] = None
+        self.changed = False
+
+    def load(self):
+        data = read_json(self.path, {})
+        self.results = data.get("results", {}) if data.get("version") == CHECK_VERSION else {}
+
+    def get(self, key: str):
+        if self.results is None:
+            self.load()
+        found = self.results.pop(key, None)
+        if found is None:
+            return None
+        # most recently used last, the oldest are dropped first
+        self.results[key] = found
+        return [Problem(*p) for p in found]
+
+    def put(self, key: str, problems: list[Problem]):
+        if self.results is None:
+            self.load()
+        self.results.pop(key, None)
+        self.results[key] = [p.to_list() for p in problems]
+        while len(self.results) > MAX_CACHE_ENTRIES:
+            del self.results[next(iter(self.results))]
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            write_json(self.path, {"version": CHECK_VERSION, "results": self.results})
+        except OSError as e:
+            print("Diagnostics cache error:", e)
+        self.changed = False
+
+
+class DiagnosticsWorker(QThread):
+    """
+    Checks Python files in a pool of worker processes, so parsing a large
+    file never holds the GIL the GUI needs. Edited text goes before files
+    from disk and only its newest version is checked. Results are cached by
+    content hash, a workspace scan only sends changed files to the pool.
+    """
+    # path, content hash, problems
+    checked = pyqtSignal(str, str, list)
+
+    def __init__(self, cache: DiagnosticsCache = None, max_workers=None):
+        super(DiagnosticsWorker, self).__init__(None)
+        self.cache = cache or DiagnosticsCache()
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.condition = threading.Condition()
+        # path -> (text, hash) of edited files
+        self.edited: dict[str, tuple[str, str]] = {}
+        # paths to check from disk, a dict keeps them in order without duplicates
+        self.scan: dict[str, None] = {}
+        # files of the workspace being walked
+        self.walk = None
+        self.pool: ProcessPoolExecutor = None
+        self._stop = False
+
+    def check_text(self, path: str, text: str, digest: str):
+        with self.condition:
+            self.edited[path] = (text, digest)
+            self.condition.notify()
+        if not self.isRunning():
+            self.start()
+
+    def check_files(self, paths):
+        with self.condition:
+            self.scan.update((p, None) for p in paths)
+            self.condition.notify()
+        if not self.isRunning():
+            self.start()
+
+    def check_workspace(self, root: str):
+        """Check every Python file under root, replaces a scan that is still going"""
+        with self.condition:
+            self.scan.clear()
+            self.walk = (p for p in workspace_files(root) if is_python(p))
+            self.condition.notify()
+        if not self.isRunning():
+            self.start()
+
+    def stop(self):
+        with self.condition:
+            self._stop = True
+            self.condition.notify()
+        self.wait()
+
+    def next_batch(self) -> list[tuple[str, str, str]]:
+        """(path, text, hash) to check next, text None for files read from disk"""
+        with self.condition:
+            while not (self.edited or self.scan or self.walk) and not self._stop:
+                self.condition.wait()
+            if self._stop:
+                return None
+            if self.edited:
+                batch = [(path, text, digest) for path, (text, digest) in self.edited.items()]
+                self.edited.clear()
+                return batch
+            while self.walk is not None and len(self.scan) < SCAN_BATCH:
+                path = next(self.walk, None)
+                if path is None:
+                    self.walk = None
+                else:
+                    self.scan[path] = None
+            paths = list(self.scan)[:SCAN_BATCH]
+            for path in paths:
+                del self.scan[path]
+            return [(path, None, None) for path in paths]
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                break
+            try:
+                self.check_batch(batch)
+            except Exception as e:
+                print("Diagnostics error:", e)
+            with self.condition:
+                idle = not (self.edited or self.scan or self.walk)
+            if idle:
+                self.cache.save()
+        self.cache.save()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def read(self, path: str):
+        """(text, hash) of a file on disk, None when it is gone, binary or huge"""
+        try:
+            if os.path.getsize(path) > MAX_FILE_SIZE:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            return data.decode("utf-8"), file_hash(data)
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    @instrumentation.timed("diagnostics.check")
+    def check_batch(self, batch: list):
+        futures = {}
+        for path, text, digest in batch:
+            if text is None:
+                content = self.read(path)
+                if content is None:
+                    # deleted or unreadable, its problems go away
+                    self.checked.emit(path, "", [])
+                    continue
+                text, digest = content
+            # the same text may get different results as a package __init__
+            key = digest + ("-init" if os.path.basename(path) == "__init__.py" else "")
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.checked.emit(path, digest, cached)
+                continue
+            if self.pool is None:
+                # spawn, forking a process that runs Qt threads is not safe
+                self.pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            futures[self.pool.submit(check_source, text, path)] = (path, digest, key)
+
+        for future in as_completed(futures):
+            path, digest, key = futures[future]
+            try:
+                problems = future.result()
+            except BrokenProcessPool:
+                self.pool = None
+                print("Diagnostics worker process died, checking", path, "again later")
+                with self.condition:
+                    self.scan[path] = None
+                continue
+            except Exception as e:
+                print("Diagnostics error:", path, e)
+                continue
+            self.cache.put(key, problems)
+            self.checked.emit(path, digest, problems)
+
+
+class Diagnostics(QObject):
+    """
+    Problems of the workspace's Python files, for the squiggles in the editors
+    and the problems list.
+
+    Open files are checked from the editor text, a short pause after the last
+    edit, other files from disk when the workspace is opened or they change on
+    disk. Results for text that was edited again meanwhile are dropped.
+    """
+    # absolute path, its problems
+    changed = pyqtSignal(str, list)
+    cleared = pyqtSignal()
+
+    def __init__(self, delay_ms=500, parent=None):
+        super(Diagnostics, self).__init__(parent)
+        self.worker = DiagnosticsWorker()
+        self.worker.checked.connect(self.checked)
+        self.problems: dict[str, list[Problem]] = {}
+        # path -> hash of the text last sent from an open editor
+        self.open_files: dict[str, str] = {}
+        # editors waiting for the pause after an edit
+        self.dirty: dict[str, object] = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.flush)
+
+    @staticmethod
+    def key(editor) -> str:
+        return str(editor.full_path)
+
+    def edited(self, editor):
+        if is_python(editor.path):
+            self.dirty[self.key(editor)] = editor
+            self.timer.start()
+
+    def opened(self, editor):
+        """Check an editor's text right away, after loading a file"""
+        if is_python(editor.path):
+            self.dirty.pop(self.key(editor), None)
+            self.check_editor(editor)
+
+    def closed(self, editor, recheck=True):
+        """The file's problems come from disk again, unless the workspace is closing too"""
+        path = self.key(editor)
+        self.dirty.pop(path, None)
+        if self.open_files.pop(path, None) is not None and recheck:
+            self.worker.check_files([path])
+
+    def renamed(self, old_path: str, editor):
+        self.dirty.pop(old_path, None)
+        self.open_files.pop(old_path, None)
+        if self.problems.pop(old_path, None) is not None:
+            self.changed.emit(old_path, [])
+        self.opened(editor)
+
+    def flush(self):
+        dirty, self.dirty = self.dirty, {}
+        for editor in dirty.values():
+            self.check_editor(editor)
+
+    def check_editor(self, editor):
+        data = editor.text().encode("utf-8")
+        if len(data) > MAX_FILE_SIZE:
+            return
+        path = self.key(editor)
+        digest = file_hash(data)
+        if self.open_files.get(path) == digest:
+            return
+        self.open_files[path] = digest
+        self.worker.check_text(path, data.decode("utf-8"), digest)
+
+    def check_paths(self, paths):
+        """Files changed on disk, open files are checked from their editor instead"""
+        paths = [os.path.abspath(p) for p in paths if is_python(p)]
+        paths = [p for p in paths if p not in self.open_files]
+        if paths:
+            self.worker.check_files(paths)
+
+    def check_workspace(self, root: str):
+        """Forget the old workspace's problems and check every file of root"""
+        self.problems = {p: v for p, v in self.problems.items() if p in self.open_files}
+        self.cleared.emit()
+        for path, problems in self.problems.items():
+            self.changed.emit(path, problems)
+        self.worker.check_workspace(os.path.abspath(root))
+
+    def checked(self, path: str, digest: str, problems: list):
+        if path in self.open_files:
+            if digest != self.open_files[path]:
+                return # checked from disk or an older text
+        elif self.problems.get(path, []) == problems:
+            return # an editor opened since may still need them, so those always go out
+        if problems:
+            self.problems[path] = problems
+        else:
+            self.problems.pop(path, None)
+        self.changed.emit(path, problems)
+
+    def stop(self):
+        self.worker.stop()
+
+
+class ProblemItem(QListWidgetItem):
+    def __init__(self, path: str, problem: Problem, root: str):
+        name = os.path.relpath(path, root) if root and path.startswith(root) else path
+        mark = "✖" if problem.severity == ERROR else "⚠"
+        super(ProblemItem, self).__init__(f"{mark} {problem.message}\n    {name}:{problem.line + 1}")
+        self.setForeground(ERROR_COLOR if problem.severity == ERROR else WARNING_COLOR)
+        self.setToolTip(f"{path}:{problem.line + 1}:{problem.column + 1}")
+        self.path = path
+        self.problem = problem
+
+
+class ProblemsView(QListWidget):
+    """Problems of every checked file, errors first, rebuilt a moment after they change"""
+    # errors, warnings
+    counts_changed = pyqtSignal(int, int)
+    # rows per file, a workspace with thousands of warnings stays usable
+    MAX_ITEMS = 5000
+
+    def __init__(self, diagnostics: Diagnostics, parent=None):
+        super(ProblemsView, self).__init__(parent)
+        self.diagnostics = diagnostics
+        self.root = ""
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(200)
+        self.timer.timeout.connect(self.rebuild)
+        diagnostics.changed.connect(lambda path, problems: self.timer.start())
+        diagnostics.cleared.connect(self.timer.start)
+        self.setWordWrap(True)
+        self.setTextElideMode(Qt.ElideMiddle)
+
+    def set_root(self, root: str):
+        self.root = os.path.abspath(root)
+        self.timer.start()
+
+    def rebuild(self):
+        rows = []
+        errors = warnings = 0
+        for path, problems in self.diagnostics.problems.items():
+            for problem in problems:
+                if problem.severity == ERROR:
+                    errors += 1
+                else:
+                    warnings += 1
+                rows.append((problem.severity != ERROR, path, problem.line, problem))
+        rows.sort(key=lambda r: r[:3])
+
+        self.setUpdatesEnabled(False)
+        self.clear()
+        for _, path, _, problem in rows[:self.MAX_ITEMS]:
+            self.addItem(ProblemItem(path, problem, self.root))
+        self.setUpdatesEnabled(True)
+        self.counts_changed.emit(errors, warnings)
@@ -0,0 +1,86 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+import time
+
+if TYPE_CHECKING:
+    from editor import Editor
+
+
+class OpenDocument:
+    """An open tab and what we know about it"""
+
+    def __init__(self, path: Path, editor: "Editor"):
+        self.path = path
+        self.editor = editor
+        self.opened_at = time.time()
+
+    def __repr__(self):
+        return f"OpenDocument({self.path})"
+
+
+class DocumentRegistry:
+    """
+    Open documents keyed by resolved path, so two files with the same name in
+    different folders never get mixed up and lookups are a dict hit instead of
+    a scan over the tabs.
+    """
+
+    def __init__(self):
+        self.documents: dict[Path, OpenDocument] = {}
+
+    @staticmethod
+    def key(path) -> Path:
+        return Path(path).resolve()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        return iter(list(self.documents.values()))
+
+    def __contains__(self, path):
+        return self.key(path) in self.documents
+
+    def add(self, path, editor: "Editor") -> OpenDocument:
+        key = self.key(path)
+        doc = OpenDocument(key, editor)
+        self.documents[key] = doc
+        return doc
+
+    def get(self, path) -> OpenDocument:
+        return self.documents.get(self.key(path))
+
+    def editor(self, path) -> "Editor":
+        doc = self.get(path)
+        return doc.editor if doc is not None else None
+
+    def remove(self, path) -> OpenDocument:
+        return self.documents.pop(self.key(path), None)
+
+    def clear(self):
+        self.documents.clear()
+
+    def under(self, path) -> list[OpenDocument]:
+        """The document at path, or every document inside it when path is a folder"""
+        key = self.key(path)
+        doc = self.documents.get(key)
+        if doc is not None:
+            return [doc]
+        return [d for p, d in self.documents.items() if key in p.parents]
+
+    def move(self, old, new) -> list[tuple[OpenDocument, Path]]:
+        """
+        Re-key documents after old was renamed or moved to new
+
+        :return: (document, new path) for every document that moved
+        """
+        old_key = self.key(old)
+        new_key = self.key(new)
+        moved = []
+        for doc in self.under(old_key):
+            del self.documents[doc.path]
+            path = new_key / doc.path.relative_to(old_key) if doc.path != old_key else new_key
+            doc.path = path
+            self.documents[path] = doc
+            moved.append((doc, path))
+        return moved
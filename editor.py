@@ -1,13 +1,20 @@
 from typing import TYPE_CHECKING
 
 from pathlib import Path
-from PyQt5.Qsci import QsciScintilla, QsciAPIs,QsciLexer
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont, QColor, QKeyEvent
+from PyQt5.Qsci import QsciScintilla, QsciLexer
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QFont, QColor, QKeySequence, QKeyEvent, QShowEvent, QFocusEvent, QPaintEvent, QResizeEvent
+from PyQt5.QtWidgets import QToolTip
 
 from lexer import PyCustomLexer, JsonLexer
 from file_types import get_file_type, FileType
-from autocompleter import AutoCompleter
+from autocompleter import AutoCompleter, CompletionAPIs
+from workspace_watcher import stat_signature
+from code_index import file_hash
+from inline_completion import InlineCompletion, GHOST_STYLE, GHOST_COLOR
+from find_bar import FindBar
+import line_operations
+from diagnostics import Problem, ERROR, ERROR_INDICATOR, WARNING_INDICATOR, ERROR_COLOR, WARNING_COLOR
 
 if TYPE_CHECKING:
     from main import MainWindow
@@ -17,7 +24,6 @@ class Editor(QsciScintilla):
 
     def __init__(self, main_window, parent=None, path: Path = None, file_type=".py", env=None):
         super(Editor, self).__init__(parent)
-        self.first_launch = True # variable to keep track of if it's first launch
         self.main_window: MainWindow = main_window
 
         self.path = path
@@ -25,10 +31,17 @@ class Editor(QsciScintilla):
         self.full_path = self.path.absolute()
         self.is_python_file = self.file_type == FileType.Python
         self.venv = env
-        self._current_file_changed = False        
+        self.disk_stat = None # (mtime, size) of the file when we last loaded or saved it
+        self.disk_hash = None # hash of its content then, tells a touch from a real change
+        self._loading = False
+        # (line, index, first visible line) while the file waits to be loaded, see defer_load
+        self.pending_load = None
         # EDITOR
         self.cursorPositionChanged.connect(self.cursorPositionChangedCustom)
         self.textChanged.connect(self.textChangedCustom)
+        # Scintilla's save point tells whether the text differs from the file,
+        # undoing back to it makes the tab clean again
+        self.modificationChanged.connect(lambda modified: self.main_window.editor_modified(self, modified))
  
         # encoding       
         self.setUtf8(True)
@@ -45,6 +58,11 @@ class Editor(QsciScintilla):
         self.setIndentationsUseTabs(False) # don't use tabs, otherwise jedi can't work
         self.setAutoIndent(True)
 
+        # several cursors: Ctrl+click adds one, Alt+drag selects a column, typing edits them all
+        self.SendScintilla(QsciScintilla.SCI_SETMULTIPLESELECTION, True)
+        self.SendScintilla(QsciScintilla.SCI_SETADDITIONALSELECTIONTYPING, True)
+        self.SendScintilla(QsciScintilla.SCI_SETMULTIPASTE, QsciScintilla.SC_MULTIPASTE_EACH)
+
         # autocomplete
         self.setAutoCompletionSource(QsciScintilla.AcsAPIs)
         self.setAutoCompletionThreshold(1)
@@ -82,6 +100,71 @@ class Editor(QsciScintilla):
         self.setEolMode(QsciScintilla.EolMode.EolWindows)
         self.setEolVisibility(False)
 
+        # lexer, completion api and autocompleter are created on first show
+        self.language_ready = False
+
+        # markers
+        # text_edit.markerDefine(QsciScintilla.Circle, 1)
+        # text_edit.setMarkerBackgroundColor(QColor("#FF0000"), 1)
+        # text_edit.setMarkerForegroundColor(QColor("#FFFFFF"), 1)
+
+        # margin 0 = Line nr margin
+        self.setMarginType(0, QsciScintilla.NumberMargin)
+        self.setMarginWidth(0, "0000")
+
+        # folding
+        # self.setMarginType(1, QsciScintilla)
+        # self.setMarginWidth(1, "000")
+        # self.setMarginMarkerMask(1, 0b1111)
+        # self.setMarginSensitivity(1, True)
+        self.setFolding(QsciScintilla.BoxedFoldStyle, 1)
+
+        # margin 1 = Symbol margin
+        # editor.setMarginType(1, QsciScintilla.SymbolMargin)
+        # editor.setMarginWidth(1, "000")
+        # editor.setMarginMarkerMask(1, 0b1111)
+        # editor.setMarginSensitivity(1, True)
+
+        # debug_circle = QImage("./src/imgs/Basic_red_dot.png").scaled(QSize(13, 13))
+        # # smooth circle
+        # debug_circle.setDevicePixelRatio(self.devicePixelRatioF())
+        # editor.markerDefine(debug_circle, 1)
+        # editor.marginClickEolWindowsed.connect(self.handle_margin)
+
+        self._init_style()
+
+        # squiggles under the problems found by diagnostics.py
+        self.indicatorDefine(QsciScintilla.SquigglePixmapIndicator, ERROR_INDICATOR)
+        self.setIndicatorForegroundColor(ERROR_COLOR, ERROR_INDICATOR)
+        self.indicatorDefine(QsciScintilla.SquigglePixmapIndicator, WARNING_INDICATOR)
+        self.setIndicatorForegroundColor(WARNING_COLOR, WARNING_INDICATOR)
+        self.problems: list[Problem] = []
+        # hovering a squiggle shows its message
+        self.SendScintilla(QsciScintilla.SCI_SETMOUSEDWELLTIME, 500)
+        self.SCN_DWELLSTART.connect(self.show_problem_tip)
+        self.SCN_DWELLEND.connect(lambda *args: QToolTip.hideText())
+
+        # AI ghost text, only when enabled in the settings
+        self.inline_completion = None
+        if self.main_window.inline_worker is not None:
+            self.inline_completion = InlineCompletion(
+                self, self.main_window.inline_worker, self.main_window.settings.get("inline_delay_ms", 300)
+            )
+
+        # created the first time find is used in this editor
+        self.find_bar: FindBar = None
+
+        # bumped on every change, the outline is cached for one version
+        self.version = 0
+        self.outline = None
+        self.outline_version = -1
+
+    def ensure_language_support(self):
+        """Set up the lexer and autocompletion, once, the first time the editor is shown"""
+        if self.language_ready:
+            return
+        self.language_ready = True
+
         if self.file_type == FileType.Python:
             # lexer
             self.pylexer = PyCustomLexer(self)
@@ -90,11 +173,11 @@ class Editor(QsciScintilla):
 
             # Api AUTOCOMPLETION
             # API
-            self.__api = QsciAPIs(self.pylexer)
+            self.__api = CompletionAPIs(self.pylexer, self)
             # autocompletion_image = QPixmap("./src/icons/close-icon.svg")
             # self.registerImage(1, autocompletion_image)
 
-            self.auto_completer = AutoCompleter(self.full_path, self.__api)
+            self.auto_completer = AutoCompleter(self.full_path, self.__api, self.venv)
             self.auto_completer.finished.connect(self.loaded_autocomp)
             self.setLexer(self.pylexer)
 
@@ -115,15 +198,18 @@ class Editor(QsciScintilla):
 
             # Api AUTOCOMPLETION
             # API
-            self.__api = QsciAPIs(self.pylexer)
+            self.__api = CompletionAPIs(self.pylexer, self)
             # autocompletion_image = QPixmap("./src/icons/close-icon.svg")
             # self.registerImage(1, autocompletion_image)
 
-            self.auto_completer = AutoCompleter(self.full_path, self.__api)
+            self.auto_completer = AutoCompleter(self.full_path, self.__api, self.venv)
             self.auto_completer.finished.connect(self.loaded_autocomp)
             self.setLexer(self.pylexer)
 
-        # style
+        # setLexer resets the colors set up in the constructor
+        self._init_style()
+
+    def _init_style(self):
         self.setIndentationGuidesBackgroundColor(QColor("#dedcdc"))
         self.setIndentationGuidesForegroundColor(QColor("#dedcdc"))
         self.SendScintilla(self.SCI_STYLESETBACK, self.STYLE_DEFAULT, QColor("#282c34"))
@@ -134,63 +220,171 @@ class Editor(QsciScintilla):
         self.setContentsMargins(0, 0, 0, 0)
         self.setSelectionBackgroundColor(QColor("#333a46"))
 
-        # markers
-        # text_edit.markerDefine(QsciScintilla.Circle, 1)
-        # text_edit.setMarkerBackgroundColor(QColor("#FF0000"), 1)
-        # text_edit.setMarkerForegroundColor(QColor("#FFFFFF"), 1)
-
-        # margin 0 = Line nr margin
-        self.setMarginType(0, QsciScintilla.NumberMargin)
-        self.setMarginWidth(0, "0000")
         self.setMarginsForegroundColor(QColor("#ff888888"))
         self.setMarginsBackgroundColor(QColor("#282c34"))
         self.setMarginsFont(self.font)
-
-        # folding
-        # self.setMarginType(1, QsciScintilla)
-        # self.setMarginWidth(1, "000")
-        # self.setMarginMarkerMask(1, 0b1111)
-        # self.setMarginSensitivity(1, True)
-        self.setFolding(QsciScintilla.BoxedFoldStyle, 1)
         self.setFoldMarginColors(QColor("#2c313c"), QColor("#2c313c"))
 
-        # margin 1 = Symbol margin
-        # editor.setMarginType(1, QsciScintilla.SymbolMargin)
-        # editor.setMarginWidth(1, "000")
-        # editor.setMarginMarkerMask(1, 0b1111)
-        # editor.setMarginSensitivity(1, True)
-
-        # debug_circle = QImage("./src/imgs/Basic_red_dot.png").scaled(QSize(13, 13))
-        # # smooth circle
-        # debug_circle.setDevicePixelRatio(self.devicePixelRatioF())
-        # editor.markerDefine(debug_circle, 1)
-        # editor.marginClickEolWindowsed.connect(self.handle_margin)
-
-        self.indicatorDefine(QsciScintilla.SquigglePixmapIndicator, 0)
+        # ghost text lines below the cursor line
+        self.setAnnotationDisplay(QsciScintilla.AnnotationStandard)
+        self.SendScintilla(self.SCI_STYLESETFORE, GHOST_STYLE, GHOST_COLOR)
+        self.SendScintilla(self.SCI_STYLESETBACK, GHOST_STYLE, QColor("#282c34"))
+        self.SendScintilla(self.SCI_STYLESETFONT, GHOST_STYLE, self.font.family().encode())
+        self.SendScintilla(self.SCI_STYLESETSIZE, GHOST_STYLE, self.font.pointSize())
+
+    def showEvent(self, e: QShowEvent) -> None:
+        self.ensure_language_support()
+        if self.pending_load is not None:
+            self.load_file()
+        return super().showEvent(e)
+
+    def defer_load(self, line=0, index=0, first_visible=0):
+        """Read the file the first time the tab is shown, used when restoring a session"""
+        self.pending_load = (line, index, first_visible)
+
+    def load_file(self):
+        line, index, first_visible = self.pending_load
+        self.pending_load = None
+        try:
+            self.load_text(self.path.read_text(encoding="utf-8"))
+        except (OSError, UnicodeDecodeError) as err:
+            self.main_window.statusBar().showMessage(f"Cannot open {self.path.name}: {err}", 3000)
+        if self.main_window.diagnostics is not None:
+            self.main_window.diagnostics.opened(self)
+        self.setCursorPosition(line, index)
+        self.setFirstVisibleLine(first_visible)
+
+    def view_state(self) -> tuple[int, int, int]:
+        """(line, index, first visible line), also for tabs that were never loaded"""
+        if self.pending_load is not None:
+            return self.pending_load
+        line, index = self.getCursorPosition()
+        return line, index, self.firstVisibleLine()
+
+    def focusInEvent(self, e: QFocusEvent) -> None:
+        self.ensure_language_support()
+        return super().focusInEvent(e)
+
+    def focusOutEvent(self, e: QFocusEvent) -> None:
+        if self.inline_completion is not None:
+            self.inline_completion.dismiss()
+        return super().focusOutEvent(e)
+
+    def resizeEvent(self, e: QResizeEvent) -> None:
+        super().resizeEvent(e)
+        if self.find_bar is not None and self.find_bar.isVisible():
+            self.find_bar.place()
+
+    def show_find_bar(self, replace=False):
+        if self.find_bar is None:
+            self.find_bar = FindBar(self)
+        self.find_bar.open(replace)
+
+    def set_problems(self, problems: list[Problem]):
+        """Squiggle the problems found by diagnostics, replacing the old ones"""
+        if problems == self.problems:
+            return # every indicator change costs a full repaint
+        self.problems = problems
+        length = self.SendScintilla(QsciScintilla.SCI_GETLENGTH)
+        lines = self.lines()
+        for indicator in (ERROR_INDICATOR, WARNING_INDICATOR):
+            self.SendScintilla(QsciScintilla.SCI_SETINDICATORCURRENT, indicator)
+            self.SendScintilla(QsciScintilla.SCI_INDICATORCLEARRANGE, 0, length)
+        for problem in problems:
+            if problem.line >= lines:
+                continue
+            start, end = self.problem_range(problem)
+            indicator = ERROR_INDICATOR if problem.severity == ERROR else WARNING_INDICATOR
+            self.SendScintilla(QsciScintilla.SCI_SETINDICATORCURRENT, indicator)
+            self.SendScintilla(QsciScintilla.SCI_INDICATORFILLRANGE, start, end - start)
+
+    def problem_range(self, problem: Problem) -> tuple[int, int]:
+        """Document positions of a problem, at least one character wide"""
+        line_start = self.SendScintilla(QsciScintilla.SCI_POSITIONFROMLINE, problem.line)
+        line_end = self.SendScintilla(QsciScintilla.SCI_GETLINEENDPOSITION, problem.line)
+        start = min(line_start + problem.column, line_end)
+        end = min(line_start + problem.end_column, line_end)
+        if end <= start:
+            # past the end of the line, e.g. a missing colon
+            start, end = max(line_start, start - 1), max(start, line_start + 1)
+        return start, end
+
+    def show_problem_tip(self, pos: int, x: int, y: int):
+        if pos < 0 or not self.problems:
+            return
+        line = self.SendScintilla(QsciScintilla.SCI_LINEFROMPOSITION, pos)
+        messages = []
+        for problem in self.problems:
+            if problem.line == line:
+                start, end = self.problem_range(problem)
+                if start <= pos <= end:
+                    messages.append(problem.message)
+        if messages:
+            QToolTip.showText(self.viewport().mapToGlobal(QPoint(x, y)), "\n".join(messages), self)
+
+    def paintEvent(self, e: QPaintEvent) -> None:
+        super().paintEvent(e)
+        if self.inline_completion is not None:
+            self.inline_completion.paint()
 
-        
-
-    # UPDATED EP 9
     @property
-    def current_file_changed(self):
-        return self._current_file_changed
-    
-    # UPDATED EP 9
-    @current_file_changed.setter
-    def current_file_changed(self, value: bool):
-        curr_indx = self.main_window.tab_view.currentIndex()
-        if value:
-            self.main_window.tab_view.setTabText(curr_indx, "*" + self.path.name)
-            self.main_window.setWindowTitle(f"*{self.path.name} - {self.main_window.app_name}")
-        else:
-            if self.main_window.tab_view.tabText(curr_indx).startswith("*"):
-                self.main_window.tab_view.setTabText(
-                    curr_indx, 
-                    self.main_window.tab_view.tabText(curr_indx)[1:]
-                )
-                self.main_window.setWindowTitle(self.main_window.windowTitle()[1:])
-
-        self._current_file_changed = value
+    def current_file_changed(self) -> bool:
+        return self.isModified()
+
+    def set_env(self, env_path):
+        """Use another virtualenv for completion"""
+        self.venv = env_path
+        if self.language_ready and hasattr(self, "auto_completer"):
+            self.auto_completer.env_path = env_path
+
+    def mark_disk_state(self, text: str = None):
+        """
+        Remember the file state on disk, so only changes made by others are
+        reported. `text` is what was just read or written, without it the
+        file is read again.
+        """
+        self.disk_stat = stat_signature(self.full_path)
+        if text is None:
+            text = self.disk_text()
+        self.disk_hash = None if text is None else file_hash(text.encode("utf-8"))
+
+    def disk_text(self):
+        try:
+            return self.path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def changed_on_disk(self) -> bool:
+        """Whether someone else changed the file since we loaded or saved it, the content is only hashed when its stat differs"""
+        if self.disk_stat is None or stat_signature(self.full_path) == self.disk_stat:
+            return False
+        text = self.disk_text()
+        if text is None:
+            return False # deleted, saving puts it back
+        return file_hash(text.encode("utf-8")) != self.disk_hash
+
+    def load_text(self, text: str):
+        """Show the file content, the result is the save point and can't be undone"""
+        self._loading = True
+        self.setText(text)
+        self._loading = False
+        self.setModified(False)
+        self.mark_disk_state(text)
+
+    def mark_saved(self, text: str):
+        """The text was written to the file"""
+        self.setModified(False)
+        self.mark_disk_state(text)
+
+    def reload_from_disk(self):
+        """Replace the text with the file content, keeping the cursor and scroll position"""
+        line, index = self.getCursorPosition()
+        first_line = self.firstVisibleLine()
+        self.load_text(self.path.read_text(encoding="utf-8"))
+        self.setCursorPosition(line, index)
+        self.setFirstVisibleLine(first_line)
+        if self.main_window.diagnostics is not None:
+            self.main_window.diagnostics.opened(self)
 
     @property
     def autocomplete(self):
@@ -200,21 +394,38 @@ class Editor(QsciScintilla):
     def set_autocomplete(self, value):
         self.complete_flag = value
 
-    def toggle_comment(self, text: str) -> str:
-        lines = text.split('\n')
-        toggled_lines = []
-        for line in lines:
-            if line.startswith('#'):
-                # remove the comment symbol from the line
-                toggled_lines.append(line[1:].lstrip())
-            else:
-                # add the comment symbol to the line
-                toggled_lines.append('# ' + line)
-        return '\n'.join(toggled_lines)
+    def undo(self):
+        # undoing a bulk line edit replays thousands of changes
+        with line_operations.bulk_change(self):
+            super().undo()
+
+    def redo(self):
+        with line_operations.bulk_change(self):
+            super().redo()
 
     def keyPressEvent(self, e: QKeyEvent) -> None:
+        if self.inline_completion is not None and self.inline_completion.ghost and not self.isListActive():
+            if e.key() == Qt.Key_Tab and e.modifiers() == Qt.NoModifier:
+                if self.inline_completion.accept():
+                    return
+            elif e.key() == Qt.Key_Escape:
+                self.inline_completion.dismiss()
+                return
+
+        if e.key() == Qt.Key_Escape and self.find_bar is not None and self.find_bar.isVisible():
+            self.find_bar.close_bar()
+            return
+
+        # Scintilla would undo by itself, without batching the change notifications
+        if e.matches(QKeySequence.Undo):
+            self.undo()
+            return
+        if e.matches(QKeySequence.Redo):
+            self.redo()
+            return
+
         if e.modifiers() == Qt.ControlModifier and e.key() == Qt.Key_Space:
-            if self.is_python_file:
+            if self.is_python_file and self.language_ready:
                 pos = self.getCursorPosition()
                 self.auto_completer.get_completion(pos[0]+1, pos[1], self.text())
                 self.autoCompleteFromAPIs()
@@ -230,23 +441,19 @@ class Editor(QsciScintilla):
             
         # UPDATED EP 9
         if e.modifiers() == Qt.ControlModifier and e.text() == "/": # COMMENT SHORTCUT
-            if self.hasSelectedText():
-                start, startl, end, endl = self.getSelection()
-                self.setSelection(start, 0, end, self.lineLength(end)-1)
-                self.replaceSelectedText(self.toggle_comment(self.selectedText()))
-                self.setSelection(start, startl, end, endl)
-            else:
-                line, idx = self.getCursorPosition()
-                self.setSelection(line, 0, line, self.lineLength(line)-1)
-                self.replaceSelectedText(self.toggle_comment(self.selectedText()))
-                self.setSelection(-1, -1, -1, -1) # reset selection
-            
+            line_operations.toggle_comment(self)
             return 
 
+        # with several cursors Scintilla makes one change per cursor, notify once
+        if self.SendScintilla(QsciScintilla.SCI_GETSELECTIONS) > 1:
+            with line_operations.bulk_change(self):
+                return super().keyPressEvent(e)
         return super().keyPressEvent(e)
 
     def cursorPositionChangedCustom(self, line: int, index: int) -> None:
-        if self.is_python_file:
+        if self.inline_completion is not None:
+            self.inline_completion.cursor_moved()
+        if self.is_python_file and self.language_ready:
             self.auto_completer.get_completion(line+1, index, self.text())
 
     def loaded_autocomp(self):
@@ -254,7 +461,10 @@ class Editor(QsciScintilla):
 
     # UPDATED EP 9
     def textChangedCustom(self) -> None:
-        if not self.current_file_changed and not self.first_launch:
-            self.current_file_changed = True
-        if self.first_launch:
-            self.first_launch = False
+        self.version += 1
+        if self._loading:
+            return
+        if self.inline_completion is not None:
+            self.inline_completion.text_changed()
+        if self.main_window.diagnostics is not None:
+            self.main_window.diagnostics.edited(self)
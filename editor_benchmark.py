@@ -0,0 +1,329 @@
+"""End to end latency benchmark of the editor.
+
+Drives a real MainWindow headless on a generated workspace: opens files,
+types with completion on, searches and switches tabs, then prints JSON
+that can be compared between builds:
+
+    py editor_benchmark.py --seed 0 --output editor_bench.json
+
+Settings, caches and the session go to a temporary AUDITCODE_HOME, the
+user's own are never touched.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# no window is ever shown, run qt without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QObject, QEvent, QTimer, Qt
+from PyQt5.QtGui import QKeyEvent
+from PyQt5.QtWidgets import QApplication
+
+from settings import write_json
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+WORDS = [
+    "editor", "lexer", "token", "window", "tab", "search", "worker", "thread",
+    "model", "index", "path", "file", "value", "result", "item", "style",
+]
+SEARCHES = ["value", "def \\w+_handler", "result.append"]
+# longest wait for one keystroke to be painted
+PAINT_TIMEOUT = 5.0
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Summary of latencies in seconds, reported in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": at(0.50),
+        "p90_ms": at(0.90),
+        "p99_ms": at(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def random_module(rng: random.Random, functions: int) -> str:
+    """Python that parses, has classes, imports and calls to complete"""
+    lines = ["import os", "import json", ""]
+    for c in range(max(1, functions // 8)):
+        lines.append(f"class {rng.choice(WORDS).title()}{c}:")
+        for f in range(8):
+            name = f"{rng.choice(WORDS)}_handler{f}"
+            lines += [
+                f"    def {name}(self, {rng.choice(WORDS)}, value=None):",
+                f"        result = [os.path.join(str(value), \"{rng.choice(WORDS)}\")]",
+                f"        for item in range({rng.randint(1, 100)}):",
+                "            result.append(json.dumps(item))",
+                "        return result",
+                "",
+            ]
+    return "\n".join(lines) + "\n"
+
+
+def generate_workspace(root: Path, files: int, seed=0) -> dict:
+    rng = random.Random(seed)
+    total = 0
+    for i in range(files):
+        path = root / f"pkg{i % 5}" / f"module{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = random_module(rng, rng.randint(16, 160))
+        path.write_text(text, encoding="utf-8")
+        total += len(text)
+    return {"seed": seed, "files": files, "bytes": total}
+
+
+def typing_text(rng: random.Random, chars: int) -> str:
+    lines = []
+    size = 0
+    while size < chars:
+        line = f"value = self.{rng.choice(WORDS)}_handler{rng.randint(0, 7)}(os.path.join(item, result))"
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)[:chars]
+
+
+class PaintWatcher(QObject):
+    """Time of the last paint of a widget"""
+
+    def __init__(self, widget):
+        super(PaintWatcher, self).__init__(widget)
+        self.painted_at = None
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            self.painted_at = time.perf_counter()
+        return False
+
+
+class LoopLag(QObject):
+    """How late a short repeating timer fires, time the event loop could not run"""
+
+    def __init__(self, interval_ms=10):
+        super(LoopLag, self).__init__()
+        self.interval = interval_ms / 1000
+        self.samples: list[float] = []
+        self.last = None
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        self.last = time.perf_counter()
+        self.timer.start()
+
+    def tick(self):
+        now = time.perf_counter()
+        self.samples.append(max(0.0, now - self.last - self.interval))
+        self.last = now
+
+
+class Scenario:
+    def __init__(self, app: QApplication, window, root: Path, rng: random.Random):
+        self.app = app
+        self.window = window
+        self.root = root
+        self.rng = rng
+
+    def wait(self, condition, timeout: float) -> bool:
+        end = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > end:
+                return False
+            self.app.processEvents()
+        return True
+
+    def idle(self, seconds: float):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            self.app.processEvents()
+
+    def wait_for_paint(self, editor, since: float) -> float:
+        """Seconds from since until the editor painted, None if it never did"""
+        watcher: PaintWatcher = editor.benchmark_watcher
+        watcher.painted_at = None
+        if not self.wait(lambda: watcher.painted_at is not None, PAINT_TIMEOUT):
+            return None
+        return watcher.painted_at - since
+
+    def open_files(self, paths: list[Path]) -> list[float]:
+        latencies = []
+        for path in paths:
+            start = time.perf_counter()
+            self.window.set_new_tab(path)
+            editor = self.window.tab_view.currentWidget()
+            editor.benchmark_watcher = PaintWatcher(editor.viewport())
+            latency = self.wait_for_paint(editor, start)
+            if latency is not None:
+                latencies.append(latency)
+        return latencies
+
+    def type_text(self, text: str) -> list[float]:
+        """Keystroke to paint of every character, typed at the end of the current file"""
+        editor = self.window.tab_view.currentWidget()
+        editor.setFocus()
+        last = editor.lines() - 1
+        editor.setCursorPosition(last, editor.lineLength(last))
+        latencies = []
+        for char in text:
+            if char == "\n":
+                if editor.isListActive():
+                    editor.cancelList()  # Return would pick the completion
+                key, char = Qt.Key_Return, "\r"
+            else:
+                key = Qt.Key_A if char.isalpha() else Qt.Key_unknown
+            start = time.perf_counter()
+            self.app.sendEvent(editor, QKeyEvent(QEvent.KeyPress, key, Qt.NoModifier, char))
+            self.app.sendEvent(editor, QKeyEvent(QEvent.KeyRelease, key, Qt.NoModifier, char))
+            latency = self.wait_for_paint(editor, start)
+            if latency is not None:
+                latencies.append(latency)
+        return latencies
+
+    def search(self, pattern: str) -> float:
+        done = []
+        worker = self.window.search_worker
+        worker.finished.connect(done.append)
+        start = time.perf_counter()
+        worker.update(pattern, str(self.root), False)
+        self.wait(lambda: done, 60)
+        worker.finished.disconnect(done.append)
+        return time.perf_counter() - start
+
+    def switch_tabs(self, count: int) -> list[float]:
+        tabs = self.window.tab_view
+        latencies = []
+        for _ in range(count):
+            index = self.rng.randrange(tabs.count())
+            if index == tabs.currentIndex():
+                continue
+            start = time.perf_counter()
+            tabs.setCurrentIndex(index)
+            latency = self.wait_for_paint(tabs.currentWidget(), start)
+            if latency is not None:
+                latencies.append(latency)
+        return latencies
+
+
+def span_summary() -> dict:
+    """Per subsystem timings recorded by instrumentation.py during the run"""
+    from instrumentation import instrumentation
+    durations: dict[str, list[float]] = {}
+    for name, _, duration, _ in instrumentation.events.copy():
+        durations.setdefault(name, []).append(duration / 1e9)
+    return {name: percentiles(samples) for name, samples in sorted(durations.items())}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def benchmark(app: QApplication, root: Path, args) -> dict:
+    # imported late, main.py reads the settings of the temporary home on import
+    from main import MainWindow
+
+    rng = random.Random(args.seed)
+    lag = LoopLag()
+    start = time.perf_counter()
+    window = MainWindow()
+    # offscreen windows still paint and move the cursor once shown, kept on
+    # the screen so the completion list has room to open
+    window.setGeometry(app.primaryScreen().availableGeometry())
+    window.show()
+    scenario = Scenario(app, window, root, rng)
+    window.set_workspace(str(root))
+    scenario.idle(0.5)
+    startup = time.perf_counter() - start
+    lag.start()
+
+    paths = sorted(root.rglob("*.py"))[:args.files]
+    results = {"startup_s": startup}
+    results["open"] = percentiles(scenario.open_files(paths))
+    results["typing"] = percentiles(scenario.type_text(typing_text(rng, args.chars)))
+    results["search"] = {pattern: scenario.search(pattern) * 1000 for pattern in SEARCHES}
+    results["tab_switch"] = percentiles(scenario.switch_tabs(args.switches))
+    # let the background checks of the typed text finish so their spans count
+    scenario.idle(1.0)
+    results["event_loop_lag"] = percentiles(lag.samples)
+    results["spans"] = span_summary()
+    results["peak_rss_mb"] = peak_rss_mb()
+    window.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark editor latency end to end, headless")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--files", type=int, default=50, help="files to open")
+    parser.add_argument("--chars", type=int, default=10_000, help="characters to type")
+    parser.add_argument("--switches", type=int, default=100, help="tab switches")
+    parser.add_argument("--no-completion", action="store_true", help="type without jedi completion")
+    parser.add_argument("--keep", action="store_true", help="keep the generated workspace")
+    parser.add_argument("--output", type=Path, help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    temp = Path(tempfile.mkdtemp(prefix="editor_bench_"))
+    root = temp / "workspace"
+    home = temp / "home"
+    home.mkdir(parents=True)
+    os.environ["AUDITCODE_HOME"] = str(home)
+    # nothing that needs an Ollama server, so runs are comparable offline
+    write_json(home / "settings.json", {"chat_code_index": False, "inline_completion": False})
+    # the window loads its stylesheet and icons relative to the repo
+    os.chdir(Path(__file__).resolve().parent)
+
+    app = QApplication.instance() or QApplication(["editor_benchmark"])
+    try:
+        manifest = generate_workspace(root, args.files, args.seed)
+        if args.no_completion:
+            from editor import Editor
+            Editor.cursorPositionChangedCustom = lambda self, line, index: None
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "workspace": manifest,
+            "scenario": {
+                "files": args.files, "chars": args.chars, "switches": args.switches,
+                "completion": not args.no_completion,
+            },
+            "results": benchmark(app, root, args),
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        args.output.write_text(out + "\n")
+    else:
+        print(out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,22 +7,100 @@ from PyQt5.QtWidgets import (
     QLineEdit,
     QSizePolicy,
     QMessageBox,
-    QMenu
+    QMenu,
+    QFileIconProvider,
+    QCheckBox
 )
-from PyQt5.QtCore import Qt, QDir, QModelIndex, QPoint
+from PyQt5.QtCore import Qt, QDir, QModelIndex, QPoint, QFileInfo, QSortFilterProxyModel
 from PyQt5.QtGui import QFont, QIcon, QDropEvent, QDragEnterEvent
 
 from pathlib import Path
-import shutil
 import os
 import subprocess
+import sys
 
-from editor import Editor
+from file_operations import FileOperation, unique_path
 
 if TYPE_CHECKING:
     from main import MainWindow
 
 
+# directories never shown in the tree, hidden before the model fetches them
+IGNORED_DIRS = {
+    ".git", ".svn", ".hg", ".bzr", ".idea", "__pycache__",
+    ".mypy_cache", ".pytest_cache", ".ruff_cache", ".tox", ".nox", "node_modules",
+}
+
+
+class FastIconProvider(QFileIconProvider):
+    """Same icon for every file and folder, skips the per file OS icon lookup"""
+
+    def __init__(self):
+        super(FastIconProvider, self).__init__()
+        self.setOptions(QFileIconProvider.DontUseCustomDirectoryIcons)
+        self.folder_icon = super().icon(QFileIconProvider.Folder)
+        self.file_icon = super().icon(QFileIconProvider.File)
+
+    def icon(self, info):
+        if isinstance(info, QFileInfo):
+            return self.folder_icon if info.isDir() else self.file_icon
+        return super().icon(info)
+
+
+class TreeFilterProxy(QSortFilterProxyModel):
+    """
+    Hides ignored directories and shows big directories `batch_size` rows at a time.
+    The tree asks for more through canFetchMore/fetchMore, a folder only gets more
+    rows once its last shown row is on screen, so when the user scrolls down to it.
+    Qt's views only ask for the root, FileManager.reveal_more asks for expanded folders.
+    """
+
+    def __init__(self, batch_size=1000, parent=None):
+        super(TreeFilterProxy, self).__init__(parent)
+        self.batch_size = batch_size
+        # directory node (internalId of its source index) -> number of rows revealed so far
+        self.limits: dict[int, int] = {}
+        # set by the view, whether a proxy index is on screen
+        self.on_screen = None
+        self.setDynamicSortFilter(False)
+
+    def limit(self, source_parent: QModelIndex) -> int:
+        return self.limits.get(source_parent.internalId(), self.batch_size)
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        if source_row >= self.limit(source_parent):
+            return False
+        model: QFileSystemModel = self.sourceModel()
+        index = model.index(source_row, 0, source_parent)
+        return not (model.fileName(index) in IGNORED_DIRS and model.isDir(index))
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        source_parent = self.mapToSource(parent)
+        model = self.sourceModel()
+        if model.canFetchMore(source_parent):
+            return True
+        if model.rowCount(source_parent) <= self.limit(source_parent):
+            return False
+        if self.on_screen is None:
+            return True
+        return self.on_screen(self.index(self.rowCount(parent) - 1, 0, parent))
+
+    def fetchMore(self, parent: QModelIndex):
+        source_parent = self.mapToSource(parent)
+        model: QFileSystemModel = self.sourceModel()
+        if model.canFetchMore(source_parent):
+            model.fetchMore(source_parent)
+            return
+        if not self.canFetchMore(parent):
+            return
+        limit = self.limit(source_parent)
+        revealed = min(limit + self.batch_size, model.rowCount(source_parent))
+        self.limits[source_parent.internalId()] = revealed
+        # rows past a limit are turned down first thing, so refiltering stays cheap
+        # and the proxy inserts just the newly accepted rows
+        self.invalidateFilter()
+
+
 # UPDATED EP 8
 class FileManager(QTreeView):
     def __init__(self, tab_view, set_new_tab=None, main_window=None):
@@ -40,6 +118,9 @@ class FileManager(QTreeView):
         self.manager_font = QFont("FiraCode", 13)
         
         self.model: QFileSystemModel = QFileSystemModel()
+        # the model does not own its icon provider, keep a reference
+        self.icon_provider = FastIconProvider()
+        self.model.setIconProvider(self.icon_provider)
         self.model.setRootPath(os.getcwd())
         # File system filters
         self.model.setFilter(
@@ -50,8 +131,14 @@ class FileManager(QTreeView):
         ### NEW
         self.setFocusPolicy(Qt.NoFocus)
         self.setFont(self.manager_font)
-        self.setModel(self.model)
-        self.setRootIndex(self.model.index(os.getcwd()))
+        # the view only ever sees the proxy, self.model stays the file system model
+        self.proxy = TreeFilterProxy(parent=self)
+        self.proxy.on_screen = self.on_screen
+        self.proxy.setSourceModel(self.model)
+        self.setModel(self.proxy)
+        self.setRootIndex(self.proxy.mapFromSource(self.model.index(os.getcwd())))
+        # every row has the same height, lets the tree skip measuring rows
+        self.setUniformRowHeights(True)
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setSelectionBehavior(QTreeView.SelectRows)
         self.setEditTriggers(QTreeView.EditTrigger.NoEditTriggers)
@@ -77,13 +164,41 @@ class FileManager(QTreeView):
         # enable file name editing
         self.itemDelegate().closeEditor.connect(self._on_closeEditor)
 
+        # the view only fetches more rows for the root, expanded folders are ours
+        self.verticalScrollBar().valueChanged.connect(self.reveal_more)
+        self.expanded.connect(self.reveal_more)
+
     def _on_closeEditor(self, editor: QLineEdit):
         if self.is_renaming:
             self.is_editing = False
             self.rename_file_with_index()
 
+    def on_screen(self, ix: QModelIndex) -> bool:
+        return ix.isValid() and self.viewport().rect().intersects(self.visualRect(ix))
+
+    def reveal_more(self):
+        """Next batch for an expanded folder whose last shown row is on screen"""
+        root = self.rootIndex()
+        height = self.viewport().height()
+        ix = self.indexAt(QPoint(0, 0))
+        while ix.isValid() and self.visualRect(ix).top() < height:
+            parent = ix.parent()
+            if (parent.isValid() and parent != root and ix.row() == self.proxy.rowCount(parent) - 1
+                    and self.proxy.canFetchMore(parent)):
+                self.proxy.fetchMore(parent)
+                return
+            ix = self.indexBelow(ix)
+
+    def source_index(self, ix: QModelIndex) -> QModelIndex:
+        """Map a view index to the file system model"""
+        return self.proxy.mapToSource(ix)
+
+    def set_root_path(self, path: str):
+        self.model.setRootPath(path)
+        self.setRootIndex(self.proxy.mapFromSource(self.model.index(path)))
+
     def tree_view_clicked(self, index: QModelIndex):
-        path = self.model.filePath(index)
+        path = self.model.filePath(self.source_index(index))
         f = Path(path)
         if f.is_file():
             self.set_new_tab(f)
@@ -136,59 +251,39 @@ class FileManager(QTreeView):
         if self.previous_rename_name == new_name:
             return
         
-        for editor in self.tab_view.findChildren(Editor):
-            if editor.path.name == self.previous_rename_name:
-                editor.path = editor.path.parent / new_name
-                editor_index = self.tab_view.indexOf(editor)
-                prev_tab_name = self.tab_view.tabText(editor_index)
-                new_tab_name = "*"+new_name if prev_tab_name.startswith("*") else new_name # add star on new tab name if file was unsaved
-                self.tab_view.setTabText(
-                    self.tab_view.indexOf(editor), new_tab_name 
-                )
-                if self.main_window.tab_view.currentWidget() == editor:
-                    self.main_window.setWindowTitle(f"{new_tab_name} - {self.main_window.app_name}")
-                self.tab_view.repaint()
-                editor.full_path = editor.path.absolute()
-                self.main_window.current_file = editor.path
-                break
+        # open tabs are found by path, renaming a folder moves every tab inside it
+        new_path = Path(self.model.filePath(self.current_edit_index))
+        self.main_window.path_moved(new_path.parent / self.previous_rename_name, new_path)
+        self.tab_view.repaint()
 
     def action_rename(self, ix: QModelIndex):
         # UPDATED EP 8
         self.edit(ix)
-        self.previous_rename_name = self.model.fileName(ix)
+        self.previous_rename_name = self.model.fileName(self.source_index(ix))
         self.is_renaming = True
-        self.current_edit_index = ix
-
-    def delete_path(self, path: Path):
-        """delete file or folder with path"""
-        if path.is_dir():
-            shutil.rmtree(path)
-        else:
-            path.unlink()
+        self.current_edit_index = self.source_index(ix)
 
     def action_delete(self, ix):
         # check if selection is more
-        file_name = self.model.fileName(ix)
+        file_name = self.model.fileName(self.source_index(ix))
         dialog = self.show_dialog(
             "Delete", f"Are you sure you want to delete {file_name}?"
         )
         if dialog == QMessageBox.Yes:
             if self.selectionModel().hasSelection():
-                for i in self.selectionModel().selectedRows():
-                    path = Path(self.model.filePath(i))
-                    self.delete_path(path)
-                    for editor in self.tab_view.findChildren(Editor):
-                        if editor.path.name == path.name:
-                            self.tab_view.removeTab(
-                                self.tab_view.indexOf(editor)
-                            )
+                # deleted in the background, open tabs are closed when the job is done
+                operations = [
+                    FileOperation(FileOperation.DELETE, Path(self.model.filePath(self.source_index(i))))
+                    for i in self.selectionModel().selectedRows()
+                ]
+                self.main_window.file_operations.submit(operations, "Deleting")
 
     def action_new_file(self, ix: QModelIndex):
         # UPDATED EP 9
         root_path = self.model.rootPath()
-        if ix.column() != -1 and self.model.isDir(ix):
+        if ix.column() != -1 and self.model.isDir(self.source_index(ix)):
             self.expand(ix)
-            root_path = self.model.filePath(ix)
+            root_path = self.model.filePath(self.source_index(ix))
             
         # find file with name "file" in tree view
         f = Path(root_path) / "file"
@@ -199,7 +294,7 @@ class FileManager(QTreeView):
         f.touch()
         
         idx = self.model.index(str(f.absolute()))
-        self.edit(idx)
+        self.edit(self.proxy.mapFromSource(idx))
 
     def action_new_folder(self):
         f = Path(self.model.rootPath()) / "New Folder"
@@ -207,14 +302,14 @@ class FileManager(QTreeView):
         while f.exists():
             f = Path(f.parent / f"New Folder{count}")
             count += 1
-        idx = self.model.mkdir(self.rootIndex(), f.name)
+        idx = self.model.mkdir(self.source_index(self.rootIndex()), f.name)
         # edit that index
-        self.edit(idx)
+        self.edit(self.proxy.mapFromSource(idx))
 
     # UPDATED EP 9
     def action_open_in_file_manager(self, ix: QModelIndex):
-        path = os.path.abspath(self.model.filePath(ix))
-        is_dir = self.model.isDir(ix)
+        path = os.path.abspath(self.model.filePath(self.source_index(ix)))
+        is_dir = self.model.isDir(self.source_index(ix))
         if os.name == 'nt':
             # Windows
             if is_dir:
@@ -235,30 +330,77 @@ class FileManager(QTreeView):
         else:
             raise OSError(f'Unsupported OS: {os.name}')
 
+    def resolve_conflict(self, dst: Path, state: dict) -> str:
+        """Ask what to do with an existing destination, returns 'replace', 'keep' or 'skip'"""
+        if state.get("apply_all"):
+            return state["choice"]
+
+        dialog = QMessageBox(self)
+        dialog.setFont(self.manager_font)
+        dialog.setWindowTitle("File Exists")
+        dialog.setWindowIcon(QIcon("./icons/close-icon.svg"))
+        dialog.setText(f"{dst.name} already exists in {dst.parent.name}.")
+        replace_btn = dialog.addButton("Replace", QMessageBox.AcceptRole)
+        keep_btn = dialog.addButton("Keep Both", QMessageBox.AcceptRole)
+        dialog.addButton("Skip", QMessageBox.RejectRole)
+        apply_all = QCheckBox("Apply to all")
+        dialog.setCheckBox(apply_all)
+        dialog.setIcon(QMessageBox.Warning)
+        dialog.exec_()
+
+        clicked = dialog.clickedButton()
+        if clicked == replace_btn:
+            choice = "replace"
+        elif clicked == keep_btn:
+            choice = "keep"
+        else:
+            choice = "skip"
+        if apply_all.isChecked():
+            state["apply_all"] = True
+            state["choice"] = choice
+        return choice
+
+    def plan_operation(self, kind: str, src: Path, dst: Path, state: dict):
+        """FileOperation for src -> dst after conflict handling, None to skip it"""
+        if dst.resolve() == src.resolve() or dst.resolve().is_relative_to(src.resolve()):
+            return None # dropped onto itself
+        if not dst.exists():
+            return FileOperation(kind, src, dst)
+
+        choice = self.resolve_conflict(dst, state)
+        if choice == "skip":
+            return None
+        if choice == "keep":
+            return FileOperation(kind, src, unique_path(dst))
+        return FileOperation(kind, src, dst, replace=True)
+
     # item drop
     def dropEvent(self, e: QDropEvent) -> None:
         # UPDATED EP 9
-        """Drop event for tree view"""
-        root_path = Path(self.model.rootPath())
+        """Drop event for tree view, folders are copied and files moved in the background"""
         if e.mimeData().hasUrls():
+            target = Path(self.model.rootPath())
+            idx: QModelIndex = self.indexAt(e.pos())
+            if idx.column() != -1:
+                target = Path(self.model.filePath(self.source_index(idx)))
+                if not target.is_dir():
+                    target = target.parent
+
+            state = {}
+            operations = []
             for url in e.mimeData().urls():
                 path = Path(url.toLocalFile())
-                if path.is_dir():
-                    shutil.copytree(path, root_path / path.name)
-                else:
-                    if root_path.samefile(self.model.rootPath()):
-                        idx: QModelIndex = self.indexAt(e.pos())
-                        if idx.column() == -1:
-                            shutil.move(path, root_path / path.name)
-                        else:
-                            folder_path = Path(self.model.filePath(idx))
-                            shutil.move(path, folder_path / path.name)
-                    else:
-                        shutil.copy(path, root_path / path.name)
-                        
-        e.accept()
+                kind = FileOperation.COPY if path.is_dir() else FileOperation.MOVE
+                op = self.plan_operation(kind, path, target / path.name, state)
+                if op is not None:
+                    operations.append(op)
+            if operations:
+                self.main_window.file_operations.submit(operations, f"Dropping into {target.name}")
 
-        return super().dropEvent(e)
+        # the model would run its own synchronous copy, so the base class is skipped
+        e.accept()
+        self.setState(QAbstractItemView.NoState)
+        self.viewport().update()
 
     def dragEnterEvent(self, e: QDragEnterEvent) -> None:
         """Drag enter event for tree view"""
@@ -0,0 +1,203 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+import itertools
+import os
+import queue
+import shutil
+import threading
+
+
+class FileOperation:
+    """One copy, move or delete of a file or folder"""
+    COPY = "copy"
+    MOVE = "move"
+    DELETE = "delete"
+
+    def __init__(self, kind: str, src: Path, dst: Path = None, replace=False):
+        self.kind = kind
+        self.src = Path(src)
+        self.dst = Path(dst) if dst is not None else None
+        # remove an existing destination first instead of merging into it
+        self.replace = replace
+
+    def __repr__(self):
+        return f"FileOperation({self.kind}, {self.src}, {self.dst})"
+
+
+class FileJob:
+    """Operations queued together, e.g. everything from one drop"""
+    _ids = itertools.count(1)
+
+    def __init__(self, operations: list[FileOperation], title: str):
+        self.id = next(self._ids)
+        self.operations = operations
+        self.title = title
+        self.cancelled = threading.Event()
+        self.done: list[FileOperation] = []
+        self.errors: list[str] = []
+
+
+def unique_path(path: Path) -> Path:
+    """path, or 'name (n).ext' next to it when it already exists"""
+    candidate = path
+    count = 1
+    while candidate.exists():
+        candidate = path.with_name(f"{path.stem} ({count}){path.suffix}")
+        count += 1
+    return candidate
+
+
+class FileOperationQueue(QThread):
+    """
+    Runs file jobs on a worker thread, one job at a time in the order they were
+    queued. The thread starts with the first job and lives until stop(). Files
+    inside a folder copy are copied in parallel. Signals are emitted from the
+    worker thread and reach GUI slots through queued connections.
+    """
+    # job id, title, done, total
+    progress = pyqtSignal(int, str, int, int)
+    # job, finished without being cancelled
+    job_finished = pyqtSignal(object, bool)
+
+    def __init__(self, max_workers=None):
+        super(FileOperationQueue, self).__init__(None)
+        self.jobs = queue.Queue()
+        self.current_job: FileJob = None
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 4)
+
+    def submit(self, operations: list[FileOperation], title: str) -> FileJob:
+        job = FileJob(operations, title)
+        self.jobs.put(job)
+        if not self.isRunning():
+            self.start()
+        return job
+
+    def cancel_all(self):
+        """Cancel the running job and everything still waiting"""
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                continue
+            job.cancelled.set()
+            self.job_finished.emit(job, False)
+        job = self.current_job
+        if job is not None:
+            job.cancelled.set()
+
+    def is_busy(self) -> bool:
+        return self.current_job is not None or not self.jobs.empty()
+
+    def stop(self):
+        """Cancel everything and end the worker thread, call before the app quits"""
+        self.cancel_all()
+        if self.isRunning():
+            self.jobs.put(None)
+            self.wait()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            self.current_job = job
+            self.run_job(job)
+            self.current_job = None
+            self.job_finished.emit(job, not job.cancelled.is_set())
+
+    def run_job(self, job: FileJob):
+        # expand every operation into single file steps so progress is per file
+        steps = []
+        for op in job.operations:
+            try:
+                steps.append((op, self.plan(op)))
+            except OSError as err:
+                job.errors.append(f"{op.src.name}: {err}")
+
+        total = sum(len(files) for _, files in steps)
+        done = 0
+        self.progress.emit(job.id, job.title, done, total)
+        for op, files in steps:
+            if job.cancelled.is_set():
+                return
+            try:
+                done = self.execute(job, op, files, done, total)
+                if not job.cancelled.is_set():
+                    job.done.append(op)
+            except OSError as err:
+                job.errors.append(f"{op.src.name}: {err}")
+
+    def plan(self, op: FileOperation) -> list:
+        """List the files an operation touches"""
+        if op.kind == FileOperation.MOVE:
+            return [(op.src, op.dst)]
+        if not op.src.is_dir() or op.src.is_symlink():
+            return [(op.src, op.dst)]
+        files = []
+        for root, _, names in os.walk(op.src):
+            for name in names:
+                src = Path(root) / name
+                dst = op.dst / src.relative_to(op.src) if op.dst is not None else None
+                files.append((src, dst))
+        return files
+
+    def execute(self, job: FileJob, op: FileOperation, files: list, done: int, total: int) -> int:
+        if op.replace and op.dst is not None and op.dst.exists():
+            self.delete_tree(op.dst)
+
+        if op.kind == FileOperation.MOVE:
+            # a rename on the same drive, falls back to copy and delete across drives
+            shutil.move(str(op.src), str(op.dst))
+            done += 1
+            self.progress.emit(job.id, job.title, done, total)
+        elif op.kind == FileOperation.COPY:
+            if op.src.is_dir():
+                for root, _, _ in os.walk(op.src):
+                    target = op.dst / Path(root).relative_to(op.src)
+                    target.mkdir(parents=True, exist_ok=True)
+            done = self.copy_files(job, files, done, total)
+        elif op.kind == FileOperation.DELETE:
+            for src, _ in files:
+                if job.cancelled.is_set():
+                    return done
+                src.unlink()
+                done += 1
+                self.progress.emit(job.id, job.title, done, total)
+            if op.src.is_dir() and not job.cancelled.is_set():
+                self.delete_tree(op.src)
+        return done
+
+    def copy_files(self, job: FileJob, files: list, done: int, total: int) -> int:
+        if len(files) == 1:
+            shutil.copy2(files[0][0], files[0][1])
+            self.progress.emit(job.id, job.title, done + 1, total)
+            return done + 1
+
+        def copy(src, dst):
+            if job.cancelled.is_set():
+                return False
+            shutil.copy2(src, dst)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(copy, src, dst) for src, dst in files]
+            for future in as_completed(futures):
+                try:
+                    copied = future.result()
+                except OSError as err:
+                    job.errors.append(str(err))
+                    continue
+                if copied:
+                    done += 1
+                    self.progress.emit(job.id, job.title, done, total)
+        return done
+
+    def delete_tree(self, path: Path):
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
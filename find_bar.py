@@ -0,0 +1,513 @@
+from typing import TYPE_CHECKING
+
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QKeyEvent
+from PyQt5.QtWidgets import QFrame, QHBoxLayout, QVBoxLayout, QLineEdit, QLabel, QPushButton
+from PyQt5.Qsci import QsciScintilla
+
+from array import array
+from bisect import bisect_left
+import re
+import time
+
+from line_operations import document_bytes
+
+if TYPE_CHECKING:
+    from editor import Editor
+
+# indicator 0 is the squiggle for problems
+FIND_INDICATOR = 1
+FIND_COLOR = QColor("#e5c07b")
+# bytes matched per step, a step is never split so it must stay well below a frame
+# even when nearly every line matches
+CHUNK_BYTES = 16 * 1024
+# a regex match starting in a chunk may run this far into the next one
+REGEX_OVERLAP = 4096
+# bytes before a chunk the regex can look at, for \b, ^ and lookbehind
+LOOKBEHIND = 256
+# time spent matching per timer tick
+SLICE_SECONDS = 0.008
+
+
+def compile_query(text: str, case=False, regex=False, word=False):
+    """bytes pattern for the query, raises re.error for a broken regex"""
+    pattern = text if regex else re.escape(text)
+    if word:
+        pattern = rf"\b(?:{pattern})\b"
+    flags = re.MULTILINE | (0 if case else re.IGNORECASE)
+    return re.compile(pattern.encode("utf-8"), flags)
+
+
+class FindSearch(QObject):
+    """
+    All matches of a query in one editor.
+
+    The document bytes are matched where Scintilla keeps them, a few chunks
+    per timer tick: first the lines on screen, then down to the end of the
+    file, then from the top back to the screen. Matches are kept in sorted
+    arrays of start and length, so next/previous is a bisect. Editing the
+    document starts the search over.
+
+    Matches below where the search began and matches above it are kept in
+    separate arrays, that way both only ever grow at the end.
+
+    Only the matches on and around the screen get the indicator, the rest
+    when scrolled to. After any indicator change QScintilla's next repaint
+    takes time that grows with the file, filling all of a large file's
+    matches would make every repaint during the search slow.
+    """
+    # matches so far, True once the whole document is searched
+    updated = pyqtSignal(int, bool)
+
+    def __init__(self, editor: "Editor"):
+        super(FindSearch, self).__init__(editor)
+        self.editor = editor
+        self.pattern = None
+        # matches from origin to the end of the document
+        self.starts = array("q")
+        self.lengths = array("q")
+        # matches from the top of the document to origin
+        self.wrapped_starts = array("q")
+        self.wrapped_lengths = array("q")
+        # (start, end) ranges left to search, in order, and where the search began
+        self.chunks: list[tuple[int, int]] = []
+        self.origin = 0
+        # bytes searched so far, counted from origin around the end of the document
+        self.searched = 0
+        self.length = 0
+        # (start, end) of the part of the document that has indicators
+        self.filled = (0, 0)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.step)
+        # edits move the matches, search again once typing pauses
+        self.restart_timer = QTimer(self)
+        self.restart_timer.setSingleShot(True)
+        self.restart_timer.setInterval(150)
+        self.restart_timer.timeout.connect(self.restart)
+        self.editor.textChanged.connect(self.text_changed)
+        self.editor.SCN_UPDATEUI.connect(self.view_changed)
+
+        editor.indicatorDefine(QsciScintilla.StraightBoxIndicator, FIND_INDICATOR)
+        editor.setIndicatorForegroundColor(FIND_COLOR, FIND_INDICATOR)
+        editor.SendScintilla(QsciScintilla.SCI_INDICSETALPHA, FIND_INDICATOR, 70)
+        editor.SendScintilla(QsciScintilla.SCI_INDICSETOUTLINEALPHA, FIND_INDICATOR, 160)
+        editor.SendScintilla(QsciScintilla.SCI_INDICSETUNDER, FIND_INDICATOR, True)
+
+    @property
+    def done(self) -> bool:
+        return not self.chunks and not self.restart_timer.isActive()
+
+    def count(self) -> int:
+        return len(self.wrapped_starts) + len(self.starts)
+
+    def match(self, i: int) -> tuple[int, int]:
+        """(start, length) of match i, in document order"""
+        wrapped = len(self.wrapped_starts)
+        if i < wrapped:
+            return self.wrapped_starts[i], self.wrapped_lengths[i]
+        return self.starts[i - wrapped], self.lengths[i - wrapped]
+
+    def index(self, pos: int) -> int:
+        """Index of the first match starting at or after pos"""
+        if pos < self.origin:
+            return bisect_left(self.wrapped_starts, pos)
+        return len(self.wrapped_starts) + bisect_left(self.starts, pos)
+
+    def set_pattern(self, pattern):
+        """Search for a compiled bytes pattern, None clears the matches"""
+        self.pattern = pattern
+        self.restart()
+
+    def clear(self):
+        self.set_pattern(None)
+
+    def text_changed(self):
+        if self.pattern is not None:
+            self.timer.stop()
+            self.restart_timer.start()
+
+    def restart(self):
+        self.restart_timer.stop()
+        self.timer.stop()
+        self.length = self.editor.SendScintilla(QsciScintilla.SCI_GETLENGTH)
+        self.editor.SendScintilla(QsciScintilla.SCI_SETINDICATORCURRENT, FIND_INDICATOR)
+        self.editor.SendScintilla(QsciScintilla.SCI_INDICATORCLEARRANGE, 0, self.length)
+        self.starts = array("q")
+        self.lengths = array("q")
+        self.wrapped_starts = array("q")
+        self.wrapped_lengths = array("q")
+        self.chunks = []
+        self.searched = 0
+        self.filled = (0, 0)
+        if self.pattern is None:
+            self.origin = 0
+            self.updated.emit(0, True)
+            return
+        start, end = self.visible_range()
+        self.origin = start
+        self.filled = self.fill_range(start, end)
+        for first, last in ((start, end), (end, self.length), (0, start)):
+            for pos in range(first, last, CHUNK_BYTES):
+                self.chunks.append((pos, min(pos + CHUNK_BYTES, last)))
+        self.chunks.reverse()
+        self.step()
+
+    def visible_range(self) -> tuple[int, int]:
+        send = self.editor.SendScintilla
+        first = send(QsciScintilla.SCI_GETFIRSTVISIBLELINE)
+        lines = send(QsciScintilla.SCI_LINESONSCREEN)
+        first_line = send(QsciScintilla.SCI_DOCLINEFROMVISIBLE, first)
+        last_line = send(QsciScintilla.SCI_DOCLINEFROMVISIBLE, first + lines)
+        return (send(QsciScintilla.SCI_POSITIONFROMLINE, first_line),
+                send(QsciScintilla.SCI_GETLINEENDPOSITION, last_line))
+
+    def fill_range(self, start: int, end: int) -> tuple[int, int]:
+        """The range to highlight for the screen at [start, end), a screen above and below it"""
+        page = end - start
+        return max(start - page, 0), min(end + page, self.length)
+
+    def view_changed(self, updated: int):
+        if self.pattern is None or self.restart_timer.isActive():
+            return
+        start, end = self.visible_range()
+        if self.filled[0] <= start and end <= self.filled[1]:
+            return
+        send = self.editor.SendScintilla
+        send(QsciScintilla.SCI_SETINDICATORCURRENT, FIND_INDICATOR)
+        send(QsciScintilla.SCI_INDICATORCLEARRANGE, self.filled[0], self.filled[1] - self.filled[0])
+        self.filled = self.fill_range(start, end)
+        i = self.index(self.filled[0])
+        count = self.count()
+        while i < count:
+            match_start, length = self.match(i)
+            if match_start >= self.filled[1]:
+                break
+            send(QsciScintilla.SCI_INDICATORFILLRANGE, match_start, length)
+            i += 1
+
+    def step(self):
+        """Search chunks until the time slice is used up"""
+        deadline = time.perf_counter() + SLICE_SECONDS
+        self.editor.SendScintilla(QsciScintilla.SCI_SETINDICATORCURRENT, FIND_INDICATOR)
+        while self.chunks and time.perf_counter() < deadline:
+            self.search_chunk()
+        if self.chunks:
+            self.timer.start()
+        else:
+            self.timer.stop()
+        self.updated.emit(self.count(), not self.chunks)
+
+    def search_chunk(self):
+        start, end = self.chunks.pop()
+        if start >= self.origin:
+            starts, lengths = self.starts, self.lengths
+        else:
+            starts, lengths = self.wrapped_starts, self.wrapped_lengths
+        fill_start, fill_end = self.filled
+        for match_start, match_end in self.matches(start, end):
+            starts.append(match_start)
+            lengths.append(match_end - match_start)
+            if fill_start <= match_start < fill_end:
+                self.editor.SendScintilla(QsciScintilla.SCI_INDICATORFILLRANGE, match_start, match_end - match_start)
+        self.searched += end - start
+
+    def matches(self, start: int, end: int):
+        """(start, end) of the matches that start in [start, end)"""
+        before = min(start, LOOKBEHIND)
+        after = min(self.length - end, REGEX_OVERLAP)
+        view = document_bytes(self.editor, start - before, end + after)
+        for match in self.pattern.finditer(view, before, len(view)):
+            if match.start() >= before + end - start:
+                break
+            # an empty match would highlight nothing and stop next() on the spot
+            if match.end() > match.start():
+                yield start - before + match.start(), start - before + match.end()
+
+    def finish(self):
+        """Search the rest of the document right away"""
+        if self.restart_timer.isActive():
+            self.restart()
+        while self.chunks:
+            self.step()
+
+    def rotated(self, pos: int) -> int:
+        """Distance from where the search began to pos, going around the end"""
+        return pos - self.origin if pos >= self.origin else pos + self.length - self.origin
+
+    def next_match(self, pos: int) -> int:
+        """Index of the first match starting at or after pos, wrapping around, -1 if none"""
+        if self.restart_timer.isActive():
+            self.restart()
+        while True:
+            count = self.count()
+            i = self.index(pos)
+            if i == count:
+                i = 0
+            if not self.chunks:
+                return i if count else -1
+            # only trust the match when everything between pos and it was searched
+            if count and self.rotated(pos) <= self.rotated(self.match(i)[0]) < self.searched:
+                return i
+            self.search_chunk()
+            self.updated.emit(self.count(), not self.chunks)
+
+    def previous_match(self, pos: int) -> int:
+        """Index of the last match starting before pos, wrapping around, -1 if none"""
+        if self.restart_timer.isActive():
+            self.restart()
+        while True:
+            count = self.count()
+            i = self.index(pos) - 1
+            if not self.chunks:
+                return i % count if count else -1
+            if i >= 0 and self.rotated(self.match(i)[0]) < self.rotated(pos) <= self.searched:
+                return i
+            self.search_chunk()
+            self.updated.emit(self.count(), not self.chunks)
+
+    def match_at(self, start: int, end: int) -> int:
+        """Index of the match that is exactly [start, end), -1 if it is not one"""
+        i = self.index(start)
+        if i < self.count() and self.match(i) == (start, end - start):
+            return i
+        return -1
+
+    def select(self, i: int):
+        start, length = self.match(i)
+        self.editor.SendScintilla(QsciScintilla.SCI_SETSEL, start, start + length)
+        self.editor.SendScintilla(QsciScintilla.SCI_SCROLLRANGE, start + length, start)
+
+    def replacement(self, start: int, end: int, template: bytes) -> bytes:
+        """template with the groups of the regex match at [start, end) filled in, re.error for a broken template"""
+        first = max(start - LOOKBEHIND, 0)
+        last = min(end + LOOKBEHIND, self.editor.SendScintilla(QsciScintilla.SCI_GETLENGTH))
+        # a copy, expand() only works on bytes
+        match = self.pattern.match(bytes(document_bytes(self.editor, first, last)), start - first)
+        if match is None or match.end() != end - first:
+            return template
+        return match.expand(template)
+
+    def replace(self, i: int, text: str, regex=False):
+        start, length = self.match(i)
+        data = text.encode("utf-8")
+        if regex:
+            data = self.replacement(start, start + length, data)
+        self.editor.SendScintilla(QsciScintilla.SCI_SETTARGETRANGE, start, start + length)
+        self.editor.SendScintilla(QsciScintilla.SCI_REPLACETARGET, len(data), data)
+        return start + len(data)
+
+    def replace_all(self, text: str, regex=False) -> int:
+        """Replace every match as one undo step, returns how many were replaced"""
+        self.finish()
+        count = self.count()
+        if not count:
+            return 0
+        if regex:
+            # a broken template raises here, before anything is replaced
+            start, length = self.match(count - 1)
+            self.replacement(start, start + length, text.encode("utf-8"))
+        self.editor.beginUndoAction()
+        try:
+            # from the end, so the offsets of the matches left are still right
+            for i in range(count - 1, -1, -1):
+                self.replace(i, text, regex)
+        finally:
+            self.editor.endUndoAction()
+            self.restart()
+        return count
+
+
+class FindBar(QFrame):
+    """Find and replace box in the top right corner of an editor"""
+
+    def __init__(self, editor: "Editor"):
+        super(FindBar, self).__init__(editor)
+        self.editor = editor
+        self.search = FindSearch(editor)
+        self.search.updated.connect(self.update_count)
+        self.setObjectName("find_bar")
+        self.setStyleSheet("""
+            QFrame#find_bar { background-color: #21252b; border: 1px solid #333641; border-radius: 4px; }
+            QLineEdit { min-width: 220px; }
+            QPushButton { color: #D3D3D3; background: transparent; border: none; padding: 2px 5px; }
+            QPushButton:checked { background-color: #3e4451; border-radius: 3px; }
+            QLabel { color: #D3D3D3; background-color: #21252b; border: none; min-width: 80px; }
+        """)
+
+        self.find_input = QLineEdit()
+        self.find_input.setPlaceholderText("Find")
+        self.find_input.textChanged.connect(self.query_changed)
+        self.find_input.installEventFilter(self)
+        self.case_btn = self.tool_button("Aa", "Match case", checkable=True)
+        self.regex_btn = self.tool_button(".*", "Regular expression", checkable=True)
+        self.word_btn = self.tool_button("W", "Whole word", checkable=True)
+        self.count_lbl = QLabel("")
+        # opaque, so updating the counter does not repaint the editor below it
+        self.count_lbl.setAttribute(Qt.WA_OpaquePaintEvent)
+        prev_btn = self.tool_button("↑", "Previous match (Shift+Enter)")
+        prev_btn.clicked.connect(self.find_previous)
+        next_btn = self.tool_button("↓", "Next match (Enter)")
+        next_btn.clicked.connect(self.find_next)
+        close_btn = self.tool_button("✕", "Close (Escape)")
+        close_btn.clicked.connect(self.close_bar)
+
+        self.replace_input = QLineEdit()
+        self.replace_input.setPlaceholderText("Replace")
+        self.replace_input.installEventFilter(self)
+        replace_btn = self.tool_button("Replace", "Replace this match")
+        replace_btn.clicked.connect(self.replace_current)
+        replace_all_btn = self.tool_button("All", "Replace all matches")
+        replace_all_btn.clicked.connect(self.replace_all)
+
+        find_row = QHBoxLayout()
+        find_row.setSpacing(2)
+        for w in (self.find_input, self.case_btn, self.regex_btn, self.word_btn, self.count_lbl,
+                  prev_btn, next_btn, close_btn):
+            find_row.addWidget(w)
+        self.replace_row = QFrame()
+        self.replace_row.setStyleSheet("border: none;")
+        replace_layout = QHBoxLayout(self.replace_row)
+        replace_layout.setContentsMargins(0, 0, 0, 0)
+        replace_layout.setSpacing(2)
+        replace_layout.addWidget(self.replace_input)
+        replace_layout.addWidget(replace_btn)
+        replace_layout.addWidget(replace_all_btn)
+        replace_layout.addStretch()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(6, 4, 6, 4)
+        layout.setSpacing(4)
+        layout.addLayout(find_row)
+        layout.addWidget(self.replace_row)
+        self.hide()
+
+    def tool_button(self, text: str, tip: str, checkable=False) -> QPushButton:
+        btn = QPushButton(text)
+        btn.setToolTip(tip)
+        btn.setCursor(Qt.PointingHandCursor)
+        btn.setFocusPolicy(Qt.NoFocus)
+        if checkable:
+            btn.setCheckable(True)
+            btn.toggled.connect(self.query_changed)
+        return btn
+
+    def open(self, replace=False):
+        selected = self.editor.selectedText()
+        if selected and "\n" not in selected and "\r" not in selected:
+            self.find_input.setText(selected)
+        self.replace_row.setVisible(replace)
+        self.show()
+        self.place()
+        self.raise_()
+        self.find_input.setFocus()
+        self.find_input.selectAll()
+        if self.search.pattern is None:
+            self.query_changed()
+
+    def place(self):
+        """Keep the bar in the top right corner, left of the scrollbar"""
+        self.adjustSize()
+        viewport = self.editor.viewport().geometry()
+        self.move(max(viewport.right() - self.width() - 10, 0), viewport.top())
+
+    def close_bar(self):
+        self.search.clear()
+        self.hide()
+        self.editor.setFocus()
+
+    def query_changed(self):
+        text = self.find_input.text()
+        if not text:
+            self.search.set_pattern(None)
+            return
+        try:
+            pattern = compile_query(text, self.case_btn.isChecked(), self.regex_btn.isChecked(),
+                                    self.word_btn.isChecked())
+        except re.error:
+            self.search.set_pattern(None)
+            self.count_lbl.setText("Invalid regex")
+            return
+        self.search.set_pattern(pattern)
+
+    def current(self) -> int:
+        start = self.editor.SendScintilla(QsciScintilla.SCI_GETSELECTIONSTART)
+        end = self.editor.SendScintilla(QsciScintilla.SCI_GETSELECTIONEND)
+        return self.search.match_at(start, end)
+
+    def update_count(self, count: int, done: bool):
+        self.count_lbl.setToolTip("")
+        if self.search.pattern is None:
+            self.count_lbl.setText("")
+        elif count == 0:
+            self.count_lbl.setText("No results" if done else "Searching")
+        else:
+            total = f"{count}" if done else f"{count}+"
+            i = self.current()
+            self.count_lbl.setText(f"{i + 1} of {total}" if i >= 0 else f"{total} matches")
+
+    def find_next(self):
+        if self.search.pattern is None:
+            return
+        i = self.search.next_match(self.editor.SendScintilla(QsciScintilla.SCI_GETSELECTIONEND))
+        if i >= 0:
+            self.search.select(i)
+        self.update_count(self.search.count(), self.search.done)
+
+    def find_previous(self):
+        if self.search.pattern is None:
+            return
+        i = self.search.previous_match(self.editor.SendScintilla(QsciScintilla.SCI_GETSELECTIONSTART))
+        if i >= 0:
+            self.search.select(i)
+        self.update_count(self.search.count(), self.search.done)
+
+    def replace_current(self):
+        if self.search.pattern is None:
+            return
+        if self.search.restart_timer.isActive():
+            self.search.restart()
+        i = self.current()
+        if i < 0:
+            # nothing selected yet, the first press only goes to the match
+            self.find_next()
+            return
+        try:
+            end = self.search.replace(i, self.replace_input.text(), self.regex_btn.isChecked())
+        except re.error as e:
+            self.invalid_replacement(e)
+            return
+        self.editor.SendScintilla(QsciScintilla.SCI_SETSEL, end, end)
+        self.search.restart()
+        self.find_next()
+
+    def replace_all(self):
+        if self.search.pattern is None:
+            return
+        try:
+            count = self.search.replace_all(self.replace_input.text(), self.regex_btn.isChecked())
+        except re.error as e:
+            self.invalid_replacement(e)
+            return
+        self.editor.main_window.statusBar().showMessage(f"Replaced {count} matches", 3000)
+
+    def invalid_replacement(self, error: re.error):
+        # \1 without a group or a stray backslash like C:\path, nothing was replaced
+        self.count_lbl.setText("Invalid replace")
+        self.count_lbl.setToolTip(str(error))
+
+    def eventFilter(self, obj, e) -> bool:
+        if isinstance(e, QKeyEvent) and e.type() == QKeyEvent.KeyPress:
+            if e.key() == Qt.Key_Escape:
+                self.close_bar()
+                return True
+            if e.key() in (Qt.Key_Return, Qt.Key_Enter):
+                if obj is self.replace_input:
+                    self.replace_current()
+                elif e.modifiers() & Qt.ShiftModifier:
+                    self.find_previous()
+                else:
+                    self.find_next()
+                return True
+        return super().eventFilter(obj, e)
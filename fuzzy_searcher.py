@@ -2,8 +2,17 @@ from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtWidgets import QListWidgetItem
 
 import os, re
+import threading
 from pathlib import Path
 
+from instrumentation import instrumentation
+
+
+def cache_key(path: str) -> str:
+    """Same key for Qt's forward slash paths and the watcher's native ones"""
+    return os.path.normcase(os.path.normpath(path))
+
+
 class SearchItem(QListWidgetItem):
     def __init__(self, name, full_path, lineno, end, line):
         self.name = name
@@ -25,10 +34,23 @@ class SearchItem(QListWidgetItem):
 class SearchWorker(QThread):
     # redefine finsihed
     finished = pyqtSignal(list)
+    # directories scanned from disk (not served from the cache) during a search
+    walked = pyqtSignal(list)
 
     def __init__(self):
         super(SearchWorker, self).__init__(None)
         self.items = []
+        # query options, defaults keep the original case insensitive regex search
+        self.case_sensitive = False
+        self.use_regex = True
+
+        # directory -> (sub directories, searchable files), kept until the
+        # workspace watcher reports a change in that directory
+        self.dir_cache: dict[str, tuple[list, list]] = {}
+        # directories the watcher gave up on, always listed from disk
+        self.uncached: set[str] = set()
+        self.cache_lock = threading.Lock()
+        self.exclude_files = set([".svg", ".png", ".exe", ".pyc", ".qm"])
 
     def walkdir(self, path, exclude_dirs: list, exclude_files: list):
         for root, dirs, files in os.walk(path, topdown=True):
@@ -36,6 +58,73 @@ class SearchWorker(QThread):
             files[:] = [f for f in files if Path(f).suffix not in exclude_files]
             yield root, dirs, files
 
+    def scan_dir(self, path):
+        """List one directory, returns (sub directories, non binary files)"""
+        subdirs, files = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirs.append(entry.name)
+                            continue
+                        if Path(entry.name).suffix in self.exclude_files or self.is_binary(entry.path):
+                            continue
+                    except OSError:
+                        continue
+                    files.append(entry.name)
+        except OSError:
+            pass
+        return subdirs, files
+
+    def walk_cached(self, path, exclude_dirs):
+        """Like walkdir but only directories missing from the cache touch the disk"""
+        scanned = []
+        stack = [path]
+        try:
+            while stack:
+                root = stack.pop()
+                key = cache_key(root)
+                with self.cache_lock:
+                    entry = self.dir_cache.get(key)
+                    cacheable = key not in self.uncached
+                if entry is None:
+                    entry = self.scan_dir(root)
+                    if cacheable:
+                        with self.cache_lock:
+                            self.dir_cache[key] = entry
+                        scanned.append(root)
+                subdirs, files = entry
+                yield root, files
+                stack.extend(os.path.join(root, d) for d in reversed(subdirs) if d not in exclude_dirs)
+        finally:
+            # also reached when the search stops early at its result limit
+            if scanned:
+                self.walked.emit(scanned)
+
+    def invalidate(self, changes):
+        """Drop cached listings touched by a workspace watcher ChangeSet"""
+        with self.cache_lock:
+            for path in changes.files:
+                self.dir_cache.pop(os.path.dirname(cache_key(path)), None)
+            for path in changes.dirs:
+                path = cache_key(path)
+                self.dir_cache.pop(path, None)
+                if not os.path.isdir(path):
+                    prefix = path + os.sep
+                    for key in [k for k in self.dir_cache if k.startswith(prefix)]:
+                        del self.dir_cache[key]
+
+    def forget(self, paths):
+        """Stop caching directories the workspace watcher dropped, no change in them would be seen"""
+        with self.cache_lock:
+            for path in paths:
+                key = cache_key(path)
+                self.uncached.add(key)
+                self.dir_cache.pop(key, None)
+
+    @instrumentation.timed("search.files")
     def search(self):
         debug = False
         self.items = []
@@ -43,36 +132,42 @@ class SearchWorker(QThread):
         exclude_dirs = set([".git", ".svn", ".hg", ".bzr", ".idea", "__pycache__", "venv"])
         if self.search_project:
             exclude_dirs.remove("venv")
-        exclude_files = set([".svg", ".png", ".exe", ".pyc", ".qm"])
-        for root, _, files in self.walkdir(current_path, exclude_dirs, exclude_files):
+
+        # compile once for the whole walk instead of once per file
+        pattern = self.search_text if self.use_regex else re.escape(self.search_text)
+        try:
+            r = re.compile(pattern, 0 if self.case_sensitive else re.IGNORECASE)
+        except re.error as e:
+            if debug:
+                print(e)
+            self.finished.emit(self.items)
+            return
+
+        for root, files in self.walk_cached(current_path, exclude_dirs):
             if len(self.items) > 5_000: # search limit
                 break
             for file_ in files:
                 full_path = os.path.join(root, file_)
-                if self.is_binary(full_path):
-                    continue
                 try:
                     with open(os.path.join(root, file_), "r", encoding="utf-8") as f:
-                        try:
-                            r = re.compile(self.search_text, re.IGNORECASE)
-                            for i, line in enumerate(f):
-                                if m := r.search(line):
-                                    fd = SearchItem(
-                                        file_,
-                                        full_path,
-                                        i,
-                                        m.end(),
-                                        line[m.start():].strip()[:50],
-                                    )
-                                    self.items.append(fd)
-                        except re.error as e:
-                            if debug:
-                                print(e)
+                        for i, line in enumerate(f):
+                            if m := r.search(line):
+                                fd = SearchItem(
+                                    file_,
+                                    full_path,
+                                    i,
+                                    m.end(),
+                                    line[m.start():].strip()[:50],
+                                )
+                                self.add_item(fd)
                 except UnicodeDecodeError:
                     print("Failed to open", file_)
                     continue
         self.finished.emit(self.items)
 
+    def add_item(self, item: SearchItem):
+        self.items.append(item)
+
     def run(self):
         self.search()
 
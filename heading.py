@@ -5,6 +5,8 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, QEvent, QSize
 from PyQt5.QtGui import QPixmap, QIcon, QImage
 
+import line_operations
+
 class MenuItems(QWidget):
 
     def __init__(self, main_window) -> None:
@@ -45,6 +47,9 @@ class MenuItems(QWidget):
         open_folder_action.setShortcut("Ctrl+K")
         open_folder_action.triggered.connect(self.main_window.open_folder)
 
+        export_trace = QAction("Export Trace", self)
+        export_trace.triggered.connect(self.main_window.export_trace)
+
         # Add the menu item to the menu
         file_menu.addAction(new_file)
         file_menu.addSeparator()
@@ -54,6 +59,7 @@ class MenuItems(QWidget):
         file_menu.addAction(save_file)
         file_menu.addAction(save_as)
         file_menu.addSeparator()
+        file_menu.addAction(export_trace)
 
         # Edit menu
         edit_menu = menu_bar.addMenu("Edit")
@@ -61,7 +67,44 @@ class MenuItems(QWidget):
         copy_action.setShortcut("Ctrl+C")
         copy_action.triggered.connect(self.main_window.copy)
 
+        find_action = QAction("Find", self)
+        find_action.setShortcut("Ctrl+F")
+        find_action.triggered.connect(lambda: self.main_window.find_in_file())
+
+        replace_action = QAction("Replace", self)
+        replace_action.setShortcut("Ctrl+H")
+        replace_action.triggered.connect(lambda: self.main_window.find_in_file(replace=True))
+
+        indent_action = QAction("Indent", self)
+        indent_action.setShortcut("Ctrl+]")
+        indent_action.triggered.connect(lambda: self.main_window.edit_lines(line_operations.indent))
+
+        dedent_action = QAction("Dedent", self)
+        dedent_action.setShortcut("Ctrl+[")
+        dedent_action.triggered.connect(lambda: self.main_window.edit_lines(line_operations.dedent))
+
+        sort_action = QAction("Sort Lines", self)
+        sort_action.triggered.connect(lambda: self.main_window.edit_lines(line_operations.sort_lines))
+
+        trim_action = QAction("Trim Trailing Whitespace", self)
+        trim_action.triggered.connect(
+            lambda: self.main_window.edit_lines(line_operations.trim_trailing_whitespace)
+        )
+
+        cursors_action = QAction("Add Cursors to Line Ends", self)
+        cursors_action.setShortcut("Shift+Alt+I")
+        cursors_action.triggered.connect(lambda: self.main_window.edit_lines(line_operations.cursors_on_lines))
+
         edit_menu.addAction(copy_action)
+        edit_menu.addSeparator()
+        edit_menu.addAction(find_action)
+        edit_menu.addAction(replace_action)
+        edit_menu.addSeparator()
+        edit_menu.addAction(indent_action)
+        edit_menu.addAction(dedent_action)
+        edit_menu.addAction(sort_action)
+        edit_menu.addAction(trim_action)
+        edit_menu.addAction(cursors_action)
 
         menu_bar.setMinimumHeight(40)
         self.lay.addWidget(menu_bar)
@@ -0,0 +1,330 @@
+from typing import TYPE_CHECKING
+
+from PyQt5.QtCore import QObject, QThread, QTimer, QRect, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QFontMetrics
+from PyQt5.Qsci import QsciScintilla
+
+from collections import OrderedDict
+import threading
+
+if TYPE_CHECKING:
+    from editor import Editor
+
+GHOST_COLOR = QColor("#5c6370")
+# style used for the annotation that shows the second and later ghost lines
+GHOST_STYLE = 250
+MAX_LINES = 8
+
+
+class CompletionRequest:
+    def __init__(self, prefix: str, suffix: str, pos: int):
+        self.prefix = prefix
+        self.suffix = suffix
+        # document position the completion is for
+        self.pos = pos
+        self.cancelled = threading.Event()
+
+
+def clean_completion(text: str) -> str:
+    """Cut the model output to something worth showing: no trailing blank lines, a few lines at most"""
+    lines = text.split("\n")
+    started = False
+    for i, line in enumerate(lines):
+        # after some code, a blank line usually ends the block the model was asked to finish
+        if started and not line.strip():
+            lines = lines[:i]
+            break
+        started = started or bool(line.strip())
+    return "\n".join(lines[:MAX_LINES]).rstrip()
+
+
+class InlineCompletionWorker(QThread):
+    """
+    Asks the model for code completions, one at a time. Only the newest
+    request matters: a new one cancels the one running and replaces the one
+    waiting. Shared by every editor, it owns one ollama.Client so the
+    connection is reused. `host` defaults to OLLAMA_HOST, point it at a mock
+    server in tests.
+    """
+    # request, completion text
+    completed = pyqtSignal(object, str)
+
+    def __init__(self, model="qwen2.5-coder:1.5b", host=None, keep_alive=None, max_tokens=64):
+        super(InlineCompletionWorker, self).__init__(None)
+        self.model = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self.options = {"num_predict": max_tokens, "temperature": 0}
+        self.condition = threading.Condition()
+        self.pending: CompletionRequest = None
+        self.current: CompletionRequest = None
+        self._stop = False
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import ollama
+            self._client = ollama.Client(host=self.host)
+        return self._client
+
+    def request(self, prefix: str, suffix: str, pos: int) -> CompletionRequest:
+        request = CompletionRequest(prefix, suffix, pos)
+        with self.condition:
+            self.cancel()
+            self.pending = request
+            self.condition.notify()
+        if not self.isRunning():
+            self.start()
+        return request
+
+    def cancel(self):
+        with self.condition:
+            for request in (self.pending, self.current):
+                if request is not None:
+                    request.cancelled.set()
+            self.pending = None
+
+    def stop(self):
+        with self.condition:
+            self.cancel()
+            self._stop = True
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self._stop:
+                    self.condition.wait()
+                if self._stop:
+                    return
+                request, self.pending = self.pending, None
+                self.current = request
+            try:
+                self.complete(request)
+            except Exception as e:
+                print("Inline completion error:", e)
+            with self.condition:
+                self.current = None
+
+    def complete(self, request: CompletionRequest):
+        if request.cancelled.is_set():
+            return
+        parts = []
+        # with a suffix Ollama uses the model's fill in the middle template
+        stream = self.client.generate(
+            model=self.model, prompt=request.prefix, suffix=request.suffix,
+            stream=True, keep_alive=self.keep_alive, options=self.options,
+        )
+        for chunk in stream:
+            if request.cancelled.is_set():
+                # dropping the connection stops the generation on the server
+                stream.close()
+                return
+            parts.append(chunk["response"])
+        text = clean_completion("".join(parts))
+        if text:
+            self.completed.emit(request, text)
+
+
+class InlineCompletion(QObject):
+    """
+    Ghost text suggestions for one editor.
+
+    Typing restarts a short timer, when it fires the text around the cursor is
+    sent to the worker, and any older request is cancelled. The first line of
+    a suggestion is painted after the cursor, further lines are an annotation
+    below it. Tab accepts, Escape dismisses, typing the suggested characters
+    keeps the rest of it. While a suggestion is shown, the one after it is
+    requested as if it was accepted, so Tab usually shows the next one at once.
+    """
+
+    def __init__(self, editor: "Editor", worker: InlineCompletionWorker, delay_ms=300,
+                 prefix_chars=3000, suffix_chars=1000):
+        super(InlineCompletion, self).__init__(editor)
+        self.editor = editor
+        self.worker = worker
+        self.prefix_chars = prefix_chars
+        self.suffix_chars = suffix_chars
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.request)
+        # the caret only moves past typed text after the change is reported,
+        # so edits are looked at once control is back in the event loop
+        self.edit_timer = QTimer(self)
+        self.edit_timer.setSingleShot(True)
+        self.edit_timer.setInterval(0)
+        self.edit_timer.timeout.connect(self.edited)
+        self.worker.completed.connect(self.completed)
+
+        self.pending: CompletionRequest = None
+        # request for what follows the shown suggestion, served when it is accepted
+        self.prefetched: CompletionRequest = None
+        # suggestion shown and the position it continues from
+        self.ghost = ""
+        self.anchor = -1
+        # position of the last edit, the timer only fires if the cursor stays there
+        self.typed_at = -1
+        self.accepting = False
+        # (prefix, suffix) -> completion of recent requests
+        self.cache: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def position(self) -> int:
+        return self.editor.SendScintilla(QsciScintilla.SCI_GETCURRENTPOS)
+
+    def context(self, pos: int) -> tuple[str, str]:
+        length = self.editor.SendScintilla(QsciScintilla.SCI_GETLENGTH)
+        # positions are bytes, so take a few more than chars and trim after decoding
+        start = max(0, pos - self.prefix_chars * 4)
+        end = min(length, pos + self.suffix_chars * 4)
+        prefix = bytes(self.editor.bytes(start, pos)).rstrip(b"\0").decode("utf-8", "ignore")
+        suffix = bytes(self.editor.bytes(pos, end)).rstrip(b"\0").decode("utf-8", "ignore")
+        return prefix[-self.prefix_chars:], suffix[:self.suffix_chars]
+
+    def suggestion_fits(self) -> bool:
+        """Only suggest at the end of a line, the ghost text would cover anything after the cursor"""
+        if self.editor.hasSelectedText() or not self.editor.hasFocus():
+            return False
+        line, index = self.editor.getCursorPosition()
+        return not self.editor.text(line)[index:].strip()
+
+    def text_changed(self):
+        if not self.accepting:
+            self.edit_timer.start()
+
+    def edited(self):
+        pos = self.position()
+        if self.ghost and pos > self.anchor:
+            ghost = self.ghost
+            typed = bytes(self.editor.bytes(self.anchor, pos)).rstrip(b"\0").decode("utf-8", "ignore")
+            typed = typed.replace("\r\n", "\n")
+            if ghost.startswith(typed) and typed != ghost:
+                # typed along with the suggestion, keep the rest of it
+                self.hide()
+                self.show(ghost[len(typed):], pos)
+                return
+        self.dismiss()
+        self.typed_at = pos
+        self.timer.start()
+
+    def cursor_moved(self):
+        if self.accepting or self.edit_timer.isActive():
+            return
+        pos = self.position()
+        if self.ghost and pos != self.anchor:
+            self.dismiss()
+        if self.timer.isActive() and pos != self.typed_at:
+            self.timer.stop()
+
+    def request(self):
+        if not self.suggestion_fits():
+            return
+        pos = self.position()
+        prefix, suffix = self.context(pos)
+        if not prefix.strip():
+            return
+        cached = self.cache.get((prefix, suffix))
+        if cached is not None:
+            self.cache.move_to_end((prefix, suffix))
+            self.show(cached, pos)
+            return
+        prefetched, self.prefetched = self.prefetched, None
+        if (prefetched is not None and not prefetched.cancelled.is_set() and prefetched.pos == pos
+                and (prefetched.prefix, prefetched.suffix) == (prefix, suffix)):
+            # accepted before the prefetch finished, wait for it instead of asking again
+            self.pending = prefetched
+            return
+        self.pending = self.worker.request(prefix, suffix, pos)
+
+    def completed(self, request: CompletionRequest, text: str):
+        self.cache[(request.prefix, request.suffix)] = text
+        while len(self.cache) > 32:
+            self.cache.popitem(last=False)
+        if request is self.pending:
+            self.pending = None
+            if self.position() == request.pos and self.suggestion_fits():
+                self.show(text, request.pos)
+
+    def show(self, text: str, pos: int):
+        self.ghost = text
+        self.anchor = pos
+        rest = text.split("\n")[1:]
+        if rest:
+            line, _ = self.editor.lineIndexFromPosition(pos)
+            self.editor.annotate(line, "\n".join(rest), GHOST_STYLE)
+        self.editor.viewport().update()
+        self.prefetch()
+
+    def prefetch(self):
+        """Request the suggestion that follows the shown one, with the context it will have once accepted"""
+        if self.pending is not None:
+            return
+        text = self.document_text(self.ghost)
+        prefix, suffix = self.context(self.anchor)
+        prefix = (prefix + text)[-self.prefix_chars:]
+        if (prefix, suffix) in self.cache:
+            return
+        if self.prefetched is not None and (self.prefetched.prefix, self.prefetched.suffix) == (prefix, suffix):
+            return # typed along with the suggestion, same continuation
+        self.prefetched = self.worker.request(prefix, suffix, self.anchor + len(text.encode("utf-8")))
+
+    def document_text(self, text: str) -> str:
+        """Suggestion text as it would be inserted, with the document's line endings"""
+        if self.editor.eolMode() == QsciScintilla.EolWindows:
+            return text.replace("\n", "\r\n")
+        return text
+
+    def hide(self):
+        if self.anchor >= 0:
+            line, _ = self.editor.lineIndexFromPosition(self.anchor)
+            self.editor.clearAnnotations(line)
+        self.ghost = ""
+        self.anchor = -1
+        self.editor.viewport().update()
+
+    def dismiss(self):
+        """Hide the suggestion and drop the request for it"""
+        self.timer.stop()
+        if self.pending is not None:
+            self.worker.cancel()
+            self.pending = None
+        if self.prefetched is not None:
+            self.prefetched.cancelled.set()
+            self.prefetched = None
+        if self.ghost:
+            self.hide()
+
+    def accept(self) -> bool:
+        """Insert the suggestion, False when there is none"""
+        if not self.ghost or self.position() != self.anchor:
+            return False
+        text, pos = self.document_text(self.ghost), self.anchor
+        self.hide()
+        self.accepting = True
+        self.editor.insert(text)
+        self.editor.SendScintilla(QsciScintilla.SCI_GOTOPOS, pos + len(text.encode("utf-8")))
+        self.accepting = False
+        # served from the prefetch made while the suggestion was shown
+        self.typed_at = self.position()
+        self.request()
+        return True
+
+    def paint(self):
+        """Draw the first ghost line after the cursor, called from the editor's paintEvent"""
+        if not self.ghost:
+            return
+        first = self.ghost.split("\n")[0]
+        if not first:
+            return
+        x = self.editor.SendScintilla(QsciScintilla.SCI_POINTXFROMPOSITION, 0, self.anchor)
+        y = self.editor.SendScintilla(QsciScintilla.SCI_POINTYFROMPOSITION, 0, self.anchor)
+        line, _ = self.editor.lineIndexFromPosition(self.anchor)
+        height = self.editor.SendScintilla(QsciScintilla.SCI_TEXTHEIGHT, line)
+        painter = QPainter(self.editor.viewport())
+        painter.setFont(self.editor.font)
+        painter.setPen(GHOST_COLOR)
+        width = QFontMetrics(self.editor.font).horizontalAdvance(first)
+        painter.drawText(QRect(x, y, width + 2, height), Qt.AlignLeft | Qt.AlignVCenter, first)
+        painter.end()
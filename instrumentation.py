@@ -0,0 +1,110 @@
+"""
+Timing spans around the editor's hot paths: styling, completion, search,
+saving and the background checks. Recording one costs a few microseconds,
+so it stays on. main.py shows the slowest recent spans in the status bar
+and File > Export Trace writes them as a Chrome trace-event file, open it
+in chrome://tracing or https://ui.perfetto.dev.
+"""
+from collections import deque
+from functools import wraps
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """Times a with block, made by Instrumentation.span"""
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner: "Instrumentation", name: str):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.record(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Instrumentation:
+    """The last `capacity` spans of every thread, oldest dropped first"""
+    # spans per name kept for the live readout
+    RECENT = 64
+
+    def __init__(self, capacity=100_000):
+        self.enabled = True
+        # (name, start ns, duration ns, thread id)
+        self.events: deque[tuple[str, int, int, int]] = deque(maxlen=capacity)
+        # name -> (end ns, duration ns) of its last spans, so the readout never walks all events
+        self.latest: dict[str, deque[tuple[int, int]]] = {}
+        self.thread_names: dict[int, str] = {}
+
+    def span(self, name: str) -> Span:
+        return Span(self, name)
+
+    def timed(self, name: str):
+        """Decorator, times every call of the function"""
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, start, time.perf_counter_ns() - start)
+            return wrapper
+        return decorate
+
+    def record(self, name: str, start: int, duration: int):
+        if not self.enabled:
+            return
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        # deque.append is atomic, spans from worker threads need no lock
+        self.events.append((name, start, duration, tid))
+        latest = self.latest.get(name)
+        if latest is None:
+            latest = self.latest.setdefault(name, deque(maxlen=self.RECENT))
+        latest.append((start + duration, duration))
+
+    def recent(self, seconds: float) -> dict[str, tuple[int, float, float]]:
+        """name -> (count, last ms, max ms) of the spans that ended in the last `seconds`, counts stop at RECENT"""
+        since = time.perf_counter_ns() - int(seconds * 1e9)
+        stats = {}
+        for name, latest in list(self.latest.items()):
+            durations = [duration for end, duration in latest.copy() if end >= since]
+            if durations:
+                stats[name] = (len(durations), durations[-1] / 1e6, max(durations) / 1e6)
+        return stats
+
+    def chrome_trace(self) -> dict:
+        events = self.events.copy()
+        pid = os.getpid()
+        trace = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in list(self.thread_names.items())
+        ]
+        for name, start, duration, tid in events:
+            trace.append({
+                "name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": tid,
+                # microseconds
+                "ts": start / 1000, "dur": duration / 1000,
+            })
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def export(self, path) -> int:
+        """Write the recorded spans as a Chrome trace, returns how many"""
+        trace = self.chrome_trace()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+        return len(trace["traceEvents"]) - len(self.thread_names)
+
+
+instrumentation = Instrumentation()
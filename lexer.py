@@ -2,12 +2,14 @@ import re
 import keyword
 import builtins
 import types
-import json
 
 from PyQt5.QtGui import QFont, QColor
 from PyQt5.Qsci import QsciLexerCustom
 from typing import TYPE_CHECKING
 
+from theme_registry import get_theme_registry
+from instrumentation import instrumentation
+
 
 if TYPE_CHECKING:
     from editor import Editor
@@ -41,6 +43,8 @@ class NeutronLexer(QsciLexerCustom):
             self.theme = theme
 
         self.token_list: list[str, int] = []
+        # (byte length, style) of each setStyling call while a list, for the chat highlighter
+        self.runs: list = None
         
         self.keywords_list = []
         self.builtin_names = []
@@ -61,6 +65,11 @@ class NeutronLexer(QsciLexerCustom):
         self._init_theme_vars()
         self._init_theme()
 
+    def setStyling(self, length: int, style: int):
+        if self.runs is not None:
+            self.runs.append((length, style))
+        super().setStyling(length, style)
+
     def setKeywords(self, keywords: list[str]):
         '''Set list of strings that considered keywords for this language'''
         self.keywords_list = keywords
@@ -70,36 +79,27 @@ class NeutronLexer(QsciLexerCustom):
         self.builtin_names = builtin_names
 
     def _init_theme(self):
-        with open(self.theme, "r") as f:
-            self.theme_json = json.load(f)
-        
-        colors = self.theme_json["theme"]["syntax"]
-        for clr in colors:
-            name: str = list(clr.keys())[0]
+        # parsed and compiled once per process, shared by every lexer
+        self.theme_registry = get_theme_registry(self.theme)
+        self.theme_registry.theme_changed.connect(self.apply_theme)
+        self.apply_theme()
+
+    def apply_theme(self):
+        """Apply the compiled theme styles, the editor restyles itself from the lexer signals"""
+        self.theme_json = self.theme_registry.theme_json
+
+        for name, style in self.theme_registry.styles.items():
             if name not in self.default_names:
                 print("Theme error: {} is not a valid style name".format(name))
                 continue
 
-            for k, v in clr[name].items():
-                if k == 'color':
-                    self.setColor(QColor(v), getattr(self, name.upper()))
-                elif k == 'paper':
-                    self.setPaper(QColor(v), getattr(self, name.upper()))
-                elif k == 'font':
-                    try:
-                        font = QFont(
-                            v.get('family', 'Consolas'),
-                            v.get('font-size', 14),
-                            self.font_weights.get(v.get('font-weight', QFont.Normal)),
-                            v.get('italic', False),
-                        )
-                        self.setFont(
-                            font,
-                                getattr(self, name.upper()
-                            )
-                        )
-                    except AttributeError as e:
-                        print(f"Theme error: {e}")
+            style_nr = getattr(self, name.upper())
+            if style.color is not None:
+                self.setColor(style.color, style_nr)
+            if style.paper is not None:
+                self.setPaper(style.paper, style_nr)
+            if style.font is not None:
+                self.setFont(style.font, style_nr)
 
     def _init_theme_vars(self):
         # Initialize colors per style
@@ -131,18 +131,6 @@ class NeutronLexer(QsciLexerCustom):
             "constants",
         ]
 
-        self.font_weights = {
-            'thin': QFont.Thin,
-            'extralight': QFont.ExtraLight,
-            'light': QFont.Light,
-            'normal': QFont.Normal,
-            'medium': QFont.Medium,
-            'demibold': QFont.DemiBold,
-            'bold': QFont.Bold,
-            'extrabold': QFont.ExtraBold,
-            'black': QFont.Black,
-        }
-
     def language(self):
         return self.language_name
 
@@ -221,6 +209,7 @@ class PyCustomLexer(NeutronLexer):
             if isinstance(obj, types.BuiltinFunctionType)
         ])
 
+    @instrumentation.timed("lexer.style")
     def styleText(self, start, end):
         # 1. Initialize the styling procedure
         # ------------------------------------
@@ -338,6 +327,7 @@ class JsonLexer(NeutronLexer):
             "false"
         ])
 
+    @instrumentation.timed("lexer.style")
     def styleText(self, start, end):
         # 1. Initialize the styling procedure
         # ------------------------------------
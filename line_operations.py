@@ -0,0 +1,242 @@
+from typing import TYPE_CHECKING
+
+from PyQt5.Qsci import QsciScintilla
+
+from contextlib import contextmanager
+
+from file_types import FileType
+from instrumentation import instrumentation
+
+if TYPE_CHECKING:
+    from editor import Editor
+
+# Scintilla types into every cursor one by one, more than this and each key lags
+MAX_CURSORS = 2000
+
+COMMENT_PREFIXES = {
+    FileType.C: b"//",
+    FileType.Java: b"//",
+}
+
+
+@contextmanager
+def bulk_change(editor: QsciScintilla):
+    """
+    Make many changes with one textChanged at the end. QScintilla handles
+    each change notification in time that grows with the position of the
+    change, thousands of them are quadratic, and the editor and its helpers
+    only need to hear about the change once anyway.
+    """
+    mask = editor.SendScintilla(QsciScintilla.SCI_GETMODEVENTMASK)
+    editor.SendScintilla(QsciScintilla.SCI_SETMODEVENTMASK, 0)
+    try:
+        yield
+    finally:
+        editor.SendScintilla(QsciScintilla.SCI_SETMODEVENTMASK, mask)
+    editor.textChanged.emit()
+
+
+class LineEdits:
+    """
+    Edits to the selected lines, collected in document order and applied
+    bottom up in one undo action. Each one is a small insert, delete or
+    replace inside one line, so lines that do not change are never touched
+    and Scintilla never copies the whole selection around.
+    """
+
+    def __init__(self):
+        # (start, end, new bytes), positions are from before any edit
+        self.edits: list[tuple[int, int, bytes]] = []
+
+    def __len__(self):
+        return len(self.edits)
+
+    def insert(self, pos: int, text: bytes):
+        self.edits.append((pos, pos, text))
+
+    def delete(self, start: int, end: int):
+        if end > start:
+            self.edits.append((start, end, b""))
+
+    def replace(self, start: int, end: int, text: bytes):
+        self.edits.append((start, end, text))
+
+    def map_position(self, pos: int, before_inserts=False) -> int:
+        """Where pos ends up once the edits are applied, text inserted right at pos goes before it"""
+        shift = 0
+        for start, end, text in self.edits:
+            if start > pos or (start == pos and (before_inserts or start != end)):
+                break
+            if end <= pos:
+                shift += len(text) - (end - start)
+            else:
+                # inside a replaced range, keep it at the end of the new text
+                return start + shift + len(text)
+        return pos + shift
+
+    @instrumentation.timed("edit.lines")
+    def apply(self, editor: QsciScintilla):
+        if not self.edits:
+            return
+        anchor = editor.SendScintilla(QsciScintilla.SCI_GETANCHOR)
+        caret = editor.SendScintilla(QsciScintilla.SCI_GETCURRENTPOS)
+        send = editor.SendScintilla
+        with bulk_change(editor):
+            editor.beginUndoAction()
+            try:
+                for start, end, text in reversed(self.edits):
+                    if start == end:
+                        send(QsciScintilla.SCI_INSERTTEXT, start, text)
+                    elif not text:
+                        send(QsciScintilla.SCI_DELETERANGE, start, end - start)
+                    else:
+                        send(QsciScintilla.SCI_SETTARGETRANGE, start, end)
+                        send(QsciScintilla.SCI_REPLACETARGET, len(text), text)
+            finally:
+                editor.endUndoAction()
+            # a selection keeps the text inserted at its start, a cursor moves past it
+            selected = anchor != caret
+            send(
+                QsciScintilla.SCI_SETSEL,
+                self.map_position(anchor, selected and anchor < caret),
+                self.map_position(caret, selected and caret < anchor),
+            )
+
+
+def selected_lines(editor: QsciScintilla, whole_document=False) -> tuple[int, int]:
+    """
+    First and last line of the selection, the cursor line without one. A
+    selection ending at the start of a line does not include that line.
+    """
+    if not editor.hasSelectedText():
+        if whole_document:
+            return 0, editor.lines() - 1
+        line, _ = editor.getCursorPosition()
+        return line, line
+    start_line, _, end_line, end_index = editor.getSelection()
+    if end_index == 0 and end_line > start_line:
+        end_line -= 1
+    return start_line, end_line
+
+
+def document_bytes(editor: QsciScintilla, start: int, end: int) -> memoryview:
+    """The document bytes in [start, end) without copying, only valid until the next edit"""
+    if end <= start:
+        return memoryview(b"")
+    # SendScintilla returns a C long, 32 bits on 64 bit Windows and too small for
+    # a pointer, SendScintillaPtrResult returns one of the right size
+    pointer = editor.SendScintillaPtrResult(QsciScintilla.SCI_GETCHARACTERPOINTER)
+    pointer.setsize(editor.SendScintilla(QsciScintilla.SCI_GETLENGTH))
+    return memoryview(pointer)[start:end]
+
+
+def read_lines(editor: QsciScintilla, first: int, last: int) -> tuple[list[int], list[bytes]]:
+    """Start position and bytes without the line end of each line, read in one copy"""
+    start = editor.SendScintilla(QsciScintilla.SCI_POSITIONFROMLINE, first)
+    end = editor.SendScintilla(QsciScintilla.SCI_GETLINEENDPOSITION, last)
+    data = bytes(document_bytes(editor, start, end))
+    starts, lines = [], []
+    pos = start
+    for raw in data.split(b"\n"):
+        starts.append(pos)
+        pos += len(raw) + 1
+        lines.append(raw[:-1] if raw.endswith(b"\r") else raw)
+    return starts, lines
+
+
+def indent_width(line: bytes) -> int:
+    return len(line) - len(line.lstrip(b" \t"))
+
+
+def comment_prefix(editor: "Editor") -> bytes:
+    return COMMENT_PREFIXES.get(getattr(editor, "file_type", None), b"#")
+
+
+def toggle_comment(editor: "Editor"):
+    """
+    Comment the selected lines, or uncomment them when all of them are
+    commented. The prefix goes at the smallest indent so the block still
+    lines up, blank lines are left alone.
+    """
+    prefix = comment_prefix(editor)
+    starts, lines = read_lines(editor, *selected_lines(editor))
+    code = [(start, line) for start, line in zip(starts, lines) if line.strip()]
+    if not code:
+        return
+    edits = LineEdits()
+    if all(line.lstrip().startswith(prefix) for _, line in code):
+        for start, line in code:
+            column = indent_width(line)
+            end = column + len(prefix)
+            if line[end:end + 1] == b" ":
+                end += 1
+            edits.delete(start + column, start + end)
+    else:
+        column = min(indent_width(line) for _, line in code)
+        for start, _ in code:
+            edits.insert(start + column, prefix + b" ")
+    edits.apply(editor)
+
+
+def indent_unit(editor: QsciScintilla) -> bytes:
+    return b"\t" if editor.indentationsUseTabs() else b" " * (editor.indentationWidth() or editor.tabWidth())
+
+
+def indent(editor: QsciScintilla):
+    unit = indent_unit(editor)
+    starts, lines = read_lines(editor, *selected_lines(editor))
+    edits = LineEdits()
+    for start, line in zip(starts, lines):
+        if line.strip():
+            edits.insert(start, unit)
+    edits.apply(editor)
+
+
+def dedent(editor: QsciScintilla):
+    width = len(indent_unit(editor)) if not editor.indentationsUseTabs() else 1
+    starts, lines = read_lines(editor, *selected_lines(editor))
+    edits = LineEdits()
+    for start, line in zip(starts, lines):
+        if line[:1] == b"\t":
+            edits.delete(start, start + 1)
+        else:
+            edits.delete(start, start + min(width, len(line) - len(line.lstrip(b" "))))
+    edits.apply(editor)
+
+
+def trim_trailing_whitespace(editor: QsciScintilla):
+    """Of the selected lines, or the whole document without a selection"""
+    starts, lines = read_lines(editor, *selected_lines(editor, whole_document=True))
+    edits = LineEdits()
+    for start, line in zip(starts, lines):
+        trimmed = len(line.rstrip(b" \t"))
+        edits.delete(start + trimmed, start + len(line))
+    edits.apply(editor)
+
+
+def sort_lines(editor: QsciScintilla, reverse=False):
+    """Sort the selected lines, only the lines that end up with other text are rewritten"""
+    first, last = selected_lines(editor)
+    if last <= first:
+        return
+    starts, lines = read_lines(editor, first, last)
+    edits = LineEdits()
+    for start, old, new in zip(starts, lines, sorted(lines, reverse=reverse)):
+        if old != new:
+            edits.replace(start, start + len(old), new)
+    edits.apply(editor)
+
+
+def cursors_on_lines(editor: QsciScintilla):
+    """A cursor at the end of every selected line, typing then edits all of them.
+    At most MAX_CURSORS, from the first selected line down."""
+    first, last = selected_lines(editor)
+    if last <= first:
+        return
+    last = min(last, first + MAX_CURSORS - 1)
+    send = editor.SendScintilla
+    ends = [send(QsciScintilla.SCI_GETLINEENDPOSITION, line) for line in range(first, last + 1)]
+    send(QsciScintilla.SCI_SETSELECTION, ends[0], ends[0])
+    for end in ends[1:]:
+        send(QsciScintilla.SCI_ADDSELECTION, end, end)
+    send(QsciScintilla.SCI_SETMAINSELECTION, len(ends) - 1)
@@ -1,3 +1,6 @@
+# first, so the startup profile times every other import
+from startup_profile import startup_profile, FirstPaintFilter
+
 from PyQt5.QtWidgets import (
     QDesktopWidget, QApplication,
     QFrame,
@@ -10,9 +13,10 @@ from PyQt5.QtWidgets import (
     QLineEdit, QCheckBox, QLabel,
     QListWidget,
     QSpacerItem,
-    QMessageBox, QStatusBar, QFileDialog
+    QMessageBox, QStatusBar, QFileDialog,
+    QPushButton
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont, QEnterEvent, QMouseEvent
 from PyQt5.Qsci import QsciScintilla
 
@@ -20,17 +24,33 @@ from editor import Editor
 from file_manager import FileManager
 from fuzzy_searcher import SearchItem, SearchWorker
 from heading import Heading
+from workspace_watcher import WorkspaceWatcher, ChangeSet, stat_signature
+from file_operations import FileOperationQueue, FileOperation, FileJob
+from document_registry import DocumentRegistry
+from settings import get_settings
+from venv_discovery import VenvDiscovery
+from session import Session, SessionTab
+from chat_worker import ChatWorker
+from chat_view import ChatView
+from chat_context import ChatContext
+from response_cache import ResponseCache
+from inline_completion import InlineCompletionWorker
+from code_index import CodeIndex, CodeIndexer
+from diagnostics import Diagnostics, ProblemsView, ProblemItem
+from outline import OutlineService, OutlineView, OutlineSymbol
+from instrumentation import instrumentation
+from stall_watchdog import StallWatchdog
 
 from qframelesswindow import FramelessMainWindow
-import ollama 
 
-import threading
+import argparse
 import sys
 import os
 from pathlib import Path
-import jedi
 from PyQt5.QtGui import QIcon
 
+startup_profile.mark("imports")
+
 # Main window class
 class MainWindow(FramelessMainWindow):
     def __init__(self):
@@ -39,9 +59,64 @@ class MainWindow(FramelessMainWindow):
 
         self.current_file = None
         self.current_side_bar = None
-        self.envs = list(jedi.find_virtualenvs())
+        # open tabs keyed by resolved path
+        self.documents = DocumentRegistry()
+        self.settings = get_settings()
+        instrumentation.enabled = self.settings.get("instrumentation", True)
+        # virtualenv paths, found in the background after the first paint
+        self.envs = []
+        self.venv_discovery = None
+        # workspace to look in once the running discovery is done
+        self.venv_pending = None
+        # the env picked for this workspace last time is used right away
+        self.venv = self.settings.workspace(os.getcwd()).get("venv")
+        self.session = Session()
+        self.chat_context = ChatContext(
+            self.settings.get("chat_context_tokens", 4096),
+            self.settings.get("chat_reply_tokens", 1024),
+        )
+        # one worker answers the chat questions in order, see generate_ai_response
+        self.chat_worker = ChatWorker(
+            self.chat_context,
+            self.settings.get("ollama_host"),
+            keep_alive=self.settings.get("chat_keep_alive", "30m"),
+            temperature=self.settings.get("chat_temperature"),
+            # opt in, answers are only reused at temperature 0
+            cache=ResponseCache(self.settings.get("chat_cache_mb", 50) * 1024 * 1024)
+            if self.settings.get("chat_cache", False) else None,
+        )
+        self.chat_worker.token.connect(self.ai_token)
+        self.chat_worker.response_cached.connect(self.ai_response_cached)
+        self.chat_worker.response_finished.connect(self.ai_response_finished)
+        self.chat_worker.error.connect(self.ai_response_error)
+        QApplication.instance().aboutToQuit.connect(self.chat_worker.stop)
+        # chat view message id of each request's answer
+        self.chat_items: dict[int, int] = {}
+        self.chat_warmed_up = False
+        # ghost text completions in the editors, opt in since it needs a code model
+        self.inline_worker = None
+        if self.settings.get("inline_completion", False):
+            self.inline_worker = InlineCompletionWorker(
+                self.settings.get("inline_model", "qwen2.5-coder:1.5b"),
+                self.settings.get("ollama_host"),
+                self.settings.get("chat_keep_alive", "30m"),
+            )
+            QApplication.instance().aboutToQuit.connect(self.inline_worker.stop)
+        # background checks of the Python files, squiggles and the problems list
+        self.diagnostics = None
+        if self.settings.get("diagnostics", True):
+            self.diagnostics = Diagnostics(self.settings.get("diagnostics_delay_ms", 500), self)
+            self.diagnostics.changed.connect(self.problems_changed)
+            QApplication.instance().aboutToQuit.connect(self.diagnostics.stop)
+        # classes and functions of the current file, for the outline and the breadcrumb
+        self.outline = OutlineService(parent=self)
+        QApplication.instance().aboutToQuit.connect(self.outline.stop)
         self.init_ui()
-        self.conversation_history = []
+        # embeddings of the workspace, chunks relevant to a question go into its prompt
+        self.code_index: CodeIndex = None
+        self.code_indexer: CodeIndexer = None
+        # files changed while the indexer was busy, None for a full rescan
+        self.code_index_pending: set = set()
         # self.header = Heading(self)		
     @property
     def current_file(self) -> Path:
@@ -60,6 +135,7 @@ class MainWindow(FramelessMainWindow):
         self.center()
 
         self.setStyleSheet(open("./styles/style.qss", "r").read())
+        startup_profile.mark("stylesheet")
         
         self.window_font = QFont("FiraCode", 12)
         self.setFont(self.window_font)
@@ -67,8 +143,28 @@ class MainWindow(FramelessMainWindow):
         self.setUpBody()
         self.setMouseTracking(True)
         self.set_up_status_bar()
+        startup_profile.mark("panels")
+
+        # tabs come back as empty editors, each reads its file when first shown
+        self.restore_session()
+        startup_profile.mark("session")
 
+        # anything not needed for the first frame waits until it is painted
+        self.first_paint_filter = FirstPaintFilter(self, self.first_paint)
         self.show()
+        startup_profile.mark("show")
+
+    def first_paint(self):
+        startup_profile.mark("first paint")
+        QTimer.singleShot(0, self.deferred_init)
+
+    def deferred_init(self):
+        """Non essential setup, runs once the window is on screen"""
+        self.discover_venvs(self.file_manager.model.rootPath())
+        self.index_workspace(self.file_manager.model.rootPath())
+        self.check_workspace(self.file_manager.model.rootPath())
+        startup_profile.mark("deferred init")
+        startup_profile.report()
 
     def center(self):
         qr = self.frameGeometry()
@@ -78,10 +174,7 @@ class MainWindow(FramelessMainWindow):
 
     def get_editor(self, path: Path = None, file_type=".py") -> QsciScintilla:
         """Create a New Editor"""
-        venv = None
-        if len(self.envs) > 0:
-            venv = self.envs[0]
-        editor = Editor(self, path=path, env=venv, file_type=file_type)
+        editor = Editor(self, path=path, env=self.venv, file_type=file_type)
         return editor
 
     def set_cursor_pointer(self, e: QEnterEvent) -> None:
@@ -209,7 +302,20 @@ class MainWindow(FramelessMainWindow):
         font-weight: bold;
         """)
 
+        # reports file system changes in the workspace and the open files
+        self.workspace_watcher = WorkspaceWatcher(os.getcwd(), parent=self)
+        self.workspace_watcher.changed.connect(self.workspace_changed)
+
+        # copy, move and delete run here instead of on the GUI thread
+        self.file_operations = FileOperationQueue()
+        self.file_operations.progress.connect(self.file_operation_progress)
+        self.file_operations.job_finished.connect(self.file_operation_finished)
+        QApplication.instance().aboutToQuit.connect(self.file_operations.stop)
+
+        startup_profile.mark("widgets")
         self.file_manager = FileManager(tab_view=self.tab_view,set_new_tab=self.set_new_tab, main_window=self) # was tree_view
+        self.file_manager.model.directoryLoaded.connect(self.workspace_watcher.watch_dir)
+        startup_profile.mark("file model")
         
         self.file_manager_layout.addWidget(self.current_dir_lbl)
         self.file_manager_layout.addWidget(self.file_manager)
@@ -238,6 +344,9 @@ class MainWindow(FramelessMainWindow):
 
         self.search_worker = SearchWorker()
         self.search_worker.finished.connect(self.search_finished)
+        self.search_worker.walked.connect(self.workspace_watcher.watch_dirs)
+        self.workspace_watcher.changed.connect(self.search_worker.invalidate)
+        self.workspace_watcher.dropped.connect(self.search_worker.forget)
         search_input.textChanged.connect(
             lambda text: self.search_worker.update(
                 text,
@@ -287,18 +396,64 @@ class MainWindow(FramelessMainWindow):
 
         ###################################################
         ############## Chat ListView #####################
-        self.chat_list_view = QListWidget()
-        self.chat_list_view.setFont(QFont("FiraCode", 13))
+        self.chat_view = ChatView(QFont("FiraCode", 13))
+
+        # stops the answer being generated, only visible while one is
+        self.chat_stop = QPushButton("Stop")
+        self.chat_stop.setStyleSheet("color: #D3D3D3; border: none; padding: 4px;")
+        self.chat_stop.setCursor(Qt.PointingHandCursor)
+        self.chat_stop.clicked.connect(self.chat_worker.stop_generation)
+        self.chat_stop.hide()
 
-        # self.chat_list_view.itemClicked.connect(self.search_list_view_clicked)
 
         # chat_layout.addWidget(self.chat_checkbox)
         chat_layout.addWidget(self.chat_input)
+        chat_layout.addWidget(self.chat_stop)
         chat_layout.addSpacerItem(
             QSpacerItem(5, 5, QSizePolicy.Minimum, QSizePolicy.Minimum)
         )
-        chat_layout.addWidget(self.chat_list_view)
+        chat_layout.addWidget(self.chat_view)
         self.chat_frame.setLayout(chat_layout)
+
+        ###############################################
+        ############## Problems View ##################
+
+        self.problems_frame = self.get_frame()
+        self.problems_frame.setMaximumWidth(400)
+        self.problems_frame.setMinimumWidth(200)
+        problems_layout = QVBoxLayout()
+        problems_layout.setContentsMargins(0, 10, 0, 0)
+        problems_layout.setSpacing(0)
+        self.problems_lbl = QLabel("No problems")
+        self.problems_lbl.setStyleSheet("color: #D3D3D3; padding: 0 0 8px 4px;")
+        problems_layout.addWidget(self.problems_lbl)
+        if self.diagnostics is not None:
+            self.problems_view = ProblemsView(self.diagnostics)
+            self.problems_view.setFont(QFont("FiraCode", 11))
+            self.problems_view.set_root(os.getcwd())
+            self.problems_view.itemClicked.connect(self.problem_clicked)
+            self.problems_view.counts_changed.connect(self.problem_counts_changed)
+            problems_layout.addWidget(self.problems_view)
+        else:
+            self.problems_lbl.setText("Diagnostics are turned off in the settings")
+        self.problems_frame.setLayout(problems_layout)
+
+        ###############################################
+        ############## Outline View ###################
+
+        self.outline_frame = self.get_frame()
+        self.outline_frame.setMaximumWidth(400)
+        self.outline_frame.setMinimumWidth(200)
+        outline_layout = QVBoxLayout()
+        outline_layout.setContentsMargins(0, 10, 0, 0)
+        outline_layout.setSpacing(0)
+        self.outline_view = OutlineView()
+        self.outline_view.setFont(QFont("FiraCode", 12))
+        self.outline_view.symbol_activated.connect(self.outline_symbol_clicked)
+        self.outline.outline_changed.connect(self.outline_view.set_outline)
+        self.outline.scope_changed.connect(self.scope_changed)
+        outline_layout.addWidget(self.outline_view)
+        self.outline_frame.setLayout(outline_layout)
     
         ####################################################
         ############## SideBar Icons #######################
@@ -313,6 +468,10 @@ class MainWindow(FramelessMainWindow):
         # chat_label = self.get_sidebar_button(":/icons/search_icon.svg", self.chat_frame)
         chat_label = self.get_sidebar_button("icons/chat_icon.svg", self.chat_frame)
         side_bar_content.addWidget(chat_label)
+        problems_label = self.get_sidebar_button("icons/problems_icon.svg", self.problems_frame)
+        side_bar_content.addWidget(problems_label)
+        outline_label = self.get_sidebar_button("icons/outline_icon.svg", self.outline_frame)
+        side_bar_content.addWidget(outline_label)
 
     
         self.side_bar.setLayout(side_bar_content)
@@ -421,54 +580,45 @@ class MainWindow(FramelessMainWindow):
         self.chat_input.clear()
 
         # Display user input in the chat view
-        self.chat_list_view.addItem(f"You: {user_input}")
-
-        # Create a thread to handle the AI response generation
-        thread = threading.Thread(target=self.handle_ai_response, args=(user_input,))
-        thread.start()
-    def handle_ai_response(self, user_input):
-        """Fetch and display the AI response in a separate thread."""
-        ai_response = self.generate_ai_response(user_input)
-        # Update the chat list view with the AI response (must run on the main thread)
-        self.chat_list_view.addItem(f"AI: {ai_response}")
-        print(ai_response)
-
-        ##code with conversation history
-    def generate_ai_response(self, input_text, model="llama3.2", max_history_length=10):
-        
-        
-        try:
-            # Add user message to conversation history
-            self.conversation_history.append({
-                "role": "user",
-                "content": input_text
-            })
-
-            # Trim conversation history if it exceeds max length
-            if len(self.conversation_history) > max_history_length:
-                # Remove oldest messages, keeping the most recent ones
-                self.conversation_history = self.conversation_history[-max_history_length:]
-
-            # Generate response using Ollama with conversation history
-            response = ollama.chat(
-                model=model,
-                messages=self.conversation_history
-            )
-            
-            # Extract AI response
-            ai_response = response.get("message", {}).get("content", "Sorry, I couldn't process that.")
-            
-            # Add AI response to conversation history
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": ai_response
-            })
-
-            return ai_response
-
-        except Exception as e:
-            # Handle any errors
-            return f"Error: {e}"
+        self.chat_view.chat_model.add_message("user", user_input)
+
+        self.generate_ai_response(user_input)
+
+    def generate_ai_response(self, input_text, model=None):
+        """Queue input_text, its answer streams into the chat view once its turn comes"""
+        message_id = self.chat_view.chat_model.add_message("assistant", "", streaming=True)
+        request = self.chat_worker.submit(input_text, model or self.settings.get("chat_model", "llama3.2"))
+        self.chat_items[request.id] = message_id
+        self.chat_stop.show()
+
+    def warm_up_chat(self):
+        """Load the chat model the first time the chat panel opens"""
+        if not self.chat_warmed_up:
+            self.chat_warmed_up = True
+            self.chat_worker.warm_up(self.settings.get("chat_model", "llama3.2"))
+
+    def ai_token(self, request_id: int, token: str):
+        if request_id in self.chat_items:
+            self.chat_view.chat_model.append_text(self.chat_items[request_id], token)
+
+    def ai_response_cached(self, request_id: int):
+        if request_id in self.chat_items:
+            self.chat_view.chat_model.set_marker(self.chat_items[request_id], "cached")
+
+    def ai_response_finished(self, request_id: int, ai_response: str, completed: bool):
+        message_id = self.chat_items.pop(request_id, None)
+        if message_id is not None:
+            self.chat_view.chat_model.finish(message_id)
+        if message_id is not None and not completed:
+            self.chat_view.chat_model.set_marker(message_id, "stopped")
+        self.chat_stop.setVisible(bool(self.chat_items))
+
+    def ai_response_error(self, request_id: int, message: str):
+        message_id = self.chat_items.pop(request_id, None)
+        if message_id is not None:
+            self.chat_view.chat_model.finish(message_id)
+            self.chat_view.chat_model.set_text(message_id, message, "error")
+        self.chat_stop.setVisible(bool(self.chat_items))
 
     def get_conversation_history(self):
         """
@@ -476,13 +626,13 @@ class MainWindow(FramelessMainWindow):
         
         :return: List of conversation messages
         """
-        return self.conversation_history
+        return self.chat_context.request_messages()
 
     def clear_conversation_history(self):
         """
         Clear the entire conversation history
         """
-        self.conversation_history = []
+        self.chat_context.clear()
 ###code acctuly running 
     # def generate_ai_response(self, input_text):
     #     """Generate a response using the Ollama library."""
@@ -509,6 +659,43 @@ class MainWindow(FramelessMainWindow):
         for i in items:
             self.search_list_view.addItem(i)
 
+    def check_workspace(self, root: str):
+        if self.diagnostics is not None:
+            self.problems_view.set_root(root)
+            self.diagnostics.check_workspace(root)
+
+    def problems_changed(self, path: str, problems: list):
+        editor = self.documents.editor(Path(path))
+        if editor is not None:
+            editor.set_problems(problems)
+
+    def problem_counts_changed(self, errors: int, warnings: int):
+        if errors or warnings:
+            self.problems_lbl.setText(f"{errors} errors, {warnings} warnings")
+        else:
+            self.problems_lbl.setText("No problems")
+
+    def problem_clicked(self, item: ProblemItem):
+        self.set_new_tab(Path(item.path))
+        editor: Editor = self.tab_view.currentWidget()
+        if editor is None or editor.path.absolute() != Path(item.path):
+            return
+        editor.setCursorPosition(item.problem.line, 0)
+        editor.SendScintilla(QsciScintilla.SCI_GOTOPOS, editor.problem_range(item.problem)[0])
+        editor.setFocus()
+
+    def scope_changed(self, file_name: str, scope: list):
+        """Breadcrumb of the cursor position, file > class > function"""
+        self.header.path_lbl.setText("  ›  ".join([file_name] + [s.name for s in scope]))
+        self.outline_view.set_scope(scope)
+
+    def outline_symbol_clicked(self, symbol: OutlineSymbol):
+        editor = self.tab_view.currentWidget()
+        if editor is not None:
+            editor.setCursorPosition(symbol.line, symbol.column)
+            editor.setFirstVisibleLine(max(0, symbol.line - 3))
+            editor.setFocus()
+
     def search_list_view_clicked(self, item: SearchItem):
         self.set_new_tab(Path(item.full_path))
         editor: Editor = self.tab_view.currentWidget()
@@ -528,6 +715,8 @@ class MainWindow(FramelessMainWindow):
         self.hsplit.replaceWidget(0, widget)
         self.current_side_bar = widget
         self.current_side_bar.show()
+        if widget is self.chat_frame:
+            self.warm_up_chat()
 
 
     def show_dialog(self, title, msg) -> int:
@@ -544,20 +733,69 @@ class MainWindow(FramelessMainWindow):
 
     def close_tab(self, index: int):
         # UPDATED EP 9
-        editor: Editor = self.tab_view.currentWidget()
+        editor: Editor = self.tab_view.widget(index)
         if editor.current_file_changed:
+            # save_file works on the current tab
+            self.tab_view.setCurrentIndex(index)
             dialog = self.show_dialog(
-                "Close", f"Do you want to save the changes made to {self.current_file.name}?"
+                "Close", f"Do you want to save the changes made to {editor.path.name}?"
             )
             if dialog == QMessageBox.Yes:
                 self.save_file()
 
-        self.tab_view.removeTab(index)
+        self.close_editor(editor)
+
+    def close_editor(self, editor: Editor):
+        """Remove an editor's tab without asking to save"""
+        self.workspace_watcher.unwatch_file(editor.full_path)
+        if self.diagnostics is not None:
+            self.diagnostics.closed(editor)
+        doc = self.documents.get(editor.path)
+        if doc is not None and doc.editor is editor:
+            self.documents.remove(editor.path)
+        self.tab_view.removeTab(self.tab_view.indexOf(editor))
+
+    def workspace_changed(self, changes: ChangeSet):
+        """Reload open tabs changed on disk, ask first when they have unsaved edits"""
+        if changes.files:
+            self.index_workspace(self.file_manager.model.rootPath(), changes.files)
+            if self.diagnostics is not None:
+                self.diagnostics.check_paths(changes.files)
+        if not len(self.documents):
+            return
+        for path in changes.files:
+            editor = self.documents.editor(path)
+            if editor is not None:
+                self.reload_or_conflict(editor)
+
+    def reload_or_conflict(self, editor: Editor):
+        if editor.pending_load is not None:
+            return # not loaded yet, it reads the new content when first shown
+        if stat_signature(editor.full_path) == editor.disk_stat:
+            return # our own save
+        if not editor.path.exists():
+            self.statusBar().showMessage(f"{editor.path.name} was deleted on disk", 3000)
+            return
+        if not editor.current_file_changed:
+            editor.reload_from_disk()
+            self.statusBar().showMessage(f"Reloaded {editor.path.name}", 2000)
+            return
+
+        self.tab_view.setCurrentWidget(editor)
+        dialog = self.show_dialog(
+            "Reload", f"{editor.path.name} changed on disk. Reload it and discard your changes?"
+        )
+        if dialog == QMessageBox.Yes:
+            editor.reload_from_disk()
+        else:
+            # keep our version, saving will overwrite the file on disk
+            editor.mark_disk_state()
 
     def tab_changed(self, index: int):
         editor = self.tab_view.widget(index)
         if editor:
             self.current_file = editor.path
+        self.outline.set_editor(editor)
 
     # UPDATED EP 9 
     def set_up_status_bar(self):
@@ -568,6 +806,188 @@ class MainWindow(FramelessMainWindow):
         stat.showMessage("Ready", 3000)
         self.setStatusBar(stat)
 
+        # cancels the background file operations, only visible while they run
+        self.file_ops_cancel = QPushButton("Cancel")
+        self.file_ops_cancel.setStyleSheet("color: #D3D3D3; border: none; padding: 0 8px;")
+        self.file_ops_cancel.setCursor(Qt.PointingHandCursor)
+        self.file_ops_cancel.clicked.connect(self.file_operations.cancel_all)
+        self.file_ops_cancel.hide()
+        stat.addPermanentWidget(self.file_ops_cancel)
+
+        # virtualenv used for completion
+        self.venv_combo = QComboBox()
+        self.venv_combo.setStyleSheet("color: #D3D3D3; border: none;")
+        self.venv_combo.setToolTip("Python environment")
+        self.venv_combo.currentIndexChanged.connect(
+            lambda i: self.select_venv(self.venv_combo.itemData(i))
+        )
+        self.venv_combo.hide()
+        stat.addPermanentWidget(self.venv_combo)
+
+        # slowest spans of the last few seconds, see instrumentation.py
+        self.latency_lbl = QLabel()
+        self.latency_lbl.setStyleSheet("color: #7f848e; padding: 0 8px;")
+        stat.addPermanentWidget(self.latency_lbl)
+        self.latency_timer = QTimer(self)
+        self.latency_timer.setInterval(1000)
+        self.latency_timer.timeout.connect(self.update_latency_readout)
+        if instrumentation.enabled:
+            self.latency_timer.start()
+
+    def update_latency_readout(self):
+        stats = instrumentation.recent(5)
+        slowest = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)
+        text = "  ".join(f"{name} {worst:.0f}ms" if worst >= 10 else f"{name} {worst:.1f}ms" for name, (_, _, worst) in slowest[:3])
+        if text != self.latency_lbl.text():
+            self.latency_lbl.setText(text)
+            self.latency_lbl.setToolTip("\n".join(
+                f"{name}: {count}x, last {last:.1f} ms, max {worst:.1f} ms" for name, (count, last, worst) in slowest
+            ))
+
+    def export_trace(self):
+        file_path = QFileDialog.getSaveFileName(self, "Export Trace", "trace.json", "Chrome trace (*.json)")[0]
+        if not file_path:
+            return
+        try:
+            count = instrumentation.export(file_path)
+        except OSError as e:
+            self.statusBar().showMessage(f"Cannot export trace: {e}", 3000)
+            return
+        self.statusBar().showMessage(f"Exported {count} spans to {Path(file_path).name}", 3000)
+
+    def discover_venvs(self, root: str):
+        if self.venv_discovery is not None and self.venv_discovery.isRunning():
+            # dropping a running QThread destroys it, look again once it is done
+            self.venv_pending = root
+            return
+        self.venv_pending = None
+        self.venv_discovery = VenvDiscovery(root)
+        self.venv_discovery.found.connect(lambda envs, root=root: self.venvs_found(root, envs))
+        self.venv_discovery.finished.connect(self.venv_discovery_done)
+        self.venv_discovery.start()
+
+    def venv_discovery_done(self):
+        if self.venv_pending is not None:
+            self.discover_venvs(self.venv_pending)
+
+    def venvs_found(self, root: str, envs: list):
+        if os.path.abspath(root) != os.path.abspath(self.file_manager.model.rootPath()):
+            return # the workspace changed while we were looking
+        self.envs = envs
+
+        self.venv_combo.blockSignals(True)
+        self.venv_combo.clear()
+        for env in envs:
+            self.venv_combo.addItem(Path(env).name, env)
+        self.venv_combo.blockSignals(False)
+        self.venv_combo.setVisible(len(envs) > 0)
+
+        if self.venv in envs:
+            self.venv_combo.setCurrentIndex(envs.index(self.venv))
+        elif envs:
+            self.select_venv(envs[0])
+        elif self.venv is not None:
+            self.select_venv(None)
+
+    def index_workspace(self, root: str, paths=None):
+        """Embed the workspace in the background, only `paths` when given"""
+        if not self.settings.get("chat_code_index", False):
+            return
+        if self.code_index is None or self.code_index.root != os.path.abspath(root):
+            if self.code_indexer is not None and self.code_indexer.isRunning():
+                self.code_indexer.stop()
+                self.code_index_pending = None
+                return # restarted for the new root once the old run stops
+            self.code_index = CodeIndex(root, self.settings.get("embed_model", "nomic-embed-text"))
+            self.chat_worker.index = self.code_index
+            paths = None
+        if self.code_indexer is not None and self.code_indexer.isRunning():
+            if paths is None or self.code_index_pending is None:
+                self.code_index_pending = None
+            else:
+                self.code_index_pending.update(str(p) for p in paths)
+            return
+
+        self.code_index_pending = set()
+        self.code_indexer = CodeIndexer(
+            self.code_index,
+            self.settings.get("ollama_host"),
+            None if paths is None else [str(p) for p in paths],
+        )
+        self.code_indexer.finished.connect(self.code_index_done)
+        self.code_indexer.start()
+
+    def code_index_done(self):
+        pending = self.code_index_pending
+        if pending is None or pending:
+            self.index_workspace(self.file_manager.model.rootPath(), pending)
+
+    def select_venv(self, env_path: str):
+        """Use env_path for completion in every editor, remembered per workspace"""
+        if not env_path:
+            env_path = None
+        self.venv = env_path
+        self.settings.set_workspace(self.file_manager.model.rootPath(), "venv", env_path)
+        for doc in self.documents:
+            doc.editor.set_env(env_path)
+        if env_path in self.envs:
+            self.venv_combo.blockSignals(True)
+            self.venv_combo.setCurrentIndex(self.envs.index(env_path))
+            self.venv_combo.blockSignals(False)
+
+    def file_operation_progress(self, job_id: int, title: str, done: int, total: int):
+        self.file_ops_cancel.show()
+        self.statusBar().showMessage(f"{title} {done}/{total}")
+
+    def file_operation_finished(self, job: FileJob, completed: bool):
+        """Point open tabs at moved files and close the tabs of deleted ones"""
+        if not self.file_operations.is_busy():
+            self.file_ops_cancel.hide()
+
+        for op in job.done:
+            if op.kind == FileOperation.MOVE:
+                self.path_moved(op.src, op.dst)
+            elif op.kind == FileOperation.DELETE:
+                for doc in self.documents.under(op.src):
+                    self.close_editor(doc.editor)
+
+        if job.errors:
+            self.statusBar().showMessage(f"{job.title} failed: {job.errors[0]}", 5000)
+        elif not completed:
+            self.statusBar().showMessage(f"{job.title} cancelled", 3000)
+        else:
+            self.statusBar().showMessage(f"{job.title} done", 2000)
+
+    def path_moved(self, old: Path, new: Path):
+        """Update the open tabs after a file or folder was renamed or moved"""
+        for doc, path in self.documents.move(old, new):
+            self.set_editor_path(doc.editor, path)
+
+    def set_editor_path(self, editor: Editor, path: Path):
+        """Point an open tab at a new path"""
+        self.workspace_watcher.unwatch_file(editor.full_path)
+        old_path = str(editor.full_path)
+        editor.path = path
+        editor.full_path = path.absolute()
+        self.workspace_watcher.watch_file(path)
+        if self.diagnostics is not None:
+            self.diagnostics.renamed(old_path, editor)
+
+        self.editor_modified(editor, editor.isModified())
+        if self.tab_view.currentWidget() == editor:
+            self.current_file = path
+            self.outline.update_scope(force=True)
+
+    def editor_modified(self, editor: Editor, modified: bool):
+        """Star the tab of an editor whose text differs from its file, only called when that flips"""
+        index = self.tab_view.indexOf(editor)
+        if index == -1:
+            return # still being opened
+        tab_name = ("*" if modified else "") + editor.path.name
+        self.tab_view.setTabText(index, tab_name)
+        if self.tab_view.currentWidget() is editor:
+            self.setWindowTitle(f"{tab_name} - {self.app_name}")
+
     def is_binary(self, path):
         """
         Check if file is binary
@@ -580,23 +1000,42 @@ class MainWindow(FramelessMainWindow):
         if t is not None:
             t.copy()
 
+    def find_in_file(self, replace=False):
+        editor = self.tab_view.currentWidget()
+        if isinstance(editor, Editor):
+            editor.show_find_bar(replace)
+
+    def edit_lines(self, operation):
+        """Run one of the line_operations on the current editor"""
+        editor = self.tab_view.currentWidget()
+        if isinstance(editor, Editor):
+            operation(editor)
+
     def set_new_tab(self, path: Path, is_new_file=False):
 
+        if not is_new_file:
+            # check if file is already open, before touching the disk or building anything
+            open_editor = self.documents.editor(path)
+            if open_editor is not None:
+                # set the active tab to that
+                self.tab_view.setCurrentWidget(open_editor)
+                self.current_file = open_editor.path
+                return
+
+        if path.is_dir():
+            return
+
         if not is_new_file and self.is_binary(path):
             self.statusBar().showMessage("Cannot Open Binary File", 2000)
             return
         
-        if path.is_dir():
-            return
-        
         if self.welcome_frame:
             idx = self.hsplit.indexOf(self.welcome_frame)
             if idx != -1:
                 self.hsplit.replaceWidget(idx, self.tab_view)
 
-        text_edit = self.get_editor(path, path.suffix)
-        
         if is_new_file:
+            text_edit = self.get_editor(path, path.suffix)
             self.tab_view.addTab(text_edit, "untitled")
             self.setWindowTitle("untitled - " + self.app_name)
             self.statusBar().showMessage(f"Opened untitled", 2000)
@@ -604,17 +1043,16 @@ class MainWindow(FramelessMainWindow):
             self.current_file = None
             return
 
-        # check if file is already open
-        for i in range(self.tab_view.count()):
-
-            if self.tab_view.tabText(i) == path.name or self.tab_view.tabText(i) == "*"+path.name: # check for unsaved state too
-                # set the active tab to that
-                self.tab_view.setCurrentIndex(i)
-                self.current_file = path
-                return
-
+        # only built once we know the file is not open yet, the heavy parts
+        # (lexer, completion) wait until the tab is first shown
+        text_edit = self.get_editor(path, path.suffix)
         self.tab_view.addTab(text_edit, path.name)
-        text_edit.setText(path.read_text(encoding="utf-8"))
+        self.documents.add(path, text_edit)
+        with instrumentation.span("file.open"):
+            text_edit.load_text(path.read_text(encoding="utf-8"))
+        if self.diagnostics is not None:
+            self.diagnostics.opened(text_edit)
+        self.workspace_watcher.watch_file(path)
         self.setWindowTitle(f"{path.name} - {self.app_name}")
         self.statusBar().showMessage(f"Opened {path.name}", 2000)
         # set the active tab to that
@@ -634,12 +1072,20 @@ class MainWindow(FramelessMainWindow):
         if self.current_file is None:
             return
 
-        text_edit = self.tab_view.currentWidget()
-        self.current_file.write_text(text_edit.text())
+        text_edit: Editor = self.tab_view.currentWidget()
+        if text_edit.changed_on_disk():
+            dialog = self.show_dialog(
+                "Save", f"{self.current_file.name} changed on disk since it was opened. Overwrite it?"
+            )
+            if dialog != QMessageBox.Yes:
+                self.statusBar().showMessage("Not saved", 2000)
+                return
+        with instrumentation.span("file.save"):
+            text = text_edit.text()
+            self.current_file.write_text(text)
+            text_edit.mark_saved(text)
         self.statusBar().showMessage(f"Saved {self.current_file.name}", 2000)
 
-        text_edit.current_file_changed = False
-
     def save_as(self):
 
         text_edit = self.tab_view.currentWidget()
@@ -650,7 +1096,8 @@ class MainWindow(FramelessMainWindow):
             self.statusBar().showMessage("Cancelled", 2000)
             return
         path = Path(file_path)
-        path.write_text(text_edit.text())
+        text = text_edit.text()
+        path.write_text(text)
         # new
         self.current_file = path
         self.tab_view.setTabText(self.tab_view.currentIndex(), path.name)
@@ -658,7 +1105,12 @@ class MainWindow(FramelessMainWindow):
 
         # UPDATED EP 9
         editor: Editor = self.tab_view.currentWidget()
-        editor.current_file_changed = False
+        doc = self.documents.get(editor.path)
+        if doc is not None and doc.editor is editor:
+            self.documents.remove(editor.path)
+        self.documents.add(path, editor)
+        self.set_editor_path(editor, path)
+        editor.mark_saved(text)
 
     def open_file_dlg(self):
         new_file, _ = QFileDialog.getOpenFileName(
@@ -674,15 +1126,83 @@ class MainWindow(FramelessMainWindow):
             self, "Pick A Folder", ""
         )
         if new_folder:
-            self.file_manager.model.setRootPath(new_folder)
-            self.file_manager.setRootIndex(self.file_manager.model.index(new_folder))
+            self.set_workspace(new_folder)
             self.statusBar().showMessage(f"Opened {new_folder}", 2000)
-            self.current_dir_lbl.setText(Path(new_folder).name)
 
-            self.tab_view.clear()
-            idx = self.hsplit.indexOf(self.tab_view)
-            if idx != -1:
-                self.hsplit.replaceWidget(idx, self.welcome_frame)
+    def set_workspace(self, new_folder: str, background=True):
+        """
+        Make new_folder the workspace root, closes every tab. `background` starts
+        venv discovery and indexing, at startup deferred_init does that instead.
+        """
+        self.file_manager.set_root_path(new_folder)
+        self.current_dir_lbl.setText(Path(new_folder).name)
+        self.workspace_watcher.set_root(new_folder)
+        self.venv = self.settings.workspace(new_folder).get("venv")
+        if background:
+            self.discover_venvs(new_folder)
+            self.index_workspace(new_folder)
+
+        for doc in self.documents:
+            self.workspace_watcher.unwatch_file(doc.path)
+            if self.diagnostics is not None:
+                self.diagnostics.closed(doc.editor, recheck=False)
+        self.documents.clear()
+        self.tab_view.clear()
+        if background:
+            self.check_workspace(new_folder)
+        idx = self.hsplit.indexOf(self.tab_view)
+        if idx != -1:
+            self.hsplit.replaceWidget(idx, self.welcome_frame)
+
+    def save_session(self):
+        tabs = []
+        active = 0
+        for i in range(self.tab_view.count()):
+            editor: Editor = self.tab_view.widget(i)
+            if self.documents.editor(editor.path) is not editor:
+                continue # untitled
+            if i == self.tab_view.currentIndex():
+                active = len(tabs)
+            tabs.append(SessionTab(str(editor.path), *editor.view_state()))
+        self.session.save(self.file_manager.model.rootPath(), tabs, active)
+
+    def restore_session(self):
+        restored = self.session.load()
+        if restored is None:
+            return
+        root, tabs, active = restored
+        if root and os.path.isdir(root) and os.path.abspath(root) != os.path.abspath(os.getcwd()):
+            # venvs are discovered for the restored root after the first paint
+            self.set_workspace(root, background=False)
+
+        for tab in tabs:
+            path = Path(tab.path)
+            if not path.is_file() or path in self.documents:
+                continue
+            editor = self.get_editor(path, path.suffix)
+            editor.defer_load(tab.line, tab.index, tab.first_visible)
+            self.tab_view.addTab(editor, path.name)
+            self.documents.add(path, editor)
+            self.workspace_watcher.watch_file(path)
+
+        if self.tab_view.count() == 0:
+            return
+        idx = self.hsplit.indexOf(self.welcome_frame)
+        if idx != -1:
+            self.hsplit.replaceWidget(idx, self.tab_view)
+        self.tab_view.setCurrentIndex(min(active, self.tab_view.count() - 1))
+        editor: Editor = self.tab_view.currentWidget()
+        self.current_file = editor.path
+        self.setWindowTitle(f"{editor.path.name} - {self.app_name}")
+
+    def closeEvent(self, e) -> None:
+        self.save_session()
+        if self.code_indexer is not None:
+            self.code_indexer.stop()
+            self.code_indexer.wait()
+        if self.venv_discovery is not None:
+            self.venv_discovery.wait()
+        return super().closeEvent(e)
 
     
 if __name__ == "__main__":
@@ -691,11 +1211,28 @@ if __name__ == "__main__":
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
     QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)
 
-    app = QApplication([])
+    parser = argparse.ArgumentParser(prog="main.py")
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="print a phase by phase startup timeline",
+    )
+    parser.add_argument(
+        "--watchdog", action="store_true",
+        help="log the stacks of GUI thread stalls, see stall_threshold_ms",
+    )
+    args, qt_args = parser.parse_known_args()
+    startup_profile.enabled = args.profile_startup
+
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setAttribute(Qt.AA_DontCreateNativeWidgetSiblings)
 
     window = MainWindow()
     app.installEventFilter(window.header)
 
+    if args.watchdog or window.settings.get("stall_watchdog", False):
+        watchdog = StallWatchdog(window.settings.get("stall_threshold_ms", 200))
+        app.aboutToQuit.connect(watchdog.stop)
+        watchdog.start()
+
 
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,283 @@
+from typing import TYPE_CHECKING
+
+from PyQt5.QtCore import QObject, QThread, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
+
+from bisect import bisect_right
+import ast
+import threading
+
+from instrumentation import instrumentation
+
+if TYPE_CHECKING:
+    from editor import Editor
+
+# bigger files are not outlined, parsing them would hold the GIL too long
+MAX_OUTLINE_SIZE = 2 * 1024 * 1024
+KIND_COLORS = {
+    "class": QColor("#e5c07b"),
+    "function": QColor("#61afef"),
+    "method": QColor("#c678dd"),
+}
+
+
+class OutlineSymbol:
+    def __init__(self, index: int, name: str, kind: str, line: int, column: int, end_line: int, parent: int, depth: int):
+        # position in Outline.symbols
+        self.index = index
+        self.name = name
+        # class, function or method
+        self.kind = kind
+        # 0 based, end_line is the last line of the body
+        self.line = line
+        self.column = column
+        self.end_line = end_line
+        # index of the enclosing symbol, -1 at module level
+        self.parent = parent
+        self.depth = depth
+
+
+class Outline:
+    """
+    Classes and functions of a module in document order, plus the lines split
+    into segments that each belong to one innermost symbol. Finding the scope
+    of a line is a bisect over the segment starts.
+    """
+
+    def __init__(self, symbols: list[OutlineSymbol]):
+        self.symbols = symbols
+        # segment i covers starts[i] up to starts[i + 1], owned by owners[i]
+        self.starts = [0]
+        self.owners = [-1]
+        self.add_segments(-1)
+
+    def add_segment(self, start: int, owner: int):
+        if self.starts[-1] == start:
+            self.owners[-1] = owner
+        else:
+            self.starts.append(start)
+            self.owners.append(owner)
+
+    def add_segments(self, parent: int):
+        # children of a symbol come right after it, so one pass over the list does it
+        i = parent + 1
+        while i < len(self.symbols) and self.symbols[i].parent == parent:
+            symbol = self.symbols[i]
+            self.add_segment(symbol.line, i)
+            i = self.add_segments(i)
+            self.add_segment(symbol.end_line + 1, parent)
+        return i
+
+    def innermost(self, line: int) -> int:
+        """Index of the symbol around line, -1 for module level"""
+        return self.owners[bisect_right(self.starts, line) - 1]
+
+    def scope_at(self, line: int) -> list[OutlineSymbol]:
+        """Symbols around line, outermost first"""
+        scope = []
+        i = self.innermost(line)
+        while i >= 0:
+            symbol = self.symbols[i]
+            scope.append(symbol)
+            i = symbol.parent
+        scope.reverse()
+        return scope
+
+
+@instrumentation.timed("outline.build")
+def build_outline(text: str):
+    """Outline of Python source, None when it does not parse"""
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    symbols = []
+
+    def walk(node, parent: int, depth: int, in_class: bool):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                if isinstance(child, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if in_class else "function"
+                symbols.append(OutlineSymbol(
+                    len(symbols), child.name, kind, child.lineno - 1, child.col_offset, child.end_lineno - 1, parent, depth
+                ))
+                walk(child, len(symbols) - 1, depth + 1, kind == "class")
+            elif isinstance(child, (ast.stmt, ast.excepthandler, ast.match_case)):
+                # defs inside if, try, with and friends still belong to this scope
+                walk(child, parent, depth, in_class)
+
+    walk(tree, -1, 0, False)
+    return Outline(symbols)
+
+
+class OutlineWorker(QThread):
+    """Parses in the background, only the newest request waiting is kept"""
+    # editor, text version, Outline or None
+    built = pyqtSignal(object, int, object)
+
+    def __init__(self):
+        super(OutlineWorker, self).__init__(None)
+        self.condition = threading.Condition()
+        self.pending = None
+        self._stop = False
+
+    def request(self, editor, version: int, text: str):
+        with self.condition:
+            self.pending = (editor, version, text)
+            self.condition.notify()
+        if not self.isRunning():
+            self.start()
+
+    def stop(self):
+        with self.condition:
+            self._stop = True
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self._stop:
+                    self.condition.wait()
+                if self._stop:
+                    return
+                (editor, version, text), self.pending = self.pending, None
+            try:
+                self.built.emit(editor, version, build_outline(text))
+            except Exception as e:
+                print("Outline error:", e)
+
+
+class OutlineService(QObject):
+    """
+    Outline and scope of the current editor.
+
+    The outline is rebuilt a moment after the text changes and kept on the
+    editor with the text version it is for, so switching tabs reuses it.
+    While the file does not parse the last good outline stays. Moving the
+    cursor only looks the line up in it, scope_changed fires when the
+    scope is a different one.
+    """
+    # Outline or None
+    outline_changed = pyqtSignal(object)
+    # file name, symbols around the cursor outermost first
+    scope_changed = pyqtSignal(str, list)
+
+    def __init__(self, delay_ms=300, parent=None):
+        super(OutlineService, self).__init__(parent)
+        self.worker = OutlineWorker()
+        self.worker.built.connect(self.built)
+        self.editor: "Editor" = None
+        self.scope: list[OutlineSymbol] = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.request)
+
+    def set_editor(self, editor: "Editor"):
+        if editor is self.editor:
+            return
+        if self.editor is not None:
+            try:
+                self.editor.textChanged.disconnect(self.text_changed)
+                self.editor.cursorPositionChanged.disconnect(self.cursor_moved)
+            except (TypeError, RuntimeError):
+                pass # the editor is gone already
+        self.editor = editor
+        self.timer.stop()
+        if editor is not None:
+            editor.textChanged.connect(self.text_changed)
+            editor.cursorPositionChanged.connect(self.cursor_moved)
+        self.outline_changed.emit(self.outline())
+        self.update_scope(force=True)
+        self.request()
+
+    def outline(self):
+        return None if self.editor is None else self.editor.outline
+
+    def text_changed(self):
+        self.timer.start()
+
+    def request(self):
+        editor = self.editor
+        if editor is None or not editor.is_python_file or editor.outline_version == editor.version:
+            return
+        if editor.length() > MAX_OUTLINE_SIZE:
+            return
+        self.worker.request(editor, editor.version, editor.text())
+
+    def built(self, editor: "Editor", version: int, outline: Outline):
+        if version <= editor.outline_version:
+            return
+        editor.outline_version = version
+        if outline is None:
+            return # keep the last outline that parsed
+        editor.outline = outline
+        if editor is self.editor:
+            self.outline_changed.emit(outline)
+            self.update_scope(force=True)
+
+    def cursor_moved(self, line: int, index: int):
+        self.update_scope(line)
+
+    def update_scope(self, line: int = None, force=False):
+        editor = self.editor
+        if editor is None:
+            self.scope = None
+            self.scope_changed.emit("", [])
+            return
+        if line is None:
+            line, _ = editor.getCursorPosition()
+        scope = editor.outline.scope_at(line) if editor.outline is not None else []
+        if not force and scope == self.scope:
+            return
+        self.scope = scope
+        self.scope_changed.emit(editor.path.name, scope)
+
+    def stop(self):
+        self.worker.stop()
+
+
+class OutlineView(QTreeWidget):
+    """Tree of the current file's classes and functions, the one at the cursor is selected"""
+    # symbol clicked
+    symbol_activated = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super(OutlineView, self).__init__(parent)
+        self.setHeaderHidden(True)
+        self.setIndentation(14)
+        self.outline: Outline = None
+        # item of each symbol, by index in the outline
+        self.items: list[QTreeWidgetItem] = []
+        self.itemClicked.connect(lambda item, column: self.symbol_activated.emit(item.data(0, Qt.UserRole)))
+
+    def set_outline(self, outline: Outline):
+        if outline is self.outline:
+            return
+        self.outline = outline
+        self.setUpdatesEnabled(False)
+        self.clear()
+        self.items = []
+        for symbol in outline.symbols if outline is not None else []:
+            parent = self.items[symbol.parent] if symbol.parent >= 0 else self.invisibleRootItem()
+            item = QTreeWidgetItem(parent, [symbol.name])
+            item.setForeground(0, KIND_COLORS[symbol.kind])
+            item.setToolTip(0, f"{symbol.kind} {symbol.name}, line {symbol.line + 1}")
+            item.setData(0, Qt.UserRole, symbol)
+            self.items.append(item)
+        self.expandAll()
+        self.setUpdatesEnabled(True)
+
+    def set_scope(self, scope: list[OutlineSymbol]):
+        if not scope or self.outline is None:
+            self.clearSelection()
+            return
+        symbol = scope[-1]
+        if symbol.index < len(self.items) and self.outline.symbols[symbol.index] is symbol:
+            self.blockSignals(True)
+            self.setCurrentItem(self.items[symbol.index])
+            self.blockSignals(False)
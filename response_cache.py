@@ -0,0 +1,92 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from settings import data_dir
+
+
+class ResponseCache:
+    """
+    Chat answers on disk, one file per answer in ~/.auditcode/responses.
+
+    Keyed by model, options and the full message list, so only an identical
+    request hits. Least recently used answers are deleted once the folder
+    grows past max_bytes, a file's mtime is its last use. Only the chat worker
+    thread uses it.
+    """
+
+    def __init__(self, max_bytes=50 * 1024 * 1024, path: Path = None):
+        self.max_bytes = max_bytes
+        self.path = path or data_dir() / "responses"
+        self.path.mkdir(parents=True, exist_ok=True)
+        # key -> (size, last use), read from the folder on first use
+        self.entries: dict[str, tuple[int, float]] = None
+
+    @staticmethod
+    def key(model: str, options: dict, messages: list[dict]) -> str:
+        data = json.dumps([model, options, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def load_entries(self):
+        self.entries = {}
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                self.entries[entry.name[:-5]] = (stat.st_size, stat.st_mtime)
+
+    def file(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def get(self, key: str):
+        if self.entries is None:
+            self.load_entries()
+        if key not in self.entries:
+            return None
+        try:
+            with open(self.file(key), "r", encoding="utf-8") as f:
+                text = json.load(f)["response"]
+            os.utime(self.file(key))
+        except (OSError, ValueError, KeyError):
+            self.entries.pop(key, None)
+            return None
+        self.entries[key] = (self.entries[key][0], os.path.getmtime(self.file(key)))
+        return text
+
+    def put(self, key: str, text: str):
+        if self.entries is None:
+            self.load_entries()
+        data = json.dumps({"response": text}, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        tmp = self.file(key).with_suffix(".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.file(key))
+        except OSError as err:
+            print("Response cache error:", err)
+            return
+        self.entries[key] = (len(data), os.path.getmtime(self.file(key)))
+        self.evict()
+
+    def evict(self):
+        total = sum(size for size, _ in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k][1]):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries.pop(key)[0]
+            try:
+                os.remove(self.file(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        if self.entries is None:
+            self.load_entries()
+        for key in list(self.entries):
+            try:
+                os.remove(self.file(key))
+            except OSError:
+                pass
+        self.entries = {}
@@ -0,0 +1,235 @@
+"""Benchmark harness for the SearchWorker.
+
+Generates a reproducible corpus and runs the search engine headless,
+printing JSON that can be diffed between runs:
+
+    py search_benchmark.py --seed 0 --output bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from fuzzy_searcher import SearchWorker
+
+
+WORDS = [
+    "editor", "lexer", "token", "window", "tab", "search", "worker", "thread",
+    "model", "index", "path", "file", "value", "result", "item", "style",
+    "theme", "font", "color", "cursor", "line", "buffer", "cache", "query",
+]
+NEEDLE = "needle"
+
+# (name, pattern, use_regex, case_sensitive)
+QUERIES = [
+    ("literal", NEEDLE, False, True),
+    ("case_insensitive", NEEDLE.upper(), False, False),
+    ("regex", r"def \w+_handler\(", True, True),
+]
+
+
+class TimedSearchWorker(SearchWorker):
+    """SearchWorker that records when the first result was found and which files it read"""
+
+    def __init__(self):
+        super(TimedSearchWorker, self).__init__()
+        self.started_at = 0.0
+        self.first_result_at = None
+        # the search stops at its result limit, throughput counts only these
+        self.scanned: list[str] = []
+
+    def walk_cached(self, path, exclude_dirs):
+        for root, files in super().walk_cached(path, exclude_dirs):
+            yield root, files
+            # every file of a directory is read once the walk goes on past it
+            self.scanned.extend(os.path.join(root, f) for f in files)
+
+    def add_item(self, item):
+        if self.first_result_at is None:
+            self.first_result_at = time.perf_counter()
+        super().add_item(item)
+
+
+def random_line(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.02:
+        return f"    found the {NEEDLE} in {rng.choice(WORDS)}\n"
+    if roll < 0.05:
+        return f"def {rng.choice(WORDS)}_handler({rng.choice(WORDS)}):\n"
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) + "\n"
+
+
+def write_text(path: Path, rng: random.Random, size: int, encoding="utf-8"):
+    lines = []
+    written = 0
+    while written < size:
+        line = random_line(rng)
+        lines.append(line)
+        written += len(line)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(lines), encoding=encoding)
+
+
+def generate_corpus(root: Path, seed=0, scale=1.0) -> dict:
+    """
+    Generate the benchmark corpus under root
+
+    :return: manifest describing what was generated
+    """
+    rng = random.Random(seed)
+    counts = {
+        "small_files": int(2000 * scale),
+        "huge_files": max(1, int(3 * scale)),
+        "binary_files": int(200 * scale),
+        "tree_depth": 40,
+        "encoded_files": int(100 * scale),
+    }
+
+    for i in range(counts["small_files"]):
+        folder = root / "small" / f"pkg{i % 50}"
+        write_text(folder / f"module{i}.py", rng, rng.randint(200, 4000))
+
+    for i in range(counts["huge_files"]):
+        write_text(root / "huge" / f"huge{i}.txt", rng, int(8_000_000 * scale))
+
+    binary = root / "binary"
+    binary.mkdir(parents=True, exist_ok=True)
+    for i in range(counts["binary_files"]):
+        data = bytearray(rng.randbytes(rng.randint(1024, 64 * 1024)))
+        data[rng.randrange(0, 512)] = 0  # make sure the binary check sees it
+        (binary / f"blob{i}.dat").write_bytes(bytes(data))
+
+    deep = root / "deep"
+    for depth in range(counts["tree_depth"]):
+        deep = deep / f"level{depth}"
+        write_text(deep / "leaf.py", rng, 1000)
+
+    encodings = ["utf-8", "utf-8-sig", "latin-1", "cp1252", "utf-16"]
+    for i in range(counts["encoded_files"]):
+        enc = encodings[i % len(encodings)]
+        path = root / "encodings" / f"{enc}_{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = "".join(random_line(rng) for _ in range(50)) + "café naïve\n"
+        path.write_text(text, encoding=enc)
+
+    files = 0
+    total_bytes = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            files += 1
+            total_bytes += os.path.getsize(os.path.join(dirpath, name))
+
+    return {"seed": seed, "scale": scale, "counts": counts, "files": files, "bytes": total_bytes}
+
+
+def run_query(root: Path, pattern: str, use_regex: bool, case_sensitive: bool, trace_memory=False):
+    worker = TimedSearchWorker()
+    worker.search_text = pattern
+    worker.search_path = str(root)
+    worker.search_project = False
+    worker.use_regex = use_regex
+    worker.case_sensitive = case_sensitive
+
+    if trace_memory:
+        tracemalloc.start()
+    # the worker prints every file it fails to decode, keep the output clean
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker.started_at = time.perf_counter()
+        worker.search()
+        ended_at = time.perf_counter()
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    first = None
+    if worker.first_result_at is not None:
+        first = worker.first_result_at - worker.started_at
+    return {
+        "time_to_first_result": first,
+        "total": ended_at - worker.started_at,
+        "results": len(worker.items),
+        "truncated": len(worker.items) > 5_000,
+        "files": len(worker.scanned),
+        "bytes": sum(os.path.getsize(p) for p in worker.scanned),
+        "peak_memory": peak,
+    }
+
+
+def benchmark(root: Path, repeat=3) -> dict:
+    results = {}
+    for name, pattern, use_regex, case_sensitive in QUERIES:
+        runs = [run_query(root, pattern, use_regex, case_sensitive) for _ in range(repeat)]
+        # memory is measured in its own pass, tracemalloc slows the timed runs down
+        memory = run_query(root, pattern, use_regex, case_sensitive, trace_memory=True)
+
+        total = statistics.median(r["total"] for r in runs)
+        firsts = [r["time_to_first_result"] for r in runs if r["time_to_first_result"] is not None]
+        scanned = runs[0]
+        results[name] = {
+            "pattern": pattern,
+            "results": scanned["results"],
+            # hit the worker's result limit, only part of the corpus was read
+            "truncated": scanned["truncated"],
+            "files_scanned": scanned["files"],
+            "bytes_scanned": scanned["bytes"],
+            "time_to_first_result": statistics.median(firsts) if firsts else None,
+            "total_scan_time": total,
+            "total_scan_time_min": min(r["total"] for r in runs),
+            "files_per_sec": scanned["files"] / total if total else None,
+            "bytes_per_sec": scanned["bytes"] / total if total else None,
+            "peak_memory": memory["peak_memory"],
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SearchWorker on a generated corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0, help="corpus size multiplier")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per query")
+    parser.add_argument("--corpus", type=Path, help="empty directory to generate the corpus in, kept (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated temp corpus")
+    parser.add_argument("--output", type=Path, help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.corpus and args.corpus.exists() and any(args.corpus.iterdir()):
+        parser.error(f"--corpus {args.corpus} is not empty")
+    # only a temp dir created here is ever deleted
+    temp = args.corpus is None
+    root = Path(tempfile.mkdtemp(prefix="search_bench_")) if temp else args.corpus
+    try:
+        gen_start = time.perf_counter()
+        manifest = generate_corpus(root, args.seed, args.scale)
+        manifest["generate_time"] = time.perf_counter() - gen_start
+
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": manifest,
+            "queries": benchmark(root, args.repeat),
+        }
+    finally:
+        if temp and not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        args.output.write_text(out + "\n")
+    else:
+        print(out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from settings import data_dir, read_json, write_json
+
+
+class SessionTab:
+    """Where the user was in one open file"""
+
+    def __init__(self, path: str, line=0, index=0, first_visible=0):
+        self.path = path
+        self.line = line
+        self.index = index
+        self.first_visible = first_visible
+
+
+class Session:
+    """
+    Open tabs of the last run, stored as one compact JSON file:
+    {"root": ..., "active": 0, "tabs": [[path, line, index, first_visible], ...]}
+    """
+
+    def __init__(self, path: Path = None):
+        self.path = path or data_dir() / "session.json"
+
+    def save(self, root: str, tabs: list[SessionTab], active: int):
+        write_json(self.path, {
+            "root": root,
+            "active": active,
+            "tabs": [[t.path, t.line, t.index, t.first_visible] for t in tabs],
+        })
+
+    def load(self):
+        """(root, tabs, active index), None when there is no usable session"""
+        data = read_json(self.path)
+        if not isinstance(data, dict):
+            return None
+        try:
+            tabs = [SessionTab(*t) for t in data.get("tabs", [])]
+        except TypeError:
+            return None
+        return data.get("root"), tabs, data.get("active", 0)
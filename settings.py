@@ -0,0 +1,63 @@
+from pathlib import Path
+import json
+import os
+
+
+def data_dir() -> Path:
+    """Where settings, caches and the session live, AUDITCODE_HOME overrides it"""
+    path = Path(os.environ.get("AUDITCODE_HOME", Path.home() / ".auditcode"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def write_json(path: Path, data):
+    """Write through a temporary file so a crash never leaves half a file behind"""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def read_json(path: Path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class Settings:
+    """Small JSON backed key/value store, with a section per workspace"""
+
+    def __init__(self, path: Path = None):
+        self.path = path or data_dir() / "settings.json"
+        self.data: dict = read_json(self.path, {})
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key: str, value):
+        self.data[key] = value
+        self.save()
+
+    def workspace(self, root) -> dict:
+        """Settings of one workspace, keyed by its absolute path"""
+        return self.data.get("workspaces", {}).get(os.path.abspath(root), {})
+
+    def set_workspace(self, root, key: str, value):
+        workspaces = self.data.setdefault("workspaces", {})
+        workspaces.setdefault(os.path.abspath(root), {})[key] = value
+        self.save()
+
+    def save(self):
+        write_json(self.path, self.data)
+
+
+_settings: Settings = None
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
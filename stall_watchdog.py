@@ -0,0 +1,139 @@
+"""
+Watchdog for freezes of the GUI thread, for `py main.py --watchdog` or the
+`stall_watchdog` setting.
+
+A timer on the event loop beats every few milliseconds. A background thread
+checks the beat, while it is older than the threshold the loop is stuck and
+the thread samples the main thread's Python stack. When the loop runs again
+the stall is logged with its duration and the stack seen most while it
+lasted. Stalls are grouped by that stack, on quit the groups are written
+out most frequent first so the worst offenders get fixed first.
+"""
+from PyQt5.QtCore import QObject, QTimer, Qt
+
+from datetime import datetime
+import sys
+import threading
+import time
+import traceback
+
+from settings import data_dir
+
+# frames kept of each sampled stack, innermost first
+STACK_DEPTH = 40
+
+
+class StallGroup:
+    """Stalls that were stuck in the same functions"""
+
+    def __init__(self, stack: list[str]):
+        self.stack = stack
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.longest = max(self.longest, duration)
+
+
+class StallWatchdog(QObject):
+    def __init__(self, threshold_ms=200, log_path=None, parent=None):
+        super(StallWatchdog, self).__init__(parent)
+        self.threshold = threshold_ms / 1000
+        self.interval = min(50, max(5, threshold_ms // 4)) / 1000
+        self.log_path = log_path or data_dir() / "stalls.log"
+        self.main_id = threading.main_thread().ident
+        self.beat = time.monotonic()
+        # stacks sampled by the watchdog thread since the last beat, list.append is atomic
+        self.samples: list[tuple] = []
+        # function level stack -> StallGroup
+        self.groups: dict[tuple, StallGroup] = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.watch, name="stall watchdog", daemon=True)
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(int(self.interval * 1000))
+        self.timer.timeout.connect(self.heartbeat)
+
+    def start(self):
+        self.beat = time.monotonic()
+        self.timer.start()
+        self.thread.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.stopped.set()
+        self.thread.join()
+        self.write_report()
+
+    def heartbeat(self):
+        now = time.monotonic()
+        stalled = now - self.beat - self.interval
+        self.beat = now
+        if not self.samples:
+            return
+        samples, self.samples = self.samples, []
+        if stalled >= self.threshold:
+            self.stalled(stalled, samples)
+
+    def watch(self):
+        # check a few times per threshold so a stall is caught close to its start
+        poll = max(self.threshold / 4, 0.005)
+        while not self.stopped.wait(poll):
+            if time.monotonic() - self.beat > self.threshold + self.interval:
+                sample = self.sample()
+                if sample is not None:
+                    self.samples.append(sample)
+
+    def sample(self):
+        frame = sys._current_frames().get(self.main_id)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame, STACK_DEPTH)
+        del frame
+        # line numbers move around inside a busy loop, the functions do not
+        key = tuple((entry.filename, entry.name) for entry in stack)
+        lines = [f"{entry.filename}:{entry.lineno} in {entry.name}" for entry in reversed(stack)]
+        return key, lines
+
+    def stalled(self, duration: float, samples: list[tuple]):
+        counts: dict[tuple, int] = {}
+        for key, _ in samples:
+            counts[key] = counts.get(key, 0) + 1
+        key = max(counts, key=counts.get)
+        stack = next(lines for k, lines in samples if k == key)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = StallGroup(stack)
+        group.add(duration)
+        timestamp = datetime.now().isoformat(sep=" ", timespec="seconds")
+        self.log(
+            f"{timestamp} stall {duration * 1000:.0f} ms, {len(samples)} samples\n"
+            + "".join(f"  {line}\n" for line in stack)
+        )
+
+    def ranked(self) -> list[StallGroup]:
+        return sorted(self.groups.values(), key=lambda group: (group.count, group.total), reverse=True)
+
+    def write_report(self):
+        groups = self.ranked()
+        if not groups:
+            return
+        timestamp = datetime.now().isoformat(sep=" ", timespec="seconds")
+        report = [f"{timestamp} stalls by frequency, threshold {self.threshold * 1000:.0f} ms\n"]
+        for group in groups:
+            report.append(
+                f"{group.count:5d}x  total {group.total * 1000:.0f} ms  longest {group.longest * 1000:.0f} ms\n"
+                + "".join(f"  {line}\n" for line in group.stack)
+            )
+        self.log("".join(report))
+        print(f"{sum(group.count for group in groups)} GUI stalls, see {self.log_path}", file=sys.stderr)
+
+    def log(self, text: str):
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(text + "\n")
+        except OSError as e:
+            print("Watchdog error:", e)
@@ -0,0 +1,54 @@
+"""
+Startup timeline for `py main.py --profile-startup`.
+
+Imported first by main.py so the "imports" phase covers every other import.
+"""
+import time
+
+_process_start = time.perf_counter()
+
+import sys
+
+from PyQt5.QtCore import QObject, QEvent
+
+
+class StartupProfile:
+    """Records named phases since process start and prints them as a timeline"""
+
+    def __init__(self, start: float):
+        self.enabled = False
+        self.start = start
+        self.last = start
+        # (phase, phase duration, time since start) in seconds
+        self.phases: list[tuple[str, float, float]] = []
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last, now - self.start))
+        self.last = now
+
+    def report(self, out=None):
+        if not self.enabled:
+            return
+        out = out or sys.stderr
+        print("startup profile", file=out)
+        for phase, duration, total in self.phases:
+            print(f"  {phase:<20} {duration * 1000:8.1f} ms   at {total * 1000:8.1f} ms", file=out)
+
+
+class FirstPaintFilter(QObject):
+    """Calls back once, when the watched widget gets its first paint event"""
+
+    def __init__(self, widget, callback):
+        super(FirstPaintFilter, self).__init__(widget)
+        self.callback = callback
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            self.callback()
+        return False
+
+
+startup_profile = StartupProfile(_process_start)
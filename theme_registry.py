@@ -0,0 +1,103 @@
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QColor
+
+import json
+import os
+
+
+FONT_WEIGHTS = {
+    'thin': QFont.Thin,
+    'extralight': QFont.ExtraLight,
+    'light': QFont.Light,
+    'normal': QFont.Normal,
+    'medium': QFont.Medium,
+    'demibold': QFont.DemiBold,
+    'bold': QFont.Bold,
+    'extrabold': QFont.ExtraBold,
+    'black': QFont.Black,
+}
+
+
+class CompiledStyle:
+    """QColor/QFont objects for one theme style, built once and shared by every lexer"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.color: QColor = None
+        self.paper: QColor = None
+        self.font: QFont = None
+
+
+class ThemeRegistry(QObject):
+    """
+    Parses a theme file once per process and hands the compiled styles to every
+    lexer. The file is watched, on change it is parsed again and theme_changed
+    tells the lexers to restyle their editors.
+    """
+    theme_changed = pyqtSignal()
+
+    def __init__(self, path: str):
+        super(ThemeRegistry, self).__init__(None)
+        self.path = path
+        self.theme_json = None
+        self.styles: dict[str, CompiledStyle] = {}
+        self.load()
+
+        self.watcher = QFileSystemWatcher([self.path], self)
+        self.watcher.fileChanged.connect(self._file_changed)
+        # editors save in several steps, wait for the file to settle
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(200)
+        self.reload_timer.timeout.connect(self.reload)
+
+    def load(self):
+        with open(self.path, "r") as f:
+            self.theme_json = json.load(f)
+        self.styles = self.compile(self.theme_json)
+
+    def compile(self, theme_json) -> dict[str, CompiledStyle]:
+        styles = {}
+        for clr in theme_json["theme"]["syntax"]:
+            name: str = list(clr.keys())[0]
+            style = CompiledStyle(name)
+            for k, v in clr[name].items():
+                if k == 'color':
+                    style.color = QColor(v)
+                elif k == 'paper':
+                    style.paper = QColor(v)
+                elif k == 'font':
+                    style.font = QFont(
+                        v.get('family', 'Consolas'),
+                        v.get('font-size', 14),
+                        FONT_WEIGHTS.get(v.get('font-weight', 'normal'), QFont.Normal),
+                        v.get('italic', False),
+                    )
+            styles[name] = style
+        return styles
+
+    def reload(self):
+        try:
+            self.load()
+        except (OSError, ValueError, KeyError) as e:
+            # keep the current theme while the file is broken
+            print(f"Theme error: {e}")
+            return
+        self.theme_changed.emit()
+
+    def _file_changed(self, path: str):
+        # a save that replaces the file drops it from the watcher
+        if path not in self.watcher.files() and os.path.exists(path):
+            self.watcher.addPath(path)
+        self.reload_timer.start()
+
+
+_registries: dict[str, ThemeRegistry] = {}
+
+
+def get_theme_registry(path="./theme.json") -> ThemeRegistry:
+    """The process wide registry for a theme file"""
+    key = os.path.abspath(path)
+    if key not in _registries:
+        _registries[key] = ThemeRegistry(key)
+    return _registries[key]
@@ -0,0 +1,66 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import os
+import sys
+
+from settings import data_dir, read_json, write_json
+
+
+def mtime(path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+class VenvDiscovery(QThread):
+    """
+    Finds the virtualenvs of a workspace in the background. Results are cached on
+    disk per workspace and reused as long as the workspace folder, the running
+    interpreter and every found interpreter keep their modification times.
+    """
+    # list of virtualenv paths
+    found = pyqtSignal(list)
+
+    def __init__(self, workspace: str):
+        super(VenvDiscovery, self).__init__(None)
+        self.workspace = os.path.abspath(workspace)
+        self.cache_path = data_dir() / "venvs.json"
+
+    def cache_key(self) -> dict:
+        return {
+            "workspace_mtime": mtime(self.workspace),
+            "interpreter_mtime": mtime(sys.executable),
+        }
+
+    def cached(self):
+        """Cached env paths, None when missing or stale"""
+        entry = read_json(self.cache_path, {}).get(self.workspace)
+        if entry is None or entry.get("key") != self.cache_key():
+            return None
+        for env in entry["envs"]:
+            if mtime(env["executable"]) != env["mtime"]:
+                return None
+        return [env["path"] for env in entry["envs"]]
+
+    def discover(self) -> list:
+        import jedi
+
+        envs = []
+        for env in jedi.find_virtualenvs(paths=[self.workspace]):
+            envs.append({"path": env.path, "executable": env.executable, "mtime": mtime(env.executable)})
+
+        cache = read_json(self.cache_path, {})
+        cache[self.workspace] = {"key": self.cache_key(), "envs": envs}
+        write_json(self.cache_path, cache)
+        return [env["path"] for env in envs]
+
+    def run(self):
+        try:
+            envs = self.cached()
+            if envs is None:
+                envs = self.discover()
+        except Exception as err:
+            print("Virtualenv discovery error:", err)
+            envs = []
+        self.found.emit(envs)
@@ -0,0 +1,196 @@
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+import os
+
+
+def stat_signature(path):
+    """(mtime, size) of path, None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def list_dir(path) -> dict:
+    """Map every entry name in path to its stat signature"""
+    entries = {}
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    entries[entry.name] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+class ChangeSet:
+    """Paths that changed during one debounce window"""
+
+    def __init__(self):
+        self.files: set[str] = set()
+        self.dirs: set[str] = set()
+
+    def __bool__(self):
+        return bool(self.files or self.dirs)
+
+    def __contains__(self, path):
+        return path in self.files or path in self.dirs
+
+    def __repr__(self):
+        return f"ChangeSet(files={len(self.files)}, dirs={len(self.dirs)})"
+
+
+class WorkspaceWatcher(QObject):
+    """
+    Watches the workspace root, the directories we have seen and the open files.
+    Bursts of events are coalesced and emitted as one ChangeSet after `debounce_ms`
+    of quiet. Paths the OS watcher refuses (inotify limits, network drives) fall back
+    to polling their stat signature every `poll_interval_ms`. Polling runs on the GUI
+    thread, so directories past `max_polled` paths are given up and reported through
+    `dropped`, open files are always polled.
+    """
+    changed = pyqtSignal(object)
+    # directories that are not watched at all, their changes are never reported
+    dropped = pyqtSignal(list)
+
+    def __init__(self, root=None, debounce_ms=300, poll_interval_ms=2000, use_polling=False,
+                 max_polled=500, parent=None):
+        super(WorkspaceWatcher, self).__init__(parent)
+
+        self.root = None
+        self.use_polling = use_polling or os.environ.get("AUDITCODE_POLL_WATCHER") == "1"
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.file_changed)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+
+        self.files: set[str] = set()
+        self.dirs: set[str] = set()
+        # directory -> {name: signature}, used to tell which entries changed
+        self.listings: dict[str, dict] = {}
+        # path -> signature, for paths the OS watcher could not take
+        self.polled: dict[str, tuple] = {}
+        self.max_polled = max_polled
+        # directories given up on, neither watched nor polled
+        self.unwatched: set[str] = set()
+
+        self.pending = ChangeSet()
+        self.debounce = QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(debounce_ms)
+        self.debounce.timeout.connect(self.flush)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(poll_interval_ms)
+        self.poll_timer.timeout.connect(self.poll)
+
+        if root is not None:
+            self.set_root(root)
+
+    def set_root(self, root):
+        """Switch to a new workspace root, directory watches of the old one are dropped"""
+        if self.dirs:
+            watched = [d for d in self.dirs if d not in self.polled]
+            if watched:
+                self.watcher.removePaths(watched)
+            for d in self.dirs:
+                self.polled.pop(d, None)
+        self.dirs.clear()
+        self.listings.clear()
+        self.unwatched.clear()
+        self.root = os.path.abspath(root)
+        self.watch_dir(self.root)
+
+    def watch_file(self, path):
+        path = os.path.abspath(path)
+        if path in self.files:
+            return
+        self.files.add(path)
+        self._add_path(path)
+
+    def unwatch_file(self, path):
+        path = os.path.abspath(path)
+        if path not in self.files:
+            return
+        self.files.discard(path)
+        self._remove_path(path)
+
+    def watch_dir(self, path):
+        self.watch_dirs([path])
+
+    def watch_dirs(self, paths):
+        dropped = []
+        for path in paths:
+            path = os.path.abspath(path)
+            if path in self.dirs or path in self.unwatched:
+                continue
+            if not self._add_path(path, is_dir=True):
+                self.unwatched.add(path)
+                dropped.append(path)
+                continue
+            self.dirs.add(path)
+            self.listings[path] = list_dir(path)
+        if dropped:
+            self.dropped.emit(dropped)
+
+    def _add_path(self, path, is_dir=False) -> bool:
+        """Watch path, False when it is a directory past the polling limit"""
+        if not self.use_polling and self.watcher.addPath(path):
+            return True
+        if is_dir and len(self.polled) >= self.max_polled:
+            return False
+        self.polled[path] = stat_signature(path)
+        if not self.poll_timer.isActive():
+            self.poll_timer.start()
+        return True
+
+    def _remove_path(self, path):
+        if path in self.polled:
+            del self.polled[path]
+            if not self.polled:
+                self.poll_timer.stop()
+        else:
+            self.watcher.removePath(path)
+
+    def file_changed(self, path: str):
+        # editors and git replace files instead of writing in place, which drops the watch
+        if (path in self.files and path not in self.polled
+                and path not in self.watcher.files() and os.path.exists(path)):
+            self.watcher.addPath(path)
+        self.pending.files.add(path)
+        self.debounce.start()
+
+    def directory_changed(self, path: str):
+        old = self.listings.get(path, {})
+        new = list_dir(path)
+        self.listings[path] = new
+        for name in old.keys() | new.keys():
+            if old.get(name) != new.get(name):
+                self.pending.files.add(os.path.join(path, name))
+        if not os.path.isdir(path):
+            self.dirs.discard(path)
+            self.listings.pop(path, None)
+            self._remove_path(path)
+        self.pending.dirs.add(path)
+        self.debounce.start()
+
+    def poll(self):
+        for path, sig in list(self.polled.items()):
+            new_sig = stat_signature(path)
+            if new_sig == sig:
+                continue
+            self.polled[path] = new_sig
+            if path in self.dirs:
+                self.directory_changed(path)
+            else:
+                self.file_changed(path)
+
+    def flush(self):
+        changes, self.pending = self.pending, ChangeSet()
+        if changes:
+            self.changed.emit(changes)